@@ -1,35 +1,81 @@
+from typing import Any, Union
 from flask import Flask, jsonify
 from flask_cors import CORS
-import firebase_admin
-from firebase_admin import credentials, firestore
-
-# Initialize Flask app
-app = Flask(__name__)
-app.config.from_object('config.Config')  
-
-# Let Flask-CORS handle all CORS headers
-CORS(app, 
-     origins=["http://localhost:5173"],
-     supports_credentials=True,
-     allow_headers=["Content-Type", "Authorization"],
-     methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-     expose_headers=["Content-Type", "Authorization"])
-
-# Initialize Firebase Admin
-cred = credentials.Certificate("./firebase-adminsdk.json.local")
-firebase_admin.initialize_app(cred)
-db = firestore.client()
-
+from archive import init_archive
+from cache import QueryCache, TokenCache
+from encoding import FastJSONProvider
+from logger import init_logging
+from metrics import init_metrics
+from database.firestore import init_db
+from database.feed import AvailabilityFeed
+import database.reservations
+import database.spaces
 from routes.authenticate import authentication_bp
 from routes.reservations import reservations_bp
 from routes.edit_parking import parking_bp
+from routes.availability import availability_bp
+from routes.metrics import metrics_bp
+
+def create_app(config: Union[str, type] = 'config.Config', client: Any = None) -> Flask:
+    """
+    Creates the Flask app and the data-access layer it serves requests with.
+
+    Args:
+        config (Union[str, type], optional): Config object, or its import path. Defaults to 'config.Config'.
+        client (optional): Client to use instead of connecting to Firestore, e.g. an in-memory backend.
+
+    Returns:
+        Flask: The app
+
+    Usage:
+        flask --app app run
+        flask --app app archive
+    """
+    # Initialize Flask app
+    app = Flask(__name__)
+    app.config.from_object(config)
+    app.json = FastJSONProvider(app)
+    init_logging(app)
+
+    # Let Flask-CORS handle all CORS headers
+    CORS(app, 
+         origins=["http://localhost:5173"],
+         supports_credentials=True,
+         allow_headers=["Content-Type", "Authorization"],
+         methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+         expose_headers=["Content-Type", "Authorization"])
+
+    # Connect once per process; routes reach it through the app context
+    db = init_db(app, client)
+    app.extensions['availability_feed'] = AvailabilityFeed(db, queue_size=app.config['SSE_QUEUE_SIZE'])
+    app.extensions['token_cache'] = TokenCache(maxsize=app.config['TOKEN_CACHE_SIZE'], ttl=app.config['TOKEN_CACHE_TTL'])
+    if app.config['QUERY_CACHE_ENABLED']:
+        app.extensions['query_cache'] = QueryCache(maxsize=app.config['QUERY_CACHE_SIZE'], ttl=app.config['QUERY_CACHE_TTL'])
+    if app.config['METRICS_ENABLED']:
+        init_metrics(app)
+
+    # Load the space catalog and build the in-memory conflict index before serving requests
+    with app.app_context():
+        database.spaces.load_spaces(cell_size=app.config['SPACE_GRID_CELL_SIZE'])
+        database.reservations.load_index()
+    # Ended reservations move to the archive on a schedule, or through `flask archive`
+    init_archive(app)
+
+    # Register blueprints with a URL prefix
+    app.register_blueprint(authentication_bp, url_prefix='/api')
+    app.register_blueprint(reservations_bp, url_prefix='/api')
+    app.register_blueprint(parking_bp, url_prefix='/api')
+    app.register_blueprint(availability_bp, url_prefix='/api')
+    if app.config['METRICS_ENABLED']:
+        # Served at the root, where Prometheus scrapes by default
+        app.register_blueprint(metrics_bp)
+
+    app.after_request(after_request)
+    for code in (400, 401, 403, 404, 500):
+        app.register_error_handler(code, handle_error)
 
-# Register blueprints with a URL prefix
-app.register_blueprint(authentication_bp, url_prefix='/api')
-app.register_blueprint(reservations_bp, url_prefix='/api')
-app.register_blueprint(parking_bp, url_prefix='/api')
+    return app
 
-@app.after_request
 def after_request(response):
     # CORS should already handle this, but for some reason it sometimes doesn't
     if 'Access-Control-Allow-Origin' not in response.headers:
@@ -42,11 +88,6 @@ def after_request(response):
         response.headers['Access-Control-Allow-Credentials'] = 'true'
     return response
 
-@app.errorhandler(400)
-@app.errorhandler(401)
-@app.errorhandler(403)
-@app.errorhandler(404)
-@app.errorhandler(500)
 def handle_error(error):
     response = jsonify({'message': error.description})
     response.status_code = error.code if hasattr(error, 'code') else 500
@@ -54,4 +95,4 @@ def handle_error(error):
 
 # Run the app
 if __name__ == '__main__':
-    app.run()
\ No newline at end of file
+    create_app().run()
@@ -0,0 +1,97 @@
+# archive.py
+"""
+Compaction of the reservations collection: reservations that have ended are marked 'completed' and moved
+to the date-partitioned archive by database.reservations.archive_reservations(), in batched writes.
+
+It runs on a schedule in the API process when ARCHIVE_INTERVAL is set, or once from the command line:
+    flask --app app archive
+    flask --app app archive --before 2024-01-01T00:00:00Z --batch-size 20
+"""
+import atexit
+import threading
+from datetime import datetime
+from typing import Optional
+import click
+from flask import Flask, current_app
+from flask.cli import with_appcontext
+import database.reservations
+from database.filters import parse_timestamp
+from exceptions import ClientError
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class ArchiveWorker:
+    """
+    Background thread archiving the reservations that have ended, every `interval` seconds until stop().
+
+    Attributes:
+        interval (float): Seconds between runs.
+        batch_size (int): Reservations moved per commit.
+    """
+    def __init__(self, app: Flask, interval: float, batch_size: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._app = app
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='archive-worker', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stops the thread, letting a run in progress finish its current commit."""
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def run_once(self) -> int:
+        """Archives every reservation that has ended, returning how many were moved."""
+        with self._app.app_context():
+            return database.reservations.archive_reservations(batch_size=self.batch_size)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                # The next run retries whatever this one left behind
+                logger.exception("Archiving failed")
+
+
+@click.command('archive')
+@click.option('--before', help='Archive the reservations that ended by this ISO 8601 time, at the latest now. Defaults to now.')
+@click.option('--batch-size', type=int, help='Reservations moved per commit. Defaults to ARCHIVE_BATCH_SIZE.')
+@with_appcontext
+def archive_command(before: Optional[str], batch_size: Optional[int]) -> None:
+    """Move the reservations that have ended to the archive."""
+    try:
+        cutoff: Optional[datetime] = parse_timestamp(before) if before else None
+        archived = database.reservations.archive_reservations(
+            before=cutoff,
+            batch_size=batch_size or current_app.config['ARCHIVE_BATCH_SIZE'],
+        )
+    except ClientError as e:
+        raise click.UsageError(e.message)
+    click.echo(f'Archived {archived} reservations')
+
+
+def init_archive(app: Flask) -> Optional[ArchiveWorker]:
+    """
+    Adds the 'archive' command to the app's CLI, and starts the worker if ARCHIVE_INTERVAL is set.
+
+    Args:
+        app (Flask): The app
+
+    Returns:
+        Optional[ArchiveWorker]: The worker, also stored as app.extensions['archive_worker'], or None if it is disabled
+    """
+    app.cli.add_command(archive_command)
+    if app.config['ARCHIVE_INTERVAL'] <= 0:
+        return None
+    worker = ArchiveWorker(app, app.config['ARCHIVE_INTERVAL'], app.config['ARCHIVE_BATCH_SIZE'])
+    worker.start()
+    atexit.register(worker.stop)
+    app.extensions['archive_worker'] = worker
+    return worker
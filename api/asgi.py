@@ -0,0 +1,146 @@
+# asgi.py
+"""
+ASGI entry point serving the same Flask app, blueprints and routes as app.py.
+
+Its scope is streaming. Requests go through a2wsgi's WSGI adapter, which runs the synchronous views on
+a pool of ASGI_THREADS threads. That includes schedule() and get_reservations() and their blocking Firestore
+calls, since there are no async views and no Firestore AsyncClient. Request throughput is therefore that of
+a threaded WSGI server with as many threads. The only gain is the availability stream: it is served on the
+event loop, so open server-sent event connections hold no thread, however many clients follow availability.
+
+The stream view reaches the event loop through the WSGI environ: it carries the loop as 'reserveease.event_loop',
+and a view that stores an async iterable of str or bytes in 'reserveease.async_body' has it sent
+as the response body once the headers are out.
+
+Usage (from the api directory):
+    uvicorn --factory asgi:create_asgi_app
+"""
+import asyncio
+import contextvars
+from typing import Any, Callable, Dict, List, Tuple, Union
+from a2wsgi import WSGIMiddleware
+from a2wsgi.wsgi import Body, build_environ
+from flask import Flask
+from app import create_app
+
+# Served on the event loop; every other path goes through the WSGI adapter
+STREAM_PATH = '/api/availability/stream'
+
+
+class AsgiApp:
+    """
+    ASGI application serving a Flask app, with the views on a thread pool and the availability stream on the event loop.
+
+    Args:
+        app (Flask): The app to serve
+        threads (int): Size of the thread pool the views run on
+    """
+    def __init__(self, app: Flask, threads: int):
+        self.app = app
+        self.wsgi = WSGIMiddleware(app.wsgi_app, workers=threads)
+        self.executor = self.wsgi.executor
+
+    async def __call__(self, scope: Dict, receive: Callable, send: Callable) -> None:
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http' and scope['path'] == STREAM_PATH:
+            await self._stream(scope, receive, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    def close(self) -> None:
+        """Stops the availability listener and the thread pool."""
+        self.app.extensions['availability_feed'].close()
+        self.executor.shutdown(wait=False)
+
+    async def _lifespan(self, receive: Callable, send: Callable) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _stream(self, scope: Dict, receive: Callable, send: Callable) -> None:
+        """Runs the stream view on the pool, then sends the async body it leaves in the environ from the event loop."""
+        loop = asyncio.get_running_loop()
+        environ = build_environ(scope, Body(loop, receive))
+        environ['reserveease.event_loop'] = loop
+        context = contextvars.copy_context()
+        status, headers, chunks = await loop.run_in_executor(self.executor, context.run, self._call, environ)
+        await send({
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        })
+
+        async_body = environ.get('reserveease.async_body')
+        if async_body is not None:
+            await self._send_async(async_body, receive, send)
+            return
+        # Errors are answered from the view like any other response
+        for chunk in chunks:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    def _call(self, environ: Dict) -> Tuple[str, List[Tuple[str, str]], List[bytes]]:
+        """Runs the Flask app on a pool thread, returning the status, headers and body chunks."""
+        started = []
+
+        def start_response(status: str, headers: List[Tuple[str, str]], exc_info: Any = None) -> Callable:
+            started[:] = [status, headers]
+            return lambda data: None
+
+        iterable = self.app.wsgi_app(environ, start_response)
+        try:
+            chunks = [chunk for chunk in iterable if chunk]
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+        return started[0], started[1], chunks
+
+    async def _send_async(self, body: Any, receive: Callable, send: Callable) -> None:
+        """Sends a view's async body until it ends or the client disconnects."""
+        async def pump() -> None:
+            async for chunk in body:
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk.encode() if isinstance(chunk, str) else chunk,
+                    'more_body': True,
+                })
+            await send({'type': 'http.response.body', 'body': b''})
+
+        async def disconnected() -> None:
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(disconnected())]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await body.aclose()
+
+
+def create_asgi_app(config: Union[str, type] = 'config.Config', client: Any = None) -> AsgiApp:
+    """
+    Creates the app like create_app(), served over ASGI.
+
+    Args:
+        config (Union[str, type], optional): Config object, or its import path. Defaults to 'config.Config'.
+        client (optional): Client to use instead of connecting to Firestore, e.g. an in-memory backend.
+
+    Returns:
+        AsgiApp: The ASGI application
+
+    Usage:
+        uvicorn --factory asgi:create_asgi_app
+    """
+    app = create_app(config, client)
+    return AsgiApp(app, threads=app.config['ASGI_THREADS'])
@@ -0,0 +1,271 @@
+# benchmarks/bench_api.py
+"""
+Benchmarks the reservation API hot paths through the Flask test client against the in-memory backend.
+The query cache is off, so every query scenario runs its query; the '[cached]' scenarios measure cache hits.
+
+Usage (from the api directory):
+    python -m benchmarks.bench_api                                  # 1k, 100k and 1M stored reservations
+    python -m benchmarks.bench_api --sizes 1000 --save benchmarks/baseline.json
+    python -m benchmarks.bench_api --compare benchmarks/baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app
+from config import Config
+from database.memory import MemoryFirestore
+from typedef import parking_data
+
+SIZES = [1_000, 100_000, 1_000_000]
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+SPACES = list(parking_data)
+HOURS = range(8, 16)
+USERS = 1_000
+# The benchmark users, authenticated through pre-verified tokens
+LIST_USER, LIST_TOKEN, LIST_COUNT = 'bench_list_user', 'bench-list-token', 50
+DELETE_USER, DELETE_TOKEN = 'bench_delete_user', 'bench-delete-token'
+
+# Scenarios served by an app with the query cache on
+CACHED_SUFFIX = '[cached]'
+
+# (method, path, query string, JSON body, headers, expected status)
+Request = Tuple[str, str, Optional[Dict], Optional[Dict], Optional[Dict], int]
+
+
+class BenchConfig(Config):
+    QUERY_CACHE_ENABLED = False
+
+
+def auth(token: str) -> Dict[str, str]:
+    return {'Authorization': f'Bearer {token}'}
+
+
+class Dataset:
+    """
+    Deterministic reservations spread over every space, eight one-hour bookings per space and day,
+    half of the days in the past and half in the future.
+    """
+    def __init__(self, size: int, deletes: int):
+        self.size = size
+        self.days = -(-size // (len(SPACES) * len(HOURS)))
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.first_day = today - timedelta(days=self.days // 2)
+        self.middle_day = today + timedelta(days=1)
+        self.deletes = deletes
+
+    def slot(self, index: int) -> Tuple[str, datetime]:
+        day, rest = divmod(index, len(SPACES) * len(HOURS))
+        space, hour = divmod(rest, len(HOURS))
+        return SPACES[space], self.first_day + timedelta(days=day, hours=HOURS[hour])
+
+    def owner(self, index: int) -> str:
+        if index < LIST_COUNT:
+            return LIST_USER
+        if index < LIST_COUNT + self.deletes:
+            return DELETE_USER
+        return f'user{index % USERS}'
+
+    def documents(self) -> Iterator[Tuple[str, Dict]]:
+        for index in range(self.size):
+            space_id, start = self.slot(index)
+            yield f'r{index:07d}', {
+                'user_id': self.owner(index),
+                'space_id': space_id,
+                'start_timestamp': start,
+                'end_timestamp': start + timedelta(hours=1),
+                'created_at': start - timedelta(days=1),
+                'status': 'active',
+            }
+
+
+def scenarios(dataset: Dataset) -> Dict[str, Tuple[bool, Callable[[int], Request]]]:
+    """
+    Builds the benchmarked requests by name.
+
+    Returns:
+        Dict[str, Tuple[bool, Callable[[int], Request]]]: Whether the response grows with the dataset, and a builder of the i-th request
+    """
+    day = dataset.middle_day
+    start = day + timedelta(hours=9)
+    end = start + timedelta(hours=1)
+    window = {'start_timestamp': f'>={day.isoformat()}', 'end_timestamp': f'<={(day + timedelta(days=1)).isoformat()}'}
+    # Bookings far past the seeded days, so every one of them succeeds
+    far_day = day + timedelta(days=dataset.days + 365)
+
+    def add(i: int) -> Request:
+        # Bookings must end on the day they start, so the last slot of each day is skipped
+        space, slot = divmod(i, 24 * 4 - 1)
+        booking_start = far_day + timedelta(days=space // len(SPACES), minutes=15 * slot)
+        return ('POST', '/api/reservations/add', None, {
+            'space_id': SPACES[space % len(SPACES)],
+            'start_timestamp': booking_start.isoformat(),
+            'end_timestamp': (booking_start + timedelta(minutes=15)).isoformat(),
+        }, auth(LIST_TOKEN), 201)
+
+    def allocate(i: int) -> Request:
+        # A different time for every request, a year after the days of the add scenario
+        days, slot = divmod(i, 24 * 4 - 1)
+        booking_start = far_day + timedelta(days=365 + days, minutes=15 * slot)
+        return ('POST', '/api/reservations/allocate', None, {
+            'start_timestamp': booking_start.isoformat(),
+            'end_timestamp': (booking_start + timedelta(minutes=15)).isoformat(),
+            'x': 0.5,
+            'y': 0.5,
+        }, auth(LIST_TOKEN), 201)
+
+    def get(query: Dict) -> Callable[[int], Request]:
+        return lambda i: ('GET', '/api/reservations/get', query, None, None, 200)
+
+    return {
+        'add': (False, add),
+        'allocate': (False, allocate),
+        'get': (True, get({})),
+        'get[limit]': (True, get({'limit': 100, 'order_by': 'start_timestamp'})),
+        'get[reservation_id]': (False, get({'reservation_id': 'r0000060'})),
+        'get[space_id]': (True, get({'space_id': 'A1'})),
+        'get[start_timestamp]': (False, get({'start_timestamp': start.isoformat()})),
+        'get[end_timestamp]': (False, get({'end_timestamp': end.isoformat()})),
+        'get[start_timestamp,end_timestamp]': (False, get(window)),
+        'get[space_id,start_timestamp]': (False, get({'space_id': 'A1', 'start_timestamp': start.isoformat()})),
+        'get[space_id,end_timestamp]': (False, get({'space_id': 'A1', 'end_timestamp': end.isoformat()})),
+        'get[space_id,start_timestamp,end_timestamp]': (False, get({'space_id': 'A1', **window})),
+        'get[cached]': (True, get({})),
+        'get[space_id,start_timestamp,end_timestamp][cached]': (False, get({'space_id': 'A1', **window})),
+        'export': (True, lambda i: ('GET', '/api/reservations/export', None, None, None, 200)),
+        'user': (False, lambda i: ('GET', '/api/reservations/user', None, None, auth(LIST_TOKEN), 200)),
+        'user[history]': (False, lambda i: ('GET', '/api/reservations/user', {'history': 'true'}, None, auth(LIST_TOKEN), 200)),
+        'delete': (False, lambda i: ('DELETE', f'/api/reservations/delete/r{LIST_COUNT + i:07d}', None, None, auth(DELETE_TOKEN), 200)),
+        'parking': (False, lambda i: ('GET', '/api/parking', None, None, None, 200)),
+    }
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(sizes: List[int], requests: int, only: Optional[List[str]] = None, out=sys.stdout) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    Runs every scenario at every dataset size.
+
+    Args:
+        sizes (List[int]): Numbers of stored reservations
+        requests (int): Requests per scenario; scenarios whose response grows with the dataset send fewer at large sizes
+        only (List[str], optional): Names of the scenarios to run. Defaults to all of them.
+
+    Returns:
+        Dict[str, Dict[str, Dict[str, float]]]: p50_ms, p99_ms and rps by scenario, by size
+    """
+    results = {}
+    for size in sizes:
+        dataset = Dataset(size, deletes=requests)
+        client = MemoryFirestore()
+        seed_started = time.perf_counter()
+        client.load('reservations', dataset.documents())
+        # Both apps share the data; the second one answers repeated queries from its cache
+        test_clients = {}
+        for cached, config in ((False, BenchConfig), (True, Config)):
+            app = create_app(config, client=client)
+            expires = time.time() + 24 * 3600
+            app.extensions['token_cache'].put(LIST_TOKEN, {'uid': LIST_USER, 'exp': expires})
+            app.extensions['token_cache'].put(DELETE_TOKEN, {'uid': DELETE_USER, 'exp': expires})
+            test_clients[cached] = app.test_client()
+        print(f'\n{size:,} reservations (seeded in {time.perf_counter() - seed_started:.1f}s)', file=out)
+        print(f'{"scenario":<56}{"requests":>9}{"p50 ms":>10}{"p99 ms":>10}{"req/s":>10}', file=out)
+
+        results[str(size)] = {}
+        for name, (grows, build) in scenarios(dataset).items():
+            if only and name not in only:
+                continue
+            count = max(3, requests * 1_000 // size) if grows else requests
+            count = min(count, requests)
+            test_client = test_clients[name.endswith(CACHED_SUFFIX)]
+            latencies = []
+            started = time.perf_counter()
+            for i in range(count):
+                method, path, query, body, headers, expected = build(i)
+                request_started = time.perf_counter()
+                response = test_client.open(path, method=method, query_string=query, json=body, headers=headers)
+                # Streamed responses are only produced while their body is read
+                response.get_data()
+                latencies.append(time.perf_counter() - request_started)
+                if response.status_code != expected:
+                    raise RuntimeError(f'{name}: expected {expected}, got {response.status_code}: {response.get_data(as_text=True)[:200]}')
+            elapsed = time.perf_counter() - started
+
+            stats = {
+                'requests': count,
+                'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+                'rps': round(count / elapsed, 1),
+            }
+            results[str(size)][name] = stats
+            print(f'{name:<56}{count:>9}{stats["p50_ms"]:>10.3f}{stats["p99_ms"]:>10.3f}{stats["rps"]:>10.1f}', file=out)
+    return results
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float, out=sys.stdout) -> List[str]:
+    """
+    Lists the scenarios whose p50 latency regressed past the tolerance, and those the baseline does not cover,
+    so a new scenario cannot go unguarded until the baseline is regenerated.
+
+    Args:
+        results (Dict): Results of run()
+        baseline (Dict): Saved baseline
+        tolerance (float): Allowed slowdown, e.g. 0.25 for 25%
+
+    Returns:
+        List[str]: Descriptions of the regressions and missing scenarios
+    """
+    regressions = []
+    for size, named in results.items():
+        for name, stats in named.items():
+            before = baseline.get('results', {}).get(size, {}).get(name)
+            if not before:
+                regressions.append(f'{size} {name}: not in the baseline')
+                continue
+            change = stats['p50_ms'] / before['p50_ms'] - 1 if before['p50_ms'] else 0
+            if change > tolerance:
+                regressions.append(f'{size} {name}: p50 {before["p50_ms"]:.3f}ms -> {stats["p50_ms"]:.3f}ms (+{change:.0%})')
+    for regression in regressions:
+        print(f'REGRESSION {regression}', file=out)
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='numbers of stored reservations')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--only', nargs='+', help='scenarios to run')
+    parser.add_argument('--save', metavar='PATH', nargs='?', const=BASELINE, help='write the results as a baseline')
+    parser.add_argument('--compare', metavar='PATH', nargs='?', const=BASELINE, help='fail if p50 regressed against a baseline, or it lacks a scenario')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p50 slowdown when comparing')
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.requests, args.only)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'requests': args.requests,
+                'results': results,
+            }, f, indent=2)
+            f.write('\n')
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(results, json.load(f), args.tolerance):
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
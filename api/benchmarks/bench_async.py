@@ -0,0 +1,235 @@
+# benchmarks/bench_async.py
+"""
+Compares the WSGI app with the ASGI entry point under concurrent load, against the in-memory backend
+with a simulated Firestore round trip on every read and commit.
+
+The sync mode stands for a threaded WSGI server: every request and every open availability stream
+holds one of its threads. The async mode runs the same synchronous views on a pool of the same size,
+so with no streams open both modes should reach the same throughput at every number of clients; that is
+what the default run measures. Only with --streams above 0 do the modes differ: open streams wait on the
+event loop in the async mode, and take threads away from the requests in the sync mode.
+
+Usage (from the api directory):
+    python -m benchmarks.bench_async
+    python -m benchmarks.bench_async --threads 8 --concurrency 8 64 --streams 0 16 --latency 0.005
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import urlencode
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app
+from asgi import AsgiApp
+from benchmarks.bench_api import DELETE_TOKEN, DELETE_USER, LIST_TOKEN, LIST_USER, BenchConfig, Dataset, auth, percentile, scenarios
+from database.memory import MemoryFirestore
+
+SCENARIOS = ['get[space_id,start_timestamp,end_timestamp]', 'user', 'add']
+# Concurrent bookings come from different users; one user's bookings all write their index document
+BOOKING_SCENARIOS = {'add'}
+BOOKERS = 256
+
+
+def build_app(size: int, requests: int, latency: float):
+    dataset = Dataset(size, deletes=requests)
+    client = MemoryFirestore(latency=latency)
+    client.load('reservations', dataset.documents())
+    app = create_app(BenchConfig, client=client)
+    # Streams wake up often enough to notice the end of a run
+    app.config['SSE_KEEPALIVE'] = 0.05
+    expires = time.time() + 24 * 3600
+    app.extensions['token_cache'].put(LIST_TOKEN, {'uid': LIST_USER, 'exp': expires})
+    app.extensions['token_cache'].put(DELETE_TOKEN, {'uid': DELETE_USER, 'exp': expires})
+    for booker in range(BOOKERS):
+        app.extensions['token_cache'].put(f'bench-booker-token-{booker}', {'uid': f'bench_booker_{booker}', 'exp': expires})
+    return dataset, app
+
+
+def as_bookers(build):
+    """Sends the i-th request of a scenario as one of BOOKERS users instead of its own."""
+    def build_as_booker(i: int):
+        method, path, query, body, headers, expected = build(i)
+        return method, path, query, body, auth(f'bench-booker-token-{i % BOOKERS}'), expected
+    return build_as_booker
+
+
+def run_sync(app, build, count: int, concurrency: int, threads: int, streams: int) -> Optional[List[float]]:
+    """Runs the requests from concurrent clients on a pool standing in for a threaded WSGI server."""
+    if streams >= threads:
+        return None
+    local = threading.local()
+    stop = threading.Event()
+
+    def stream() -> None:
+        response = app.test_client().get('/api/availability/stream')
+        for _ in response.response:
+            if stop.is_set():
+                break
+        response.close()
+
+    def request(i: int) -> None:
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        method, path, query, body, headers, expected = build(i)
+        response = local.client.open(path, method=method, query_string=query, json=body, headers=headers)
+        response.get_data()
+        if response.status_code != expected:
+            raise RuntimeError(f'expected {expected}, got {response.status_code}')
+
+    def client(i: int) -> float:
+        # Latency includes the wait for a free thread
+        started = time.perf_counter()
+        server.submit(request, i).result()
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=threads) as server:
+        for _ in range(streams):
+            server.submit(stream)
+        # Clients beyond the free threads wait in the server's queue, like connections in its backlog
+        with ThreadPoolExecutor(max_workers=concurrency) as clients:
+            latencies = list(clients.map(client, range(count)))
+        stop.set()
+    return latencies
+
+
+async def asgi_call(app: AsgiApp, method: str, path: str, query: Optional[Dict], body: Optional[Dict], headers: Optional[Dict]) -> int:
+    payload = json.dumps(body).encode() if body is not None else b''
+    raw_headers = [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    if body is not None:
+        raw_headers += [(b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode())]
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': urlencode(query or {}).encode(),
+        'headers': raw_headers, 'http_version': '1.1', 'scheme': 'http', 'server': ('bench', 80),
+    }
+    status = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': payload}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await app(scope, receive, send)
+    return status[0]
+
+
+def run_async(app, build, count: int, concurrency: int, threads: int, streams: int) -> List[float]:
+    """Runs the requests from concurrent clients through the ASGI entry point."""
+    asgi_app = AsgiApp(app, threads)
+
+    async def open_stream(stop: asyncio.Event) -> None:
+        requested = []
+
+        async def receive():
+            if not requested:
+                requested.append(True)
+                return {'type': 'http.request', 'body': b''}
+            await stop.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            pass
+
+        scope = {'type': 'http', 'method': 'GET', 'path': '/api/availability/stream', 'query_string': b'', 'headers': [], 'http_version': '1.1'}
+        await asgi_app(scope, receive, send)
+
+    async def main() -> List[float]:
+        stop = asyncio.Event()
+        open_streams = [asyncio.ensure_future(open_stream(stop)) for _ in range(streams)]
+        pending = iter(range(count))
+        latencies = []
+
+        async def client() -> None:
+            for i in pending:
+                method, path, query, body, headers, expected = build(i)
+                started = time.perf_counter()
+                status = await asgi_call(asgi_app, method, path, query, body, headers)
+                if status != expected:
+                    raise RuntimeError(f'expected {expected}, got {status}')
+                latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        stop.set()
+        await asyncio.gather(*open_streams)
+        return latencies
+
+    try:
+        return asyncio.run(main())
+    finally:
+        asgi_app.executor.shutdown()
+
+
+def run(size: int, requests: int, concurrency: List[int], threads: int, streams: List[int], latency: float,
+        only: Optional[List[str]] = None, out=sys.stdout) -> Dict[str, Dict[str, Optional[Dict[str, float]]]]:
+    """
+    Runs every scenario in both modes, at each number of clients and of open availability streams.
+
+    Args:
+        size (int): Number of stored reservations
+        requests (int): Requests per scenario and mode
+        concurrency (List[int]): Numbers of clients sending requests at the same time
+        threads (int): Threads of the WSGI server, and of the ASGI entry point's pool
+        streams (List[int]): Numbers of availability streams held open during the requests
+        latency (float): Simulated Firestore round trip, in seconds
+        only (List[str], optional): Names of the scenarios to run. Defaults to SCENARIOS.
+
+    Returns:
+        Dict[str, Dict[str, Optional[Dict[str, float]]]]: p50_ms, p99_ms and rps by mode, by
+            '<scenario> clients=<n> streams=<n>'; None where every thread of the sync mode would be held by a stream
+    """
+    print(f'{size:,} reservations, {threads} threads, {latency * 1000:g}ms round trips', file=out)
+    print(f'{"scenario":<72}{"mode":>6}{"p50 ms":>10}{"p99 ms":>10}{"req/s":>10}', file=out)
+    results = {}
+    for name in only or SCENARIOS:
+        for clients in concurrency:
+            for open_streams in streams:
+                key = f'{name} clients={clients} streams={open_streams}'
+                results[key] = {}
+                for mode, runner in (('sync', run_sync), ('async', run_async)):
+                    # Every run books into its own fresh app, so the writes of one cannot conflict with the next
+                    dataset, app = build_app(size, requests, latency)
+                    build = scenarios(dataset)[name][1]
+                    if name in BOOKING_SCENARIOS:
+                        build = as_bookers(build)
+                    started = time.perf_counter()
+                    latencies = runner(app, build, requests, clients, threads, open_streams)
+                    elapsed = time.perf_counter() - started
+                    app.extensions['availability_feed'].close()
+
+                    if latencies is None:
+                        results[key][mode] = None
+                        print(f'{key:<72}{mode:>6}{"every thread holds a stream":>30}', file=out)
+                        continue
+                    stats = {
+                        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+                        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+                        'rps': round(len(latencies) / elapsed, 1),
+                    }
+                    results[key][mode] = stats
+                    print(f'{key:<72}{mode:>6}{stats["p50_ms"]:>10.3f}{stats["p99_ms"]:>10.3f}{stats["rps"]:>10.1f}', file=out)
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=10_000, help='number of stored reservations')
+    parser.add_argument('--requests', type=int, default=400, help='requests per scenario and mode')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[16, 64], help='clients sending requests at the same time')
+    parser.add_argument('--threads', type=int, default=16, help='server threads in both modes')
+    parser.add_argument('--streams', type=int, nargs='+', default=[0], help='availability streams held open; above 0 measures streaming alone')
+    parser.add_argument('--latency', type=float, default=0.002, help='simulated Firestore round trip in seconds')
+    parser.add_argument('--only', nargs='+', help='scenarios to run')
+    args = parser.parse_args(argv)
+
+    run(args.size, args.requests, args.concurrency, args.threads, args.streams, args.latency, args.only)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+# benchmarks/bench_logging.py
+"""
+Measures what the debug logging of the public query path costs per request. A filtered
+/reservations/get logs two debug lines, where it used to print() on the request thread.
+
+Modes:
+    sync      every debug line formatted and written on the request thread, as the print() calls were
+    queue     every debug line handed to the queue and written by the background thread
+    sampled   debug lines of LOG_DEBUG_SAMPLE_RATE of the requests, through the queue
+    disabled  LOG_LEVEL above DEBUG, the production default, so no record is built
+
+The query cache is off so every request runs the filters, and the lines go to a temporary file.
+Clients send requests from several threads, so the synchronous writer also shows its lock contention.
+
+Usage (from the api directory):
+    python -m benchmarks.bench_logging
+    python -m benchmarks.bench_logging --requests 5000 --concurrency 8
+"""
+import argparse
+import contextlib
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app
+from benchmarks.bench_api import BenchConfig, Dataset, percentile, scenarios
+from config import Config
+from database.memory import MemoryFirestore
+from logger import ROOT_LOGGER, JSONFormatter
+
+MODES = ['sync', 'queue', 'sampled', 'disabled']
+SCENARIO = 'get[space_id,start_timestamp,end_timestamp]'
+
+
+def run_mode(app, mode: str, build, count: int, concurrency: int, sample_rate: float) -> Dict[str, float]:
+    """Sends the requests with the logging of one mode, then waits for every queued line to be written."""
+    logger = logging.getLogger(ROOT_LOGGER)
+    queue_handler = app.extensions['log_handler']
+    saved = logger.level, logger.handlers[:], queue_handler.sampler.rate
+    local = threading.local()
+
+    def request(i: int) -> float:
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        method, path, query, body, headers, expected = build(i)
+        started = time.perf_counter()
+        response = local.client.open(path, method=method, query_string=query, json=body, headers=headers)
+        response.get_data()
+        elapsed = time.perf_counter() - started
+        if response.status_code != expected:
+            raise RuntimeError(f'expected {expected}, got {response.status_code}')
+        return elapsed
+
+    with tempfile.TemporaryFile('w+') as sink, contextlib.redirect_stderr(sink):
+        logger.setLevel(logging.INFO if mode == 'disabled' else logging.DEBUG)
+        queue_handler.sampler.rate = sample_rate if mode == 'sampled' else 1.0
+        if mode == 'sync':
+            sync_handler = logging.StreamHandler(sink)
+            sync_handler.setFormatter(JSONFormatter())
+            logger.handlers = [sync_handler]
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as clients:
+                latencies = list(clients.map(request, range(count)))
+            elapsed = time.perf_counter() - started
+            queue_handler.queue.join()
+        finally:
+            logger.setLevel(saved[0])
+            logger.handlers = saved[1]
+            queue_handler.sampler.rate = saved[2]
+        sink.flush()
+        sink.seek(0)
+        lines = sum(1 for _ in sink)
+
+    return {
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'rps': round(count / elapsed, 1),
+        'lines': lines,
+    }
+
+
+def run(size: int, requests: int, concurrency: int, sample_rate: float = Config.LOG_DEBUG_SAMPLE_RATE,
+        only: Optional[List[str]] = None, out=sys.stdout) -> Dict[str, Dict[str, float]]:
+    """
+    Runs the filtered query in every logging mode.
+
+    Args:
+        size (int): Number of stored reservations
+        requests (int): Requests per mode
+        concurrency (int): Threads sending requests at the same time
+        sample_rate (float, optional): Debug sample rate of the 'sampled' mode. Defaults to the config's.
+        only (List[str], optional): Modes to run. Defaults to MODES.
+
+    Returns:
+        Dict[str, Dict[str, float]]: p50_ms, p99_ms, rps and the number of lines written, by mode
+    """
+    dataset = Dataset(size, deletes=0)
+    client = MemoryFirestore()
+    client.load('reservations', dataset.documents())
+    app = create_app(BenchConfig, client=client)
+    build = scenarios(dataset)[SCENARIO][1]
+
+    print(f'{size:,} reservations, {requests} requests per mode, {concurrency} threads', file=out)
+    print(f'{"mode":<10}{"p50 ms":>10}{"p99 ms":>10}{"req/s":>10}{"lines":>8}', file=out)
+    results = {}
+    for mode in only or MODES:
+        stats = results[mode] = run_mode(app, mode, build, requests, concurrency, sample_rate)
+        print(f'{mode:<10}{stats["p50_ms"]:>10.3f}{stats["p99_ms"]:>10.3f}{stats["rps"]:>10.1f}{stats["lines"]:>8}', file=out)
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=10_000, help='number of stored reservations')
+    parser.add_argument('--requests', type=int, default=2_000, help='requests per mode')
+    parser.add_argument('--concurrency', type=int, default=4, help='threads sending requests at the same time')
+    parser.add_argument('--sample-rate', type=float, default=Config.LOG_DEBUG_SAMPLE_RATE, help='debug sample rate of the sampled mode')
+    parser.add_argument('--only', nargs='+', choices=MODES, help='modes to run')
+    args = parser.parse_args(argv)
+
+    run(args.size, args.requests, args.concurrency, args.sample_rate, args.only)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+# benchmarks/bench_serialization.py
+"""
+Compares the reservation serialization paths on a list response.
+
+Usage (from the api directory):
+    python -m benchmarks.bench_serialization
+    python -m benchmarks.bench_serialization --rows 10000 --repeat 20
+"""
+import argparse
+import os
+import sys
+import timeit
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+import encoding
+from encoding import FastJSONProvider
+from typedef import Reservation
+
+
+@dataclass
+class LegacyReservation:
+    """Reservation as serialized before the hand-written encoder, kept as the point of comparison."""
+    reservation_id: str
+    user_id: str
+    space_id: str
+    start_timestamp: datetime
+    end_timestamp: datetime
+
+    def to_dict(self):
+        data = asdict(self)
+        data["start_timestamp"] = self.start_timestamp.isoformat() if self.start_timestamp else None
+        data["end_timestamp"] = self.end_timestamp.isoformat() if self.end_timestamp else None
+        return data
+
+    @staticmethod
+    def jsonify_list(reservations, restrict_user_id=False):
+        result = []
+        for reservation in reservations:
+            reservation_dict = reservation.to_dict()
+            if restrict_user_id:
+                reservation_dict.pop("user_id", None)
+            result.append(reservation_dict)
+        return result
+
+
+def rows(cls, count: int) -> list:
+    start = datetime(2099, 1, 1, tzinfo=timezone.utc)
+    return [
+        cls(f'r{i:07d}', f'user{i % 1000}', f'A{i % 13 + 1}', start + timedelta(minutes=15 * i), start + timedelta(minutes=15 * i + 60))
+        for i in range(count)
+    ]
+
+
+def paths(count: int) -> Dict[str, Callable[[], object]]:
+    """Serialization paths by name: building the response list, then encoding it as the app would."""
+    app = Flask(__name__)
+    legacy, current = rows(LegacyReservation, count), rows(Reservation, count)
+    default, fast = DefaultJSONProvider(app), FastJSONProvider(app)
+    legacy_list = LegacyReservation.jsonify_list(legacy, restrict_user_id=True)
+    current_list = Reservation.jsonify_list(current, restrict_user_id=True)
+
+    benchmarks = {
+        'to_dict: asdict + pop': lambda: LegacyReservation.jsonify_list(legacy, restrict_user_id=True),
+        'to_dict: hand-written': lambda: Reservation.jsonify_list(current, restrict_user_id=True),
+        'dumps: json': lambda: default.dumps(legacy_list, separators=(',', ':')),
+        'end to end: asdict + json': lambda: default.dumps(LegacyReservation.jsonify_list(legacy, restrict_user_id=True), separators=(',', ':')),
+        'end to end: hand-written + json': lambda: default.dumps(Reservation.jsonify_list(current, restrict_user_id=True), separators=(',', ':')),
+    }
+    if encoding.orjson is not None:
+        benchmarks['dumps: orjson'] = lambda: fast.dumps(current_list, separators=(',', ':'))
+        benchmarks['end to end: hand-written + orjson'] = lambda: fast.dumps(Reservation.jsonify_list(current, restrict_user_id=True), separators=(',', ':'))
+    return benchmarks
+
+
+def run(count: int, repeat: int, out=sys.stdout) -> Dict[str, float]:
+    """
+    Times every serialization path.
+
+    Args:
+        count (int): Reservations per response
+        repeat (int): Timed runs per path; the best one is reported
+
+    Returns:
+        Dict[str, float]: Best time in milliseconds by path
+    """
+    results = {}
+    print(f'{count:,} reservations per response, best of {repeat}' + ('' if encoding.orjson else ' (orjson is not installed)'), file=out)
+    print(f'{"path":<38}{"ms":>10}', file=out)
+    for name, benchmark in paths(count).items():
+        results[name] = min(timeit.repeat(benchmark, number=1, repeat=repeat)) * 1000
+        print(f'{name:<38}{results[name]:>10.2f}', file=out)
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000, help='reservations per response')
+    parser.add_argument('--repeat', type=int, default=20, help='timed runs per path')
+    args = parser.parse_args(argv)
+    run(args.rows, args.repeat)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,199 @@
+# cache.py
+import hashlib
+import time
+from datetime import date
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, Optional
+from cachetools import TLRUCache, TTLCache
+
+
+class TokenCache:
+    """
+    Bounded LRU cache of verified Firebase ID tokens, so repeat requests skip signature verification.
+    Entries are keyed by a SHA-256 hash of the token and expire after `ttl` seconds or at the token's
+    `exp` claim, whichever comes first.
+
+    Attributes:
+        ttl (float): Longest time in seconds a verified token is trusted without re-verifying.
+        hits (int): Number of lookups answered from the cache.
+        misses (int): Number of lookups that needed verification.
+    """
+    def __init__(self, maxsize: int = 4096, ttl: float = 300, timer: Callable[[], float] = time.time):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._cache = TLRUCache(maxsize, ttu=self._expires_at, timer=timer)
+        self._lock = Lock()
+
+    def _expires_at(self, key: bytes, decoded_token: Dict, now: float) -> float:
+        return min(now + self.ttl, decoded_token.get('exp', now))
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[Dict]:
+        """
+        Looks up a verified token.
+
+        Args:
+            token (str): The raw ID token
+
+        Returns:
+            Optional[Dict]: A copy of the decoded token, or None if it is not cached or has expired
+        """
+        with self._lock:
+            decoded_token = self._cache.get(self._key(token))
+            if decoded_token is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(decoded_token)
+
+    def put(self, token: str, decoded_token: Dict) -> None:
+        """
+        Stores a verified token. Tokens that have already expired are not stored.
+
+        Args:
+            token (str): The raw ID token
+            decoded_token (Dict): Claims returned by verification
+        """
+        with self._lock:
+            self._cache[self._key(token)] = dict(decoded_token)
+
+    def verify(self, token: str, verify_id_token: Callable[[str], Dict]) -> Dict:
+        """
+        Returns the decoded token from the cache, or verifies and caches it.
+
+        Args:
+            token (str): The raw ID token
+            verify_id_token (Callable[[str], Dict]): Verifies a token and returns its claims, raising if invalid
+
+        Returns:
+            Dict: The decoded token
+        """
+        decoded_token = self.get(token)
+        if decoded_token is None:
+            decoded_token = verify_id_token(token)
+            self.put(token, decoded_token)
+        return decoded_token
+
+    def clear(self) -> None:
+        """Drops every cached token. The counters keep counting, as /metrics exports them as Prometheus counters."""
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the hit and miss counters and the current number of entries."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._cache)}
+
+
+class QueryCache:
+    """
+    Bounded LRU cache of query results. Each entry records the space and the range of days its
+    query can match, so a write only evicts the entries it could have changed.
+    Entries also expire after `ttl` seconds, which bounds how stale a result can get from writes
+    made by other processes.
+
+    Attributes:
+        hits (int): Number of lookups answered from the cache.
+        misses (int): Number of lookups that had to query the database.
+        invalidations (int): Number of entries evicted by writes.
+        generation (int): Number of invalidations so far. Read it before running a query and pass
+            it to put(), so a result that a concurrent write may have made stale is not stored.
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float = 30, timer: Callable[[], float] = time.monotonic):
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.generation = 0
+        self._cache = TTLCache(maxsize, ttl, timer=timer)
+        self._lock = Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Looks up the result of a query.
+
+        Args:
+            key (Hashable): Normalized query
+
+        Returns:
+            Optional[Any]: The cached result, or None if it is not cached or has expired
+        """
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[-1]
+
+    def put(
+        self,
+        key: Hashable,
+        value: Any,
+        space_id: Optional[str] = None,
+        first_day: Optional[date] = None,
+        last_day: Optional[date] = None,
+        generation: Optional[int] = None
+    ) -> None:
+        """
+        Stores the result of a query, evicting the least recently used entry when full.
+
+        Args:
+            key (Hashable): Normalized query
+            value (Any): Result of the query, which callers must not modify
+            space_id (str, optional): Space the query is limited to. Defaults to every space.
+            first_day (date, optional): Earliest day the query can match. Defaults to no limit.
+            last_day (date, optional): Latest day the query can match. Defaults to no limit.
+            generation (int, optional): The generation read before running the query. The result is
+                dropped if there has been an invalidation since.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._cache[key] = (space_id, first_day, last_day, value)
+
+    def invalidate(self, space_id: str, day: date) -> int:
+        """
+        Evicts every entry whose query can match a reservation of a space on a day.
+        Scans the entries, which is cheap at the sizes the cache is bounded to.
+
+        Args:
+            space_id (str): Space of the written reservation
+            day (date): Day of the written reservation
+
+        Returns:
+            int: Number of evicted entries
+        """
+        with self._lock:
+            stale = [
+                key for key, (entry_space_id, first_day, last_day, _) in self._cache.items()
+                if entry_space_id in (None, space_id)
+                and (first_day is None or first_day <= day)
+                and (last_day is None or day <= last_day)
+            ]
+            for key in stale:
+                del self._cache[key]
+            self.invalidations += len(stale)
+            self.generation += 1
+            return len(stale)
+
+    def clear(self) -> None:
+        """Drops every cached result. The counters keep counting, as /metrics exports them as Prometheus counters."""
+        with self._lock:
+            self._cache.clear()
+            self.generation += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the hit, miss and invalidation counters, the hit rate and the current number of entries."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'size': len(self._cache),
+            }
@@ -0,0 +1,40 @@
+# conditional.py
+"""
+Conditional GET support: JSON responses carry a strong ETag, and requests whose If-None-Match
+matches it get a 304 with no body.
+"""
+import hashlib
+from typing import Any, Tuple
+from flask import Response, current_app, request
+
+
+def encode_json(payload: Any) -> Tuple[bytes, str]:
+    """
+    Serializes a payload the way the app's JSON responses do, and derives its ETag.
+
+    Args:
+        payload (Any): JSON data
+
+    Returns:
+        Tuple[bytes, str]: The body, and a strong ETag computed from it
+    """
+    body = current_app.json.response(payload).get_data()
+    return body, hashlib.sha256(body).hexdigest()[:32]
+
+
+def json_response(body: bytes, etag: str, status: int = 200) -> Response:
+    """
+    Builds a JSON response from a pre-serialized body, answering 304 Not Modified with no body
+    when the request's If-None-Match matches the ETag.
+
+    Args:
+        body (bytes): Serialized JSON
+        etag (str): Strong ETag of the body, without quotes
+        status (int, optional): Status code of a full response. Defaults to 200.
+
+    Returns:
+        Response: The full or 304 response
+    """
+    response = current_app.response_class(body, status=status, mimetype=current_app.json.mimetype)
+    response.set_etag(etag)
+    return response.make_conditional(request)
@@ -1,5 +1,39 @@
 # config.py
+import os
+
 class Config:
     DEBUG = True
     CORS_HEADERS = 'Content-Type'
-    TESTING = True
\ No newline at end of file
+    TESTING = True
+    # Verified ID tokens are cached for at most TOKEN_CACHE_TTL seconds, and never past their expiry
+    TOKEN_CACHE_SIZE = 4096
+    TOKEN_CACHE_TTL = 300
+    # Checking revocation needs a lookup per request, so it bypasses the token cache
+    TOKEN_CHECK_REVOKED = False
+    # Results of public reservation queries, evicted by writes to their space and day and after QUERY_CACHE_TTL seconds
+    QUERY_CACHE_ENABLED = os.getenv('QUERY_CACHE_ENABLED', 'true').lower() == 'true'
+    QUERY_CACHE_SIZE = 1024
+    QUERY_CACHE_TTL = 30
+    # Server-sent availability events: seconds between keep-alive comments, and deltas buffered per slow client
+    SSE_KEEPALIVE = 15
+    SSE_QUEUE_SIZE = 256
+    # Side of the cells of the spatial index over the space coordinates, near the typical spacing of the spaces
+    SPACE_GRID_CELL_SIZE = float(os.getenv('SPACE_GRID_CELL_SIZE', '0.05'))
+    # Threads the ASGI entry point runs every view on, like a threaded WSGI server; only availability streams wait on its event loop
+    ASGI_THREADS = int(os.getenv('ASGI_THREADS', '32'))
+    # Per-request stage timings and Firestore document counts, sent as a Server-Timing header and totalled at /metrics
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'true').lower() == 'true'
+    # Structured logs on stderr, written by a background thread. DEBUG records are kept for a sample of the requests
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '0.01'))
+    LOG_QUEUE_SIZE = 10_000
+    # Seconds between runs of the worker moving ended reservations to the archive, 0 to only archive from the CLI
+    ARCHIVE_INTERVAL = int(os.getenv('ARCHIVE_INTERVAL', '0'))
+    ARCHIVE_BATCH_SIZE = 50
+    # Firestore connection, opened once per process. 'memory' runs on an in-process backend with no network
+    FIRESTORE_BACKEND = os.getenv('FIRESTORE_BACKEND', 'firestore')
+    FIREBASE_CREDENTIALS = os.getenv('FIREBASE_CREDENTIALS', './firebase-adminsdk.json.local')
+    FIRESTORE_PROJECT = os.getenv('FIRESTORE_PROJECT')
+    FIRESTORE_DATABASE = os.getenv('FIRESTORE_DATABASE')
+    FIRESTORE_API_ENDPOINT = os.getenv('FIRESTORE_API_ENDPOINT')
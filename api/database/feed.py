@@ -0,0 +1,195 @@
+# database/feed.py
+import asyncio
+import itertools
+import queue
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from google.cloud.firestore_v1.watch import ChangeType
+from database.occupancy import to_slots
+
+
+class Subscription:
+    """
+    Queue of availability deltas for one client of an AvailabilityFeed.
+
+    Attributes:
+        space_ids (Set[str]): Spaces the client follows, or None for every space.
+        overflowed (bool): Set when the client fell so far behind that deltas were dropped.
+            It must then refetch the availability and subscribe again.
+    """
+    def __init__(self, space_ids: Optional[Iterable[str]], maxsize: int):
+        self.space_ids: Optional[Set[str]] = set(space_ids) if space_ids is not None else None
+        self.overflowed = False
+        self._queue: queue.Queue = queue.Queue(maxsize)
+
+    def get(self, timeout: float) -> Optional[Tuple[int, Dict]]:
+        """
+        Waits for the next delta.
+
+        Args:
+            timeout (float): Longest time to wait, in seconds
+
+        Returns:
+            Optional[Tuple[int, Dict]]: (sequence number, delta), or None if none arrived in time
+        """
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _offer(self, event: Tuple[int, Dict]) -> bool:
+        """Queues an event from the listener thread, returning False if the queue is full."""
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+
+
+class AsyncSubscription(Subscription):
+    """
+    Subscription read from an event loop, so a waiting client holds no thread.
+    The listener thread hands events over to the loop.
+    """
+    def __init__(self, space_ids: Optional[Iterable[str]], maxsize: int, loop: asyncio.AbstractEventLoop):
+        super().__init__(space_ids, maxsize)
+        self._maxsize = maxsize
+        self._loop = loop
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    async def get(self, timeout: float) -> Optional[Tuple[int, Dict]]:
+        """
+        Waits for the next delta without blocking the event loop.
+
+        Args:
+            timeout (float): Longest time to wait, in seconds
+
+        Returns:
+            Optional[Tuple[int, Dict]]: (sequence number, delta), or None if none arrived in time
+        """
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def _offer(self, event: Tuple[int, Dict]) -> bool:
+        # asyncio queues are not thread-safe, so only the loop puts; the size check is approximate
+        if self._queue.qsize() >= self._maxsize:
+            return False
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, event)
+        except RuntimeError:
+            # The loop has been closed
+            return False
+        return True
+
+
+class AvailabilityFeed:
+    """
+    Fans out changes to the reservations collection to any number of subscribers through a single
+    Firestore snapshot listener, as availability deltas per space.
+
+    The listener starts with the first subscriber and runs until close(). Its first snapshot only
+    records the existing reservations; every later change is published as 'released' and 'reserved'
+    deltas, so clients patch the availability they fetched instead of polling for full lists.
+    """
+    def __init__(self, db, queue_size: int = 256):
+        self._db = db
+        self._queue_size = queue_size
+        self._subscriptions: List[Subscription] = []
+        self._watch = None
+        self._initialized = False
+        # Space and time range of every active reservation the listener has seen, by ID
+        self._known: Dict[str, Tuple[str, datetime, datetime]] = {}
+        self._sequence = itertools.count(1)
+        self._lock = Lock()
+        # Separate from _lock, which the listener callback takes while the listener is being started
+        self._watch_lock = Lock()
+
+    def subscribe(self, space_ids: Optional[Iterable[str]] = None, loop: Optional[asyncio.AbstractEventLoop] = None) -> Subscription:
+        """
+        Registers a client, starting the listener if it is not running yet.
+
+        Args:
+            space_ids (Iterable[str], optional): Spaces to receive deltas for. Defaults to every space.
+            loop (asyncio.AbstractEventLoop, optional): Event loop the client is read from, which makes
+                the subscription an AsyncSubscription. Defaults to reading from a thread.
+
+        Returns:
+            Subscription: The queue to read the client's deltas from
+        """
+        if loop is not None:
+            subscription = AsyncSubscription(space_ids, self._queue_size, loop)
+        else:
+            subscription = Subscription(space_ids, self._queue_size)
+        with self._lock:
+            self._subscriptions.append(subscription)
+        with self._watch_lock:
+            if self._watch is None:
+                # Reservations that have already ended cannot change availability
+                query = self._db.collection('reservations').where('end_timestamp', '>', datetime.now(timezone.utc))
+                self._watch = query.on_snapshot(self._on_snapshot)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Stops sending deltas to a client."""
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def close(self) -> None:
+        """Stops the listener and forgets the reservations it has seen."""
+        with self._watch_lock:
+            watch, self._watch = self._watch, None
+            if watch is not None:
+                watch.unsubscribe()
+        with self._lock:
+            self._initialized = False
+            self._known.clear()
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscriptions)
+
+    @staticmethod
+    def _delta(status: str, space_id: str, start: datetime, end: datetime) -> Dict:
+        day, first, count = to_slots(start, end)
+        return {
+            'status': status,
+            'space_id': space_id,
+            'date': day.isoformat(),
+            'slots': [first, count],
+            'start_timestamp': start.isoformat(),
+            'end_timestamp': end.isoformat(),
+        }
+
+    def _on_snapshot(self, documents, changes, read_time) -> None:
+        """Listener callback: turns document changes into deltas and queues them for the subscribers."""
+        with self._lock:
+            deltas = []
+            for change in changes:
+                document = change.document
+                before = self._known.pop(document.id, None)
+                after = None
+                if change.type != ChangeType.REMOVED:
+                    data = document.to_dict()
+                    if data.get('status') == 'active':
+                        after = (data['space_id'], data['start_timestamp'], data['end_timestamp'])
+                        self._known[document.id] = after
+                if before == after or not self._initialized:
+                    continue
+                # Archiving removes reservations that have ended, which frees nothing
+                if before is not None and (after is not None or before[2] > datetime.now(timezone.utc)):
+                    deltas.append(self._delta('released', *before))
+                if after is not None:
+                    deltas.append(self._delta('reserved', *after))
+            self._initialized = True
+
+            for delta in deltas:
+                event = (next(self._sequence), delta)
+                for subscription in self._subscriptions:
+                    if subscription.overflowed or (subscription.space_ids is not None and delta['space_id'] not in subscription.space_ids):
+                        continue
+                    if not subscription._offer(event):
+                        subscription.overflowed = True
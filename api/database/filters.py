@@ -0,0 +1,263 @@
+# database/filters.py
+"""
+Grammar of the reservation timestamp filters, and the query plans they compile to.
+
+A start_timestamp or end_timestamp filter is one of:
+    2099-01-01T09:00:00Z                        equal to the timestamp
+    >=2099-01-01T09:00:00Z                      compared with ==, !=, <, <=, > or >=
+    [2099-01-01T09:00:00Z,2099-01-02T00:00:00Z)  in a range; '[' and ']' include the bound, '(' and ')'
+                                                exclude it, and either bound can be left out
+
+Timestamps are ISO 8601, and those without an offset are UTC, as Firestore reads them.
+"""
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Iterable, List, Optional, Tuple
+from exceptions import ClientError
+
+FILTER_FIELDS = ("start_timestamp", "end_timestamp")
+# Reservations start and end on the same UTC day, so they never last longer than this
+MAX_DURATION = timedelta(days=1)
+PLAN_CACHE_SIZE = 1024
+
+OPERATOR_PATTERN = re.compile(r'^(>=|<=|==|!=|>|<)?(.+)$', re.DOTALL)
+RANGE_PATTERN = re.compile(r'^([\[(])([^,]*),([^,]*)([\])])$')
+
+INVALID_FILTER = "Invalid timestamp filter. Use an ISO 8601 timestamp, optionally prefixed by ==, !=, <, <=, > or >=, or a range such as [start,end)"
+
+
+@dataclass(frozen=True)
+class Interval:
+    """
+    Timestamps a filter accepts: those between two optional bounds, except an optional excluded one.
+
+    Attributes:
+        lower (datetime): Lower bound, or None if unbounded.
+        lower_inclusive (bool): Whether the lower bound itself is accepted.
+        upper (datetime): Upper bound, or None if unbounded.
+        upper_inclusive (bool): Whether the upper bound itself is accepted.
+        excluded (datetime): Timestamp rejected by a '!=' filter, or None.
+    """
+    lower: Optional[datetime] = None
+    lower_inclusive: bool = True
+    upper: Optional[datetime] = None
+    upper_inclusive: bool = True
+    excluded: Optional[datetime] = None
+
+    @property
+    def is_point(self) -> bool:
+        return self.lower is not None and self.lower == self.upper and self.lower_inclusive and self.upper_inclusive
+
+    @property
+    def is_empty(self) -> bool:
+        if self.lower is None or self.upper is None:
+            return False
+        if self.lower == self.upper:
+            return not (self.lower_inclusive and self.upper_inclusive)
+        return self.lower > self.upper
+
+    @property
+    def bounds(self) -> int:
+        """Number of bounds, which ranks how selective a range is."""
+        return (self.lower is not None) + (self.upper is not None)
+
+    def conditions(self, field: str) -> List[Tuple[str, str, datetime]]:
+        """Returns the bounds as Firestore where() conditions."""
+        if self.is_point:
+            return [(field, "==", self.lower)]
+        conditions = []
+        if self.lower is not None:
+            conditions.append((field, ">=" if self.lower_inclusive else ">", self.lower))
+        if self.upper is not None:
+            conditions.append((field, "<=" if self.upper_inclusive else "<", self.upper))
+        return conditions
+
+    def intersect(self, other: 'Interval') -> 'Interval':
+        """Returns the timestamps accepted by both intervals, keeping this one's excluded timestamp."""
+        lower, lower_inclusive = self.lower, self.lower_inclusive
+        if other.lower is not None and (lower is None or other.lower > lower or (other.lower == lower and not other.lower_inclusive)):
+            lower, lower_inclusive = other.lower, other.lower_inclusive
+        upper, upper_inclusive = self.upper, self.upper_inclusive
+        if other.upper is not None and (upper is None or other.upper < upper or (other.upper == upper and not other.upper_inclusive)):
+            upper, upper_inclusive = other.upper, other.upper_inclusive
+        return Interval(lower, lower_inclusive, upper, upper_inclusive, self.excluded)
+
+    def contains(self, value: Any) -> bool:
+        if not isinstance(value, datetime):
+            return False
+        if self.lower is not None and (value < self.lower or (value == self.lower and not self.lower_inclusive)):
+            return False
+        if self.upper is not None and (value > self.upper or (value == self.upper and not self.upper_inclusive)):
+            return False
+        return value != self.excluded
+
+
+@dataclass(frozen=True)
+class QueryPlan:
+    """
+    Normalized timestamp filters, split between what Firestore evaluates and what is checked in memory.
+
+    Equalities are all sent to Firestore. Of the fields filtered on a range, only the best one is:
+    the field the results are ordered on, otherwise the one with the most bounds, then the narrowest.
+    Since a reservation ends after it starts and within MAX_DURATION, the bounds of each field also
+    bound the other, e.g. a window of start >= day and end <= next day sends both bounds on the start.
+    That keeps every query on a single composite index of equalities and one range field. The other
+    ranges and every '!=' filter, which Firestore would answer with a scan of two ranges, are checked
+    on the returned documents instead.
+
+    Attributes:
+        intervals (Tuple[Tuple[str, Interval], ...]): (field, interval) of every filtered field.
+        conditions (Tuple[Tuple[str, str, datetime], ...]): where() conditions for Firestore.
+        range_field (str): Field Firestore filters on a range, or None.
+        predicates (Tuple[Tuple[str, Interval], ...]): (field, interval) checked in memory.
+        empty (bool): Whether no reservation can match, so there is nothing to query.
+    """
+    intervals: Tuple[Tuple[str, Interval], ...] = ()
+    conditions: Tuple[Tuple[str, str, datetime], ...] = ()
+    range_field: Optional[str] = None
+    predicates: Tuple[Tuple[str, Interval], ...] = ()
+    empty: bool = False
+
+    def interval(self, field: str) -> Optional[Interval]:
+        return next((interval for name, interval in self.intervals if name == field), None)
+
+    @property
+    def predicate_fields(self) -> List[str]:
+        return [field for field, _ in self.predicates]
+
+    def apply(self, query):
+        """Adds the plan's conditions to a Firestore query."""
+        for field, operator, value in self.conditions:
+            query = query.where(field, operator, value)
+        return query
+
+    def matches(self, doc) -> bool:
+        """Checks a document snapshot against the in-memory predicates."""
+        return all(interval.contains(doc.get(field)) for field, interval in self.predicates)
+
+    def filter(self, docs: Iterable) -> Iterable:
+        """Keeps the documents that pass the in-memory predicates, lazily."""
+        if not self.predicates:
+            return docs
+        return (doc for doc in docs if self.matches(doc))
+
+
+def parse_timestamp(value: str) -> datetime:
+    """
+    Parses an ISO 8601 timestamp into an aware UTC datetime.
+
+    Raises:
+        ClientError: If the timestamp is invalid
+    """
+    try:
+        timestamp = datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise ClientError(INVALID_FILTER)
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+
+def parse_filter(value: str) -> Interval:
+    """
+    Parses one timestamp filter into the interval it accepts.
+
+    Args:
+        value (str): The filter, e.g. '>=2099-01-01T09:00:00Z' or '[2099-01-01T09:00:00Z,2099-01-01T10:00:00Z)'
+
+    Returns:
+        Interval: The accepted timestamps
+
+    Raises:
+        ClientError: If the filter is invalid
+    """
+    match = RANGE_PATTERN.match(value)
+    if match:
+        opening, lower, upper, closing = match.groups()
+        return Interval(
+            lower=parse_timestamp(lower) if lower.strip() else None,
+            lower_inclusive=opening == "[",
+            upper=parse_timestamp(upper) if upper.strip() else None,
+            upper_inclusive=closing == "]",
+        )
+
+    match = OPERATOR_PATTERN.match(value)
+    if not match:
+        raise ClientError(INVALID_FILTER)
+    operator, timestamp = match.group(1) or "==", parse_timestamp(match.group(2))
+    if operator == "==":
+        return Interval(lower=timestamp, upper=timestamp)
+    if operator == "!=":
+        return Interval(excluded=timestamp)
+    if operator[0] == ">":
+        return Interval(lower=timestamp, lower_inclusive=operator == ">=")
+    return Interval(upper=timestamp, upper_inclusive=operator == "<=")
+
+
+def __range_rank(field: str, interval: Interval, order_field: Optional[str]) -> tuple:
+    """Sort key of the fields that could be filtered on a range in Firestore, best first."""
+    width = interval.upper - interval.lower if interval.bounds == 2 else None
+    return (field != order_field, -interval.bounds, width is None, width, FILTER_FIELDS.index(field))
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def compile_filters(start_timestamp: Optional[str] = None, end_timestamp: Optional[str] = None, order_field: Optional[str] = None) -> QueryPlan:
+    """
+    Compiles the timestamp filters of a query into a plan. Plans are cached by their arguments.
+
+    Args:
+        start_timestamp (str, optional): Filter on the start of the reservations
+        end_timestamp (str, optional): Filter on the end of the reservations
+        order_field (str, optional): Field the results are ordered on, which is preferred as the range field
+
+    Returns:
+        QueryPlan: The plan
+
+    Raises:
+        ClientError: If a filter is invalid
+    """
+    intervals = tuple(
+        (field, parse_filter(value))
+        for field, value in zip(FILTER_FIELDS, (start_timestamp, end_timestamp))
+        if value
+    )
+    given = dict(intervals)
+    start, end = given.get("start_timestamp", Interval()), given.get("end_timestamp", Interval())
+    narrowed = {
+        "start_timestamp": start.intersect(Interval(
+            lower=end.lower - MAX_DURATION if end.lower is not None else None,
+            upper=end.upper,
+            upper_inclusive=False,
+        )),
+        "end_timestamp": end.intersect(Interval(
+            lower=start.lower,
+            lower_inclusive=False,
+            upper=start.upper + MAX_DURATION if start.upper is not None else None,
+        )),
+    }
+    if any(narrowed[field].is_empty for field, _ in intervals):
+        return QueryPlan(intervals=intervals, empty=True)
+
+    conditions: List[Tuple[str, str, datetime]] = []
+    predicates: List[Tuple[str, Interval]] = []
+    ranges = [(field, narrowed[field]) for field, interval in intervals if interval.bounds and not interval.is_point]
+    range_field = min(ranges, key=lambda item: __range_rank(*item, order_field))[0] if ranges else None
+
+    for field, interval in intervals:
+        if interval.is_point:
+            conditions.extend(interval.conditions(field))
+        elif field == range_field:
+            conditions.extend(narrowed[field].conditions(field))
+            if interval.excluded is not None:
+                predicates.append((field, Interval(excluded=interval.excluded)))
+        else:
+            predicates.append((field, interval))
+
+    return QueryPlan(
+        intervals=intervals,
+        conditions=tuple(conditions),
+        range_field=range_field,
+        predicates=tuple(predicates),
+    )
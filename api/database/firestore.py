@@ -1,10 +1,31 @@
-from firebase_admin import credentials, firestore, initialize_app
+import firebase_admin
+from firebase_admin import credentials
+from flask import Flask, current_app, has_app_context
+from google.cloud import firestore
 from exceptions import ClientError
+from database.memory import MemoryFirestore
+from typing import Any, Iterable, Optional
 import os
 
-def initialize_firestore():
+# The data-access layer of this process, set once by init_db()
+_db: Optional['FirestoreDB'] = None
+
+
+def initialize_firestore(
+    credentials_path: str,
+    project: Optional[str] = None,
+    database: Optional[str] = None,
+    api_endpoint: Optional[str] = None
+) -> firestore.Client:
     """
-    Initializes Firestore with the Firebase Admin credentials.
+    Initializes Firebase Admin with the given credentials and creates the Firestore client.
+    Firebase Admin is only initialized once per process, since token verification shares it.
+
+    Args:
+        credentials_path (str): Path to the Firebase Admin service account file.
+        project (str, optional): Google Cloud project ID. Defaults to the project of the credentials.
+        database (str, optional): Firestore database ID. Defaults to the default database.
+        api_endpoint (str, optional): Firestore API host, e.g. a regional endpoint. Defaults to the global endpoint.
 
     Returns:
         firestore.Client: The Firestore client instance.
@@ -13,34 +34,41 @@ def initialize_firestore():
         ClientError: If initialization fails due to missing credentials or other issues.
     """
     try:
-        # Load Firebase credentials
-        cred_path = os.getenv("FIREBASE_CREDENTIALS", "./firebase-adminsdk.json.local")
-        if not os.path.exists(cred_path):
-            raise ClientError(f"Firebase credentials file not found at {cred_path}", 500)
+        if not os.path.exists(credentials_path):
+            raise ClientError(f"Firebase credentials file not found at {credentials_path}", 500)
 
-        cred = credentials.Certificate(cred_path)
-        initialize_app(cred)
+        cred = credentials.Certificate(credentials_path)
+        try:
+            firebase_admin.get_app()
+        except ValueError:
+            firebase_admin.initialize_app(cred)
 
-        # Initialize Firestore client
-        db = firestore.client()
-        return db
+        # The client opens one gRPC channel that every request of the process shares
+        return firestore.Client(
+            project=project or cred.project_id,
+            credentials=cred.get_credential(),
+            database=database,
+            client_options={'api_endpoint': api_endpoint} if api_endpoint else None
+        )
 
+    except ClientError:
+        raise
     except Exception as e:
         raise ClientError(f"Failed to initialize Firestore: {str(e)}", 500)
 
 
 class FirestoreDB:
     """
-    Wrapper class for Firestore operations.
-    Provides common methods for interacting with Firestore collections.
+    Data-access object shared by every request of the process.
+    Wraps a single Firestore client, or any object with the same surface such as an in-memory backend.
 
     Attributes:
-        db (firestore.Client): The Firestore client instance.
+        client: The Firestore client instance.
     """
-    def __init__(self):
-        self.db = initialize_firestore()
+    def __init__(self, client: Any):
+        self.client = client
 
-    def get_collection(self, collection_name: str):
+    def collection(self, collection_name: str):
         """
         Returns a reference to the specified Firestore collection.
 
@@ -50,4 +78,73 @@ class FirestoreDB:
         Returns:
             firestore.CollectionReference: Reference to the Firestore collection.
         """
-        return self.db.collection(collection_name)
+        return self.client.collection(collection_name)
+
+    def transaction(self, **kwargs):
+        """Starts a new transaction to pass to a firestore.transactional function."""
+        return self.client.transaction(**kwargs)
+
+    def batch(self):
+        """Starts a new write batch."""
+        return self.client.batch()
+
+    def get_all(self, references: Iterable, transaction=None):
+        """
+        Fetches several documents in one round trip.
+
+        Args:
+            references (Iterable[firestore.DocumentReference]): Documents to fetch.
+            transaction (firestore.Transaction, optional): Transaction to read in.
+
+        Returns:
+            Iterable[firestore.DocumentSnapshot]: The snapshots, in no particular order.
+        """
+        return self.client.get_all(references, transaction=transaction)
+
+
+def init_db(app: Optional[Flask] = None, client: Any = None) -> FirestoreDB:
+    """
+    Creates the data-access layer of the process and attaches it to the app.
+
+    Args:
+        app (Flask, optional): App whose config describes the connection and which will serve the requests.
+            FIRESTORE_BACKEND selects 'firestore' (default) or the offline 'memory' backend.
+        client (optional): Client to use instead of the configured backend.
+
+    Returns:
+        FirestoreDB: The data-access layer
+    """
+    global _db
+    if client is None:
+        config = app.config if app is not None else {}
+        backend = config.get('FIRESTORE_BACKEND', 'firestore')
+        if backend == 'memory':
+            client = MemoryFirestore()
+        elif backend == 'firestore':
+            client = initialize_firestore(
+                credentials_path=config.get('FIREBASE_CREDENTIALS', './firebase-adminsdk.json.local'),
+                project=config.get('FIRESTORE_PROJECT'),
+                database=config.get('FIRESTORE_DATABASE'),
+                api_endpoint=config.get('FIRESTORE_API_ENDPOINT')
+            )
+        else:
+            raise ClientError(f"Unknown Firestore backend: {backend}", 500)
+
+    _db = FirestoreDB(client)
+    if app is not None:
+        app.extensions['firestore_db'] = _db
+    return _db
+
+
+def get_db() -> FirestoreDB:
+    """
+    Returns the data-access layer of the current app, or of the process outside a request.
+
+    Raises:
+        RuntimeError: If init_db() has not been called.
+    """
+    if has_app_context() and 'firestore_db' in current_app.extensions:
+        return current_app.extensions['firestore_db']
+    if _db is None:
+        raise RuntimeError("The database has not been initialized, call init_db() first")
+    return _db
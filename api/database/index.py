@@ -0,0 +1,94 @@
+# database/index.py
+from bisect import bisect_left, insort
+from datetime import datetime
+from threading import RLock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# (start_timestamp, end_timestamp, reservation_id)
+Interval = Tuple[datetime, datetime, str]
+
+
+class IntervalIndex:
+    """
+    In-memory index of active reservation intervals, by reservation ID and by space_id.
+
+    Conflict checks are answered by the occupancy map; this index keeps the interval of each
+    reservation so it can be cleared from the map, and tells whether a space is still reserved.
+    Each space keeps its intervals in a list sorted by start time. Active reservations
+    on a space never overlap, so that list is also sorted by end time.
+    """
+    def __init__(self):
+        self._spaces: Dict[str, List[Interval]] = {}
+        self._by_id: Dict[str, Tuple[str, datetime, datetime]] = {}
+        self._lock = RLock()
+
+    def load(self, reservations: Iterable[Tuple[str, str, datetime, datetime]]) -> None:
+        """
+        Replaces the contents of the index.
+
+        Args:
+            reservations (Iterable[Tuple[str, str, datetime, datetime]]): (reservation_id, space_id, start, end) tuples
+        """
+        spaces: Dict[str, List[Interval]] = {}
+        by_id: Dict[str, Tuple[str, datetime, datetime]] = {}
+        for reservation_id, space_id, start, end in reservations:
+            spaces.setdefault(space_id, []).append((start, end, reservation_id))
+            by_id[reservation_id] = (space_id, start, end)
+        for intervals in spaces.values():
+            intervals.sort()
+
+        with self._lock:
+            self._spaces = spaces
+            self._by_id = by_id
+
+    def add(self, reservation_id: str, space_id: str, start: datetime, end: datetime) -> None:
+        """
+        Adds a reservation interval to the index.
+
+        Args:
+            reservation_id (str): ID of the reservation
+            space_id (str): ID of the reserved space
+            start (datetime): Start time of the reservation
+            end (datetime): End time of the reservation
+        """
+        with self._lock:
+            if reservation_id in self._by_id:
+                return
+            insort(self._spaces.setdefault(space_id, []), (start, end, reservation_id))
+            self._by_id[reservation_id] = (space_id, start, end)
+
+    def remove(self, reservation_id: str) -> Optional[Tuple[str, datetime, datetime]]:
+        """
+        Removes a reservation interval from the index.
+
+        Args:
+            reservation_id (str): ID of the reservation
+
+        Returns:
+            Optional[Tuple[str, datetime, datetime]]: The removed (space_id, start, end), or None if it was not indexed
+        """
+        with self._lock:
+            entry = self._by_id.pop(reservation_id, None)
+            if entry is None:
+                return None
+            space_id, start, end = entry
+            intervals = self._spaces[space_id]
+            position = bisect_left(intervals, (start, end, reservation_id))
+            del intervals[position]
+            if not intervals:
+                del self._spaces[space_id]
+            return entry
+
+    def get(self, reservation_id: str) -> Optional[Tuple[str, datetime, datetime]]:
+        """Returns the indexed (space_id, start, end) of a reservation, if any."""
+        return self._by_id.get(reservation_id)
+
+    def has_reservations_after(self, space_id: str, moment: datetime) -> bool:
+        """Checks whether an indexed reservation on the space ends after a moment."""
+        with self._lock:
+            intervals = self._spaces.get(space_id)
+            # Intervals on a space never overlap, so the last one ends last
+            return bool(intervals) and intervals[-1][1] > moment
+
+    def __len__(self) -> int:
+        return len(self._by_id)
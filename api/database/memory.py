@@ -0,0 +1,571 @@
+# database/memory.py
+import itertools
+import operator
+import random
+import string
+import time
+from bisect import bisect_left, bisect_right
+from collections.abc import Sequence
+from datetime import datetime, timezone
+from threading import RLock
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from google.api_core import exceptions
+from google.cloud.firestore import SERVER_TIMESTAMP
+from google.cloud.firestore_v1.watch import ChangeType, DocumentChange
+
+OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+AUTO_ID_CHARS = string.ascii_letters + string.digits
+
+
+def _normalize(value: Any) -> Any:
+    """Firestore stores naive datetimes as UTC, so make them comparable with aware ones."""
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class _SortedIndex:
+    """Values of one field in sorted order, with the ID of the document holding each."""
+    def __init__(self):
+        self.values: List[Any] = []
+        self.ids: List[str] = []
+
+    def add(self, value: Any, document_id: str) -> None:
+        position = bisect_right(self.values, value)
+        self.values.insert(position, value)
+        self.ids.insert(position, document_id)
+
+    def remove(self, value: Any, document_id: str) -> None:
+        position = bisect_left(self.values, value)
+        while self.ids[position] != document_id:
+            position += 1
+        del self.values[position]
+        del self.ids[position]
+
+    def load(self, entries: List[Tuple[Any, str]]) -> None:
+        """Adds many (value, document ID) entries with a single sort."""
+        entries = sorted(itertools.chain(zip(self.values, self.ids), entries), key=operator.itemgetter(0))
+        self.values = [value for value, _ in entries]
+        self.ids = [document_id for _, document_id in entries]
+
+    def bounds(self, op: str, value: Any) -> Tuple[int, int]:
+        """Returns the slice of positions matching a range or equality filter."""
+        if op == '==':
+            return bisect_left(self.values, value), bisect_right(self.values, value)
+        if op == '<':
+            return 0, bisect_left(self.values, value)
+        if op == '<=':
+            return 0, bisect_right(self.values, value)
+        if op == '>':
+            return bisect_right(self.values, value), len(self.values)
+        return bisect_left(self.values, value), len(self.values)
+
+
+class _Collection:
+    """
+    Documents of one collection with their indexes.
+    Datetime fields get a sorted index for range and equality filters, and every other
+    hashable field gets a hash index for equality filters.
+    """
+    def __init__(self):
+        # Document ID -> (data, version)
+        self.documents: Dict[str, Tuple[Dict, int]] = {}
+        self.hashed: Dict[str, Dict[Any, Set[str]]] = {}
+        self.sorted: Dict[str, _SortedIndex] = {}
+
+    def index(self, document_id: str, data: Dict) -> None:
+        for field, value in data.items():
+            if isinstance(value, datetime):
+                self.sorted.setdefault(field, _SortedIndex()).add(value, document_id)
+                continue
+            try:
+                self.hashed.setdefault(field, {}).setdefault(value, set()).add(document_id)
+            except TypeError:
+                pass
+
+    def unindex(self, document_id: str, data: Dict) -> None:
+        for field, value in data.items():
+            if isinstance(value, datetime):
+                self.sorted[field].remove(value, document_id)
+                continue
+            try:
+                ids = self.hashed[field][value]
+            except (TypeError, KeyError):
+                continue
+            ids.discard(document_id)
+            if not ids:
+                del self.hashed[field][value]
+
+    def candidates(self, filters: Tuple[Tuple[str, str, Any], ...]) -> Iterable[str]:
+        """
+        Picks the most selective index for a set of filters.
+
+        Returns:
+            Iterable[str]: IDs of the documents that may match; every filter still has to be applied
+        """
+        best: Optional[Iterable[str]] = None
+        best_size = len(self.documents)
+        for field, op, value in filters:
+            if op in ('<', '<=', '==', '>', '>=') and field in self.sorted and isinstance(value, datetime):
+                index = self.sorted[field]
+                start, stop = index.bounds(op, value)
+                if stop - start < best_size:
+                    best, best_size = index.ids[start:stop], stop - start
+            elif op == '==':
+                try:
+                    ids = self.hashed.get(field, {}).get(value, ())
+                except TypeError:
+                    continue
+                if len(ids) < best_size:
+                    best, best_size = ids, len(ids)
+        return self.documents.keys() if best is None else list(best)
+
+
+def _matches(data: Dict, filters: Tuple[Tuple[str, str, Any], ...]) -> bool:
+    """Applies filters to a document. Values of different types never match, as in Firestore."""
+    try:
+        return all(field in data and OPERATORS[op](data[field], value) for field, op, value in filters)
+    except TypeError:
+        return False
+
+
+class MemoryFirestore:
+    """
+    Thread-safe in-memory backend with the subset of the Firestore client surface the API uses:
+    collection, document, subcollections, where, order_by, limit, start_after, select, stream, get, get_all, on_snapshot,
+    set, create, update, delete, batch and transaction.
+
+    Transactions are optimistic: a commit aborts, and firestore.transactional retries it,
+    if any document or query result read in the transaction changed in the meantime.
+
+    Args:
+        latency (float, optional): Seconds every read, query and commit waits outside the lock, to mimic
+            the network round trips of Firestore in benchmarks. Defaults to 0.
+    """
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._lock = RLock()
+        self._collections: Dict[str, _Collection] = {}
+        self._versions = itertools.count(1)
+        self._watches: List['MemoryWatch'] = []
+
+    def collection(self, name: str) -> 'MemoryCollection':
+        return MemoryCollection(self, name)
+
+    def transaction(self, max_attempts: int = 5, read_only: bool = False) -> 'MemoryTransaction':
+        return MemoryTransaction(self, max_attempts, read_only)
+
+    def batch(self) -> 'MemoryBatch':
+        return MemoryBatch(self)
+
+    def get_all(self, references: Iterable['MemoryDocument'], transaction: Optional['MemoryTransaction'] = None) -> Iterator['MemorySnapshot']:
+        # One round trip for every document, like a batched get
+        self._round_trip()
+        for reference in references:
+            yield reference._get(transaction)
+
+    def load(self, collection_name: str, documents: Iterable[Tuple[str, Dict]]) -> None:
+        """
+        Bulk-loads documents, sorting each index once instead of inserting one by one.
+        Meant for seeding test and benchmark data; existing documents with the same IDs are replaced.
+
+        Args:
+            collection_name (str): Name of the collection
+            documents (Iterable[Tuple[str, Dict]]): (document ID, data) pairs
+        """
+        with self._lock:
+            collection = self._collection(collection_name)
+            sorted_entries: Dict[str, List[Tuple[Any, str]]] = {}
+            for document_id, data in documents:
+                previous = collection.documents.pop(document_id, None)
+                if previous is not None:
+                    collection.unindex(document_id, previous[0])
+                data = {field: _normalize(value) for field, value in data.items()}
+                collection.documents[document_id] = (data, next(self._versions))
+                for field, value in data.items():
+                    if isinstance(value, datetime):
+                        sorted_entries.setdefault(field, []).append((value, document_id))
+                        continue
+                    try:
+                        collection.hashed.setdefault(field, {}).setdefault(value, set()).add(document_id)
+                    except TypeError:
+                        pass
+            for field, entries in sorted_entries.items():
+                collection.sorted.setdefault(field, _SortedIndex()).load(entries)
+
+    def _round_trip(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _collection(self, name: str) -> _Collection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections.setdefault(name, _Collection())
+        return collection
+
+    def _read(self, collection: str, document_id: str) -> Tuple[Optional[Dict], int]:
+        with self._lock:
+            return self._collection(collection).documents.get(document_id, (None, 0))
+
+    def _query(self, collection_name: str, filters: Tuple[Tuple[str, str, Any], ...]) -> List[Tuple[str, Dict, int]]:
+        with self._lock:
+            collection = self._collection(collection_name)
+            documents = collection.documents
+            matches = []
+            for document_id in collection.candidates(filters):
+                data, version = documents[document_id]
+                if _matches(data, filters):
+                    matches.append((document_id, data, version))
+        # Firestore returns documents ordered by ID unless asked otherwise
+        matches.sort(key=operator.itemgetter(0))
+        return matches
+
+    def _apply(self, writes: List[Tuple[str, 'MemoryDocument', Optional[Dict]]]) -> None:
+        with self._lock:
+            changes, watches = self._write(writes)
+        self._notify(watches, changes)
+
+    def _write(self, writes: List[Tuple[str, 'MemoryDocument', Optional[Dict]]]) -> Tuple[List, List['MemoryWatch']]:
+        """
+        Applies writes atomically. The caller holds the lock, and passes the result to _notify() once it has released it.
+
+        Returns:
+            Tuple[List, List[MemoryWatch]]: The (reference, before, after) changes, and the watches to notify of them
+        """
+        # Check every precondition before applying anything, so the writes are atomic
+        for kind, reference, data in writes:
+            exists = self._read(reference.collection_name, reference.id)[0] is not None
+            if kind == 'create' and exists:
+                raise exceptions.AlreadyExists(f'Document already exists: {reference.path}')
+            if kind == 'update' and not exists:
+                raise exceptions.NotFound(f'No document to update: {reference.path}')
+
+        now = datetime.now(timezone.utc)
+        changes = []
+        for kind, reference, data in writes:
+            collection = self._collection(reference.collection_name)
+            previous = collection.documents.pop(reference.id, None)
+            if previous is not None:
+                collection.unindex(reference.id, previous[0])
+            if kind == 'delete':
+                changes.append((reference, previous, None))
+                continue
+            if kind == 'update':
+                data = {**previous[0], **data}
+            data = {field: now if value is SERVER_TIMESTAMP else _normalize(value) for field, value in data.items()}
+            collection.documents[reference.id] = (data, next(self._versions))
+            collection.index(reference.id, data)
+            changes.append((reference, previous, collection.documents[reference.id]))
+        return changes, list(self._watches)
+
+    @staticmethod
+    def _notify(watches: List['MemoryWatch'], changes: List) -> None:
+        # Listeners run outside the lock, like Firestore runs them on its own thread
+        for watch in watches:
+            watch._on_writes(changes)
+
+
+class MemorySnapshot:
+    def __init__(self, reference: 'MemoryDocument', data: Optional[Dict], version: int):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+        self._version = version
+
+    def get(self, field: str) -> Any:
+        if self._data is None or field not in self._data:
+            raise KeyError(field)
+        return self._data[field]
+
+    def to_dict(self) -> Optional[Dict]:
+        return dict(self._data) if self._data is not None else None
+
+
+class MemoryDocument:
+    def __init__(self, client: MemoryFirestore, collection_name: str, document_id: str):
+        self._client = client
+        self.collection_name = collection_name
+        self.id = document_id
+        self.path = f'{collection_name}/{document_id}'
+
+    def get(self, transaction: Optional['MemoryTransaction'] = None) -> MemorySnapshot:
+        self._client._round_trip()
+        return self._get(transaction)
+
+    def _get(self, transaction: Optional['MemoryTransaction']) -> MemorySnapshot:
+        data, version = self._client._read(self.collection_name, self.id)
+        if transaction is not None:
+            transaction._read_versions[self.path] = version
+        return MemorySnapshot(self, data, version)
+
+    def set(self, data: Dict) -> None:
+        self._client._round_trip()
+        self._client._apply([('set', self, data)])
+
+    def create(self, data: Dict) -> None:
+        self._client._round_trip()
+        self._client._apply([('create', self, data)])
+
+    def update(self, data: Dict) -> None:
+        self._client._round_trip()
+        self._client._apply([('update', self, data)])
+
+    def delete(self) -> None:
+        self._client._round_trip()
+        self._client._apply([('delete', self, None)])
+
+    def collection(self, name: str) -> 'MemoryCollection':
+        return MemoryCollection(self._client, f'{self.path}/{name}')
+
+
+class MemoryQuery:
+    ASCENDING = 'ASCENDING'
+    DESCENDING = 'DESCENDING'
+
+    def __init__(
+        self,
+        client: MemoryFirestore,
+        collection_name: str,
+        filters: Tuple[Tuple[str, str, Any], ...] = (),
+        orders: Tuple[Tuple[str, str], ...] = (),
+        limit: Optional[int] = None,
+        cursor: Optional[Dict] = None,
+        projection: Optional[Tuple[str, ...]] = None
+    ):
+        self._client = client
+        self._collection_name = collection_name
+        self._filters = filters
+        self._orders = orders
+        self._limit = limit
+        self._cursor = cursor
+        self._projection = projection
+
+    def _copy(self, **changes) -> 'MemoryQuery':
+        state = {
+            'filters': self._filters,
+            'orders': self._orders,
+            'limit': self._limit,
+            'cursor': self._cursor,
+            'projection': self._projection,
+        }
+        state.update(changes)
+        return MemoryQuery(self._client, self._collection_name, **state)
+
+    def where(self, field_path: str, op_string: str, value: Any) -> 'MemoryQuery':
+        if op_string not in OPERATORS:
+            raise ValueError(f'Unsupported operator: {op_string}')
+        return self._copy(filters=self._filters + ((field_path, op_string, _normalize(value)),))
+
+    def order_by(self, field_path: str, direction: str = ASCENDING) -> 'MemoryQuery':
+        if direction not in (self.ASCENDING, self.DESCENDING):
+            raise ValueError(f'Unsupported direction: {direction}')
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count: int) -> 'MemoryQuery':
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields: Dict) -> 'MemoryQuery':
+        return self._copy(cursor={field: _normalize(value) for field, value in document_fields.items()})
+
+    def select(self, field_paths: Iterable[str]) -> 'MemoryQuery':
+        return self._copy(projection=tuple(field_paths))
+
+    def _results(self) -> List[Tuple[str, Dict, int]]:
+        matches = self._client._query(self._collection_name, self._filters)
+        if self._orders:
+            # Like Firestore, documents without an ordered field are left out
+            fields = [field for field, _ in self._orders if field != '__name__']
+            matches = [match for match in matches if all(field in match[1] for field in fields)]
+            # Stable sorts from the last order to the first, on top of the ID order
+            for field, direction in reversed(self._orders):
+                matches.sort(key=lambda match: match[0] if field == '__name__' else match[1][field], reverse=direction == self.DESCENDING)
+        if self._cursor is not None:
+            matches = [match for match in matches if self._is_after(match)]
+        if self._limit is not None:
+            matches = matches[:self._limit]
+        return matches
+
+    def _is_after(self, match: Tuple[str, Dict, int]) -> bool:
+        document_id, data, _ = match
+        for field, direction in self._orders:
+            if field not in self._cursor:
+                break
+            value = document_id if field == '__name__' else data[field]
+            if value != self._cursor[field]:
+                return (value > self._cursor[field]) == (direction == self.ASCENDING)
+        return False
+
+    def on_snapshot(self, callback: Callable) -> 'MemoryWatch':
+        return MemoryWatch(self, callback)
+
+    def stream(self, transaction: Optional['MemoryTransaction'] = None) -> Iterator[MemorySnapshot]:
+        self._client._round_trip()
+        matches = self._results()
+        if transaction is not None:
+            transaction._queries.append((self, [(document_id, version) for document_id, _, version in matches]))
+        projection = self._projection
+        return iter([
+            MemorySnapshot(
+                MemoryDocument(self._client, self._collection_name, document_id),
+                data if projection is None else {field: data[field] for field in projection if field in data},
+                version
+            )
+            for document_id, data, version in matches
+        ])
+
+    def get(self, transaction: Optional['MemoryTransaction'] = None) -> List[MemorySnapshot]:
+        return list(self.stream(transaction=transaction))
+
+
+class _QueryResults(Sequence):
+    """
+    Snapshots of a query's results, fetched on first access.
+    Listeners that only look at the changes then cost nothing per write for the rest of the results.
+    """
+    def __init__(self, watch: 'MemoryWatch'):
+        self._watch = watch
+        self._snapshots: Optional[List[MemorySnapshot]] = None
+
+    def _fetch(self) -> List[MemorySnapshot]:
+        if self._snapshots is None:
+            query = self._watch._query
+            self._snapshots = [self._watch._snapshot(*match) for match in query._client._query(query._collection_name, query._filters)]
+        return self._snapshots
+
+    def __getitem__(self, index):
+        return self._fetch()[index]
+
+    def __len__(self) -> int:
+        return len(self._fetch())
+
+
+class MemoryWatch:
+    """
+    Snapshot listener of a query, the local change feed standing in for Firestore's.
+    The callback gets the initial results as ADDED changes, then the changes of every committed write
+    that adds a document to, modifies one in, or removes one from the results. Bulk loads are not reported.
+    Limits, orders and cursors of the query are ignored.
+    """
+    def __init__(self, query: MemoryQuery, callback: Callable):
+        self._query = query
+        self._callback = callback
+        client = query._client
+        with client._lock:
+            matches = client._query(query._collection_name, query._filters)
+            client._watches.append(self)
+        snapshots = [self._snapshot(document_id, data, version) for document_id, data, version in matches]
+        callback(snapshots, [DocumentChange(ChangeType.ADDED, snapshot, -1, index) for index, snapshot in enumerate(snapshots)], datetime.now(timezone.utc))
+
+    def _snapshot(self, document_id: str, data: Optional[Dict], version: int) -> MemorySnapshot:
+        return MemorySnapshot(MemoryDocument(self._query._client, self._query._collection_name, document_id), data, version)
+
+    def _on_writes(self, writes: List[Tuple['MemoryDocument', Optional[Tuple[Dict, int]], Optional[Tuple[Dict, int]]]]) -> None:
+        filters = self._query._filters
+        changes = []
+        for reference, before, after in writes:
+            if reference.collection_name != self._query._collection_name:
+                continue
+            matched = before is not None and _matches(before[0], filters)
+            matches = after is not None and _matches(after[0], filters)
+            if matches:
+                change_type = ChangeType.MODIFIED if matched else ChangeType.ADDED
+                changes.append(DocumentChange(change_type, self._snapshot(reference.id, *after), -1, -1))
+            elif matched:
+                changes.append(DocumentChange(ChangeType.REMOVED, self._snapshot(reference.id, *before), -1, -1))
+        if changes:
+            self._callback(_QueryResults(self), changes, datetime.now(timezone.utc))
+
+    def unsubscribe(self) -> None:
+        with self._query._client._lock:
+            if self in self._query._client._watches:
+                self._query._client._watches.remove(self)
+
+
+class MemoryCollection(MemoryQuery):
+    def __init__(self, client: MemoryFirestore, name: str):
+        super().__init__(client, name)
+        self.id = name.rsplit('/', 1)[-1]
+
+    def document(self, document_id: Optional[str] = None) -> MemoryDocument:
+        if document_id is None:
+            document_id = ''.join(random.choices(AUTO_ID_CHARS, k=20))
+        return MemoryDocument(self._client, self._collection_name, document_id)
+
+
+class MemoryBatch:
+    def __init__(self, client: MemoryFirestore):
+        self._client = client
+        self._writes: List[Tuple[str, MemoryDocument, Optional[Dict]]] = []
+
+    def set(self, reference: MemoryDocument, document_data: Dict) -> None:
+        self._writes.append(('set', reference, document_data))
+
+    def create(self, reference: MemoryDocument, document_data: Dict) -> None:
+        self._writes.append(('create', reference, document_data))
+
+    def update(self, reference: MemoryDocument, field_updates: Dict) -> None:
+        self._writes.append(('update', reference, field_updates))
+
+    def delete(self, reference: MemoryDocument) -> None:
+        self._writes.append(('delete', reference, None))
+
+    def commit(self) -> list:
+        writes, self._writes = self._writes, []
+        self._client._round_trip()
+        self._client._apply(writes)
+        return []
+
+
+class MemoryTransaction(MemoryBatch):
+    """Implements the private protocol that firestore.transactional drives."""
+    def __init__(self, client: MemoryFirestore, max_attempts: int = 5, read_only: bool = False):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self._id = None
+        self._clean_up()
+
+    def _clean_up(self) -> None:
+        self._writes = []
+        self._read_versions: Dict[str, int] = {}
+        self._queries: List[Tuple[MemoryQuery, List[Tuple[str, int]]]] = []
+
+    def _begin(self, retry_id: Optional[bytes] = None) -> None:
+        self._id = object()
+
+    def _rollback(self) -> None:
+        self._clean_up()
+
+    def _commit(self) -> list:
+        self._client._round_trip()
+        with self._client._lock:
+            # Anything read in the transaction must be unchanged, including query results
+            for path, version in self._read_versions.items():
+                collection_name, document_id = path.rsplit('/', 1)
+                if self._client._read(collection_name, document_id)[1] != version:
+                    raise exceptions.Aborted(f'Transaction contention on {path}')
+            for query, matches in self._queries:
+                current = [(document_id, version) for document_id, _, version in query._results()]
+                if current != matches:
+                    raise exceptions.Aborted('Transaction contention on query')
+            changes, watches = self._client._write(self._writes)
+        self._clean_up()
+        self._client._notify(watches, changes)
+        return []
+
+    def get_all(self, references: Iterable[MemoryDocument]) -> Iterator[MemorySnapshot]:
+        return self._client.get_all(references, transaction=self)
+
+    def get(self, ref_or_query):
+        if isinstance(ref_or_query, MemoryDocument):
+            return iter([ref_or_query.get(transaction=self)])
+        return ref_or_query.stream(transaction=self)
@@ -0,0 +1,208 @@
+# database/occupancy.py
+from datetime import date, datetime, time, timedelta, timezone
+from threading import RLock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+FULL_DAY = (1 << SLOTS_PER_DAY) - 1
+
+
+def to_slots(start: datetime, end: datetime) -> Tuple[date, int, int]:
+    """
+    Converts a same-day UTC time range to 15-minute slots.
+    Unaligned times are widened to the slots they touch.
+
+    Args:
+        start (datetime): Start of the range
+        end (datetime): End of the range
+
+    Returns:
+        Tuple[date, int, int]: (day, first slot, slot count)
+    """
+    start = start.astimezone(timezone.utc)
+    end = end.astimezone(timezone.utc)
+    day = start.date()
+    first = (start.hour * 60 + start.minute) // SLOT_MINUTES
+    # A range ending exactly at midnight covers the rest of the day
+    end_minutes = 24 * 60 if end.date() > day else end.hour * 60 + end.minute + (end.second > 0 or end.microsecond > 0)
+    last = -(-end_minutes // SLOT_MINUTES)
+    return day, first, max(last - first, 0)
+
+
+def slot_mask(first: int, count: int) -> int:
+    """Returns a bitmap with `count` bits set starting at slot `first`."""
+    return ((1 << count) - 1) << first
+
+
+def slot_time(day: date, slot: int) -> datetime:
+    """Returns the UTC start time of a slot."""
+    return datetime.combine(day, time(tzinfo=timezone.utc)) + timedelta(minutes=slot * SLOT_MINUTES)
+
+
+def to_bitstring(bitmap: int, count: int) -> str:
+    """Encodes the first `count` slots of a bitmap as a string of '0' (free) and '1' (busy), earliest slot first."""
+    return format(bitmap & slot_mask(0, count), f'0{count}b')[::-1] if count else ''
+
+
+def to_ranges(bitmap: int, count: int) -> List[Tuple[int, int]]:
+    """Encodes the busy runs within the first `count` slots of a bitmap as (first slot, length) pairs."""
+    bitmap &= slot_mask(0, count)
+    ranges = []
+    offset = 0
+    while bitmap:
+        # Skip the free slots, then measure the busy run
+        skip = (bitmap & -bitmap).bit_length() - 1
+        bitmap >>= skip
+        length = (~bitmap & (bitmap + 1)).bit_length() - 1
+        ranges.append((offset + skip, length))
+        bitmap >>= length
+        offset += skip + length
+    return ranges
+
+
+class OccupancyMap:
+    """
+    Slot occupancy of every space, one 96-bit bitmap per (space_id, date).
+
+    Bit i of a bitmap is set when the 15-minute slot starting at i * 15 minutes (UTC)
+    is reserved, so range checks are a single AND against a slot mask.
+
+    Attributes:
+        space_ids (List[str]): Spaces considered when searching for free spaces.
+    """
+    def __init__(self, space_ids: Iterable[str]):
+        self.space_ids = list(space_ids)
+        self._bitmaps: Dict[Tuple[str, date], int] = {}
+        self._lock = RLock()
+
+    def set_spaces(self, space_ids: Iterable[str]) -> None:
+        """Replaces the spaces considered when searching for free spaces."""
+        self.space_ids = list(space_ids)
+
+    def load(self, reservations: Iterable[Tuple[str, datetime, datetime]]) -> None:
+        """
+        Replaces the contents of the map.
+
+        Args:
+            reservations (Iterable[Tuple[str, datetime, datetime]]): (space_id, start, end) tuples
+        """
+        bitmaps: Dict[Tuple[str, date], int] = {}
+        for space_id, start, end in reservations:
+            day, first, count = to_slots(start, end)
+            bitmaps[(space_id, day)] = bitmaps.get((space_id, day), 0) | slot_mask(first, count)
+
+        with self._lock:
+            self._bitmaps = bitmaps
+
+    def mark(self, space_id: str, start: datetime, end: datetime) -> None:
+        """Marks the slots of a range as reserved."""
+        day, first, count = to_slots(start, end)
+        with self._lock:
+            self._bitmaps[(space_id, day)] = self._bitmaps.get((space_id, day), 0) | slot_mask(first, count)
+
+    def clear(self, space_id: str, start: datetime, end: datetime) -> None:
+        """Marks the slots of a range as free."""
+        day, first, count = to_slots(start, end)
+        with self._lock:
+            bitmap = self._bitmaps.get((space_id, day), 0) & ~slot_mask(first, count)
+            if bitmap:
+                self._bitmaps[(space_id, day)] = bitmap
+            else:
+                self._bitmaps.pop((space_id, day), None)
+
+    def bitmap(self, space_id: str, day: date) -> int:
+        """Returns the occupancy bitmap of a space for a day."""
+        return self._bitmaps.get((space_id, day), 0)
+
+    def window(self, day: date, first: int, count: int) -> Dict[str, int]:
+        """
+        Extracts the same window of slots from every space's bitmap.
+
+        Args:
+            day (date): Day of the window
+            first (int): First slot of the window
+            count (int): Number of slots in the window
+
+        Returns:
+            Dict[str, int]: Bitmaps shifted so that bit 0 is the first slot of the window, by space_id
+        """
+        mask = slot_mask(0, count)
+        bitmaps = self._bitmaps
+        return {space_id: (bitmaps.get((space_id, day), 0) >> first) & mask for space_id in self.space_ids}
+
+    def is_free(self, space_id: str, start: datetime, end: datetime) -> bool:
+        """
+        Checks whether every slot of a range is free on a space.
+
+        Args:
+            space_id (str): ID of the space
+            start (datetime): Start of the range
+            end (datetime): End of the range
+
+        Returns:
+            bool: True if no slot in the range is reserved
+        """
+        day, first, count = to_slots(start, end)
+        return not self.bitmap(space_id, day) & slot_mask(first, count)
+
+    def free_spaces(self, start: datetime, end: datetime) -> List[str]:
+        """
+        Finds every space whose slots are all free for a range.
+
+        Args:
+            start (datetime): Start of the range
+            end (datetime): End of the range
+
+        Returns:
+            List[str]: IDs of the free spaces
+        """
+        day, first, count = to_slots(start, end)
+        mask = slot_mask(first, count)
+        bitmaps = self._bitmaps
+        return [space_id for space_id in self.space_ids if not bitmaps.get((space_id, day), 0) & mask]
+
+    def free_run(self, space_id: str, day: date, first: int, count: int) -> int:
+        """
+        Measures the run of free slots around a range, which a booking of the range would split.
+
+        Args:
+            space_id (str): ID of the space
+            day (date): Day of the range
+            first (int): First slot of the range
+            count (int): Number of slots in the range
+
+        Returns:
+            int: Length of the free run containing the range, or 0 if a slot of the range is reserved
+        """
+        bitmap = self.bitmap(space_id, day)
+        if bitmap & slot_mask(first, count):
+            return 0
+        # The run starts after the last reserved slot before the range, and ends at the first one after it
+        start = (bitmap & slot_mask(0, first)).bit_length()
+        after = bitmap >> (first + count)
+        end = first + count + ((after & -after).bit_length() - 1 if after else SLOTS_PER_DAY - first - count)
+        return end - start
+
+    def first_free_slot(self, space_id: str, day: date, count: int, not_before: int = 0) -> Optional[datetime]:
+        """
+        Finds the earliest run of free slots on a space.
+
+        Args:
+            space_id (str): ID of the space
+            day (date): Day to search
+            count (int): Number of consecutive free slots needed
+            not_before (int, optional): First slot the run may start at. Defaults to 0.
+
+        Returns:
+            Optional[datetime]: UTC start time of the first free run, or None if the day has none
+        """
+        free = ~self.bitmap(space_id, day) & FULL_DAY
+        # Bit i of runs stays set only if slots i .. i + count - 1 are all free
+        runs = free
+        for shift in range(1, count):
+            runs &= free >> shift
+        runs &= FULL_DAY << not_before
+        if not runs:
+            return None
+        return slot_time(day, (runs & -runs).bit_length() - 1)
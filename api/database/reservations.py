@@ -1,156 +1,931 @@
 # database/reservations.py
-from typing import List, Optional, Tuple
+import base64
+import heapq
+import json
+import logging
+import math
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from firebase_admin import firestore
-from datetime import datetime, timezone
+from google.api_core import exceptions as api_exceptions
+from datetime import date, datetime, timedelta, timezone
+from flask import current_app, has_app_context
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from typedef import Reservation
+from typedef import RESERVATION_FIELDS, Reservation, ReservationPage
 from exceptions import ClientError
+from cache import QueryCache
+from logger import get_logger
+from metrics import count_reads, count_writes, counted, stage
+from database.filters import QueryPlan, compile_filters
+from database.firestore import get_db
+from database.index import IntervalIndex
+from database.spaces import catalog
+from database.occupancy import SLOT_MINUTES, SLOTS_PER_DAY, OccupancyMap, slot_mask, to_bitstring, to_ranges, to_slots
 
+# Each booking writes up to 7 documents and a commit is limited to 500 writes
+MAX_BATCH_SIZE = 50
 
-def __create_reservation(user_id: str, space_id: str, start_timestamp: datetime, end_timestamp: datetime) -> str:
+# Largest page get_reservations returns, and the fields it can sort on
+MAX_PAGE_SIZE = 500
+ORDER_FIELDS = ("__name__", "start_timestamp", "end_timestamp", "space_id", "created_at")
+
+# Per-user index of the reservations that have not ended, one document per user, and the page size of older ones
+USER_INDEX_COLLECTION = 'user_reservations'
+HISTORY_PAGE_SIZE = 50
+
+# Reservations that have ended are moved to reservations_archive/{YYYY-MM}/archived, by the month they ended in
+ARCHIVE_COLLECTION = 'reservations_archive'
+ARCHIVE_SUBCOLLECTION = 'archived'
+
+# Most spaces get_nearest_free_spaces returns
+MAX_NEAREST = 100
+
+# Ways allocate() can pick a space, and how many of its candidates it tries to book
+ALLOCATION_STRATEGIES = ("nearest", "best_fit")
+MAX_ALLOCATION_ATTEMPTS = 5
+
+logger = get_logger(__name__)
+
+# Active reservations of this process: their intervals by ID, and the slots they occupy, which answer conflict checks without a query
+interval_index = IntervalIndex()
+occupancy = OccupancyMap(catalog.ids())
+catalog.add_listener(occupancy.set_spaces)
+
+
+def __query_cache() -> Optional[QueryCache]:
+    """Returns the query cache of the current app, or None if it is disabled or there is no app."""
+    return current_app.extensions.get('query_cache') if has_app_context() else None
+
+
+def __invalidate(space_id: str, start: datetime) -> None:
+    """Evicts the cached queries that a reservation of a space starting at `start` can appear in."""
+    cache = __query_cache()
+    if cache is not None:
+        cache.invalidate(space_id, start.astimezone(timezone.utc).date())
+
+
+def __track(reservation_id: str, space_id: str, start: datetime, end: datetime) -> None:
+    """Adds an active reservation to the in-memory interval index and occupancy map, and evicts the cached queries it changes."""
+    if interval_index.get(reservation_id) is None:
+        interval_index.add(reservation_id, space_id, start, end)
+        occupancy.mark(space_id, start, end)
+    __invalidate(space_id, start)
+
+
+def __untrack(reservation_id: str) -> None:
+    """Removes a reservation from the in-memory interval index and occupancy map."""
+    entry = interval_index.remove(reservation_id)
+    if entry is not None:
+        occupancy.clear(*entry)
+
+
+def slot_ids(space_id: str, start: datetime, end: datetime) -> List[str]:
     """
-    Create a new reservation in Firestore.
+    Lists the IDs of the slot lock documents covering a reservation.
+    There is one lock per space and 15-minute slot, e.g. 'A1_2099-01-01_36' for 09:00 UTC.
 
     Args:
-        user_id (str): ID of the user making the reservation
-        space_id (str): ID of the space being reserved
-        start_timestamp (datetime): Start time of the reservation
-        end_timestamp (datetime): End time of the reservation
+        space_id (str): ID of the space
+        start (datetime): Start time of the reservation
+        end (datetime): End time of the reservation
 
     Returns:
-        str: Reservation ID
+        List[str]: Document IDs in the 'reservation_slots' collection
+    """
+    day, first, count = to_slots(start, end)
+    return [f"{space_id}_{day.isoformat()}_{slot:02d}" for slot in range(first, first + count)]
+
+
+def load_index() -> None:
     """
-    # Create reservation data
-    reservation_data = {
+    Loads all active reservations that have not ended yet into the interval index and occupancy map.
+    Called once at startup; afterwards both are kept in sync by schedule() and delete_reservation().
+    """
+    db = get_db()
+    
+    # Only reservations that have not ended can conflict with a new one
+    with stage('firestore-read'):
+        results = list(db.collection('reservations')\
+            .where('end_timestamp', '>', datetime.now(timezone.utc))\
+            .stream())
+    count_reads(len(results))
+    active = [
+        (doc.id, doc.get('space_id'), doc.get('start_timestamp'), doc.get('end_timestamp'))
+        for doc in results
+        if doc.get('status') == 'active'
+    ]
+    interval_index.load(active)
+    occupancy.load(entry[1:] for entry in active)
+
+
+def __reservation_data(user_id: str, space_id: str, start_timestamp: datetime, end_timestamp: datetime) -> dict:
+    """Builds the Firestore document of a new reservation."""
+    return {
         'user_id': user_id,
         'space_id': space_id,
         'start_timestamp': start_timestamp,
         'end_timestamp': end_timestamp,
         'created_at': firestore.SERVER_TIMESTAMP,
         'status': 'active'
-    }    
-    db = firestore.client()
+    }
+
+
+def __user_index_ref(user_id: str):
+    return get_db().collection(USER_INDEX_COLLECTION).document(user_id)
+
+
+def __index_entry(space_id: str, start: datetime, end: datetime) -> dict:
+    """Builds the entry of a reservation in its user's index document."""
+    return {'space_id': space_id, 'start_timestamp': start, 'end_timestamp': end}
+
+
+def __read_user_index(transaction, user_id: str, now: datetime) -> Dict[str, dict]:
+    """
+    Reads a user's index of upcoming reservations in a transaction, leaving out the ones that have ended.
+    A user without an index document, e.g. one whose reservations predate the index, gets the
+    entries of their reservations that have not ended, so the next write of the index completes it.
+
+    Returns:
+        Dict[str, dict]: Entry of each reservation by ID, as a new dict the caller can change
+    """
+    with stage('firestore-read'):
+        snapshot = __user_index_ref(user_id).get(transaction=transaction)
+    count_reads(1)
+    if snapshot.exists:
+        entries = snapshot.to_dict().get('reservations', {})
+    else:
+        entries = __query_user_index(transaction, user_id, now)
+    return {reservation_id: entry for reservation_id, entry in entries.items() if entry['end_timestamp'] > now}
+
+
+def __query_user_index(transaction, user_id: str, now: datetime) -> Dict[str, dict]:
+    """Builds the index entries of a user from their active reservations that have not ended."""
+    query = get_db().collection('reservations')\
+        .where('user_id', '==', user_id)\
+        .where('end_timestamp', '>', now)
+    with stage('firestore-read'):
+        docs = list(query.stream(transaction=transaction))
+    count_reads(len(docs))
+    return {
+        doc.id: __index_entry(doc.get('space_id'), doc.get('start_timestamp'), doc.get('end_timestamp'))
+        for doc in docs
+        if doc.get('status') == 'active'
+    }
+
+
+@firestore.transactional
+def __rebuild_user_index(transaction, user_id: str, now: datetime) -> Dict[str, dict]:
+    """
+    Writes the index document of a user who has none yet, and returns its entries.
+    Concurrent first requests of a user all try to build it; those retried after another built it
+    read that document and leave it as is, so they stop contending instead of running out of attempts.
+    """
+    with stage('firestore-read'):
+        snapshot = __user_index_ref(user_id).get(transaction=transaction)
+    count_reads(1)
+    if snapshot.exists:
+        return snapshot.to_dict().get('reservations', {})
+    entries = __query_user_index(transaction, user_id, now)
+    transaction.set(__user_index_ref(user_id), {'reservations': entries})
+    return entries
+
+
+@firestore.transactional
+def __create_reservation(transaction, user_id: str, space_id: str, start_timestamp: datetime, end_timestamp: datetime) -> str:
+    """
+    Create a new reservation in Firestore inside a transaction.
+    Each 15-minute slot of the reservation gets a lock document created with create() semantics,
+    so two transactions booking the same slot can never both commit.
+    The conflict query is re-run in the transaction to confirm the in-memory check, and the
+    reservation is added to the user's index document in the same commit.
+
+    Args:
+        transaction (firestore.Transaction): Transaction to run the confirmation and write in
+        user_id (str): ID of the user making the reservation
+        space_id (str): ID of the space being reserved
+        start_timestamp (datetime): Start time of the reservation
+        end_timestamp (datetime): End time of the reservation
+
+    Returns:
+        str: Reservation ID
+    
+    Raises:
+        ClientError: If a conflicting reservation exists
+    """
+    db = get_db()
+    reservations_ref = db.collection('reservations')
+    slots_ref = db.collection('reservation_slots')
+    
+    # Reading the slot locks makes concurrent bookings of the same slot contend
+    slot_refs = [slots_ref.document(slot_id) for slot_id in slot_ids(space_id, start_timestamp, end_timestamp)]
+    with stage('firestore-read'):
+        snapshots = list(transaction.get_all(slot_refs))
+    count_reads(len(snapshots))
+    if any(snapshot.exists for snapshot in snapshots):
+        raise ClientError("Time conflict with existing reservation", 409)
+    
+    # Confirm there are no conflicting reservations without slot locks
+    conflicts_query = reservations_ref\
+        .where('space_id', '==', space_id)\
+        .where('status', '==', 'active')\
+        .where('start_timestamp', '<', end_timestamp)\
+        .where('end_timestamp', '>', start_timestamp)
+    with stage('firestore-read'):
+        conflicts = list(conflicts_query.stream(transaction=transaction))
+    count_reads(len(conflicts))
+    for conflict in conflicts:
+        # Another process booked it, so remember it for future checks
+        __track(conflict.id, space_id, conflict.get('start_timestamp'), conflict.get('end_timestamp'))
+        raise ClientError("Time conflict with existing reservation", 409)
+    upcoming = __read_user_index(transaction, user_id, datetime.now(timezone.utc))
     
     # Add to Firestore
-    reservations_ref = db.collection('reservations').document()
-    reservations_ref.set(reservation_data)
+    reservation_ref = reservations_ref.document()
+    for slot_ref in slot_refs:
+        transaction.create(slot_ref, {'reservation_id': reservation_ref.id, 'space_id': space_id})
+    transaction.set(reservation_ref, __reservation_data(user_id, space_id, start_timestamp, end_timestamp))
+    upcoming[reservation_ref.id] = __index_entry(space_id, start_timestamp, end_timestamp)
+    transaction.set(__user_index_ref(user_id), {'reservations': upcoming})
     
     # Return reservation ID
-    return reservations_ref.id
+    return reservation_ref.id
+
+
+@firestore.transactional
+def __delete_reservations(transaction, user_id: str, reservations: List[Reservation]) -> int:
+    """
+    Deletes reservations of a user with their slot locks, and removes them from the user's index document.
+    A user without an index document keeps none; it is built from the remaining reservations when next read.
+
+    Returns:
+        int: Number of documents written
+    """
+    db = get_db()
+    index_ref = __user_index_ref(user_id)
+    with stage('firestore-read'):
+        snapshot = index_ref.get(transaction=transaction)
+    count_reads(1)
+    
+    writes = sum(__delete_in_batch(transaction, db, reservation) for reservation in reservations)
+    if snapshot.exists:
+        now = datetime.now(timezone.utc)
+        deleted = {reservation.reservation_id for reservation in reservations}
+        upcoming = {
+            reservation_id: entry
+            for reservation_id, entry in snapshot.to_dict().get('reservations', {}).items()
+            if reservation_id not in deleted and entry['end_timestamp'] > now
+        }
+        transaction.set(index_ref, {'reservations': upcoming})
+        writes += 1
+    return writes
 
 
-def delete_reservation(reservation_id: str) -> None:
+def __delete_in_batch(batch, db, reservation: Reservation) -> int:
+    """Adds the deletion of a reservation and its slot locks to a write batch, returning the number of writes added."""
+    slots_ref = db.collection('reservation_slots')
+    slot_id_list = slot_ids(reservation.space_id, reservation.start_timestamp, reservation.end_timestamp)
+    for slot_id in slot_id_list:
+        batch.delete(slots_ref.document(slot_id))
+    batch.delete(db.collection('reservations').document(reservation.reservation_id))
+    return len(slot_id_list) + 1
+
+
+def delete_reservation(reservation: Reservation) -> None:
+    """
+    Delete a reservation and its slot locks from Firestore, and remove it from its user's index.
+    The caller has already fetched the reservation, so it is not read again.
+    
+    Args:
+        reservation (Reservation): The reservation to delete
+    """
+    db = get_db()
+    
+    # Delete the reservation and release its slots together
+    with stage('firestore-write'):
+        writes = __delete_reservations(db.transaction(), reservation.user_id, [reservation])
+    count_writes(writes)
+    __untrack(reservation.reservation_id)
+    __invalidate(reservation.space_id, reservation.start_timestamp)
+
+
+def cancel_reservations(user_id: str, reservation_ids: List[str]) -> List[dict]:
     """
-    Delete a reservation from Firestore.
+    Delete several reservations of a user with one read and one transaction, which also updates the user's index.
     
     Args:
-        reservation_id (str): ID of the reservation to delete
+        user_id (str): ID of the user cancelling the reservations
+        reservation_ids (List[str]): IDs of the reservations to delete
+    
+    Returns:
+        List[dict]: One result per requested ID, in order, with the 'id' and a 'status' of
+            200 if deleted, 403 if owned by another user or 404 if not found.
+    
+    Raises:
+        ClientError: If no IDs are given or there are too many
+    """
+    if not reservation_ids:
+        raise ClientError("No reservation IDs provided")
+    if len(reservation_ids) > MAX_BATCH_SIZE:
+        raise ClientError(f"A batch can contain at most {MAX_BATCH_SIZE} reservations")
+    
+    db = get_db()
+    reservations_ref = db.collection('reservations')
+    
+    # Fetch every requested reservation at once
+    unique_ids = list(dict.fromkeys(reservation_ids))
+    with stage('firestore-read'):
+        snapshots = {
+            doc.id: doc
+            for doc in db.get_all([reservations_ref.document(reservation_id) for reservation_id in unique_ids])
+        }
+    count_reads(len(snapshots))
+    
+    statuses: Dict[str, int] = {}
+    deleted: List[Reservation] = []
+    for reservation_id in unique_ids:
+        doc = snapshots.get(reservation_id)
+        if doc is None or not doc.exists:
+            statuses[reservation_id] = 404
+        elif doc.get('user_id') != user_id:
+            statuses[reservation_id] = 403
+        else:
+            deleted.append(__to_reservation(doc))
+            statuses[reservation_id] = 200
+    
+    if deleted:
+        with stage('firestore-write'):
+            writes = __delete_reservations(db.transaction(), user_id, deleted)
+        count_writes(writes)
+        for reservation in deleted:
+            __untrack(reservation.reservation_id)
+            __invalidate(reservation.space_id, reservation.start_timestamp)
+    
+    messages = {200: "Reservation deleted successfully", 403: "Unauthorized action", 404: "Reservation not found"}
+    return [
+        {'id': reservation_id, 'status': statuses[reservation_id], 'message': messages[statuses[reservation_id]]}
+        for reservation_id in reservation_ids
+    ]
+
+def __encode_page_token(order: Tuple[str, str], value, document_id: str) -> str:
+    """Encodes the position after a document as an opaque page token."""
+    if isinstance(value, datetime):
+        value = {'datetime': value.isoformat()}
+    payload = json.dumps([list(order), value, document_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def __decode_page_token(page_token: str, order: Tuple[str, str]):
+    """
+    Decodes a page token made by __encode_page_token.
+
+    Raises:
+        ClientError: If the token is malformed or was issued for a different order
+    """
+    try:
+        payload = base64.urlsafe_b64decode(page_token + '=' * (-len(page_token) % 4))
+        token_order, value, document_id = json.loads(payload)
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value['datetime'])
+    except (ValueError, TypeError, KeyError):
+        raise ClientError("Invalid page token")
+    if tuple(token_order) != order or not isinstance(document_id, str):
+        raise ClientError("Invalid page token")
+    return value, document_id
+
+
+def __to_reservation(doc, hidden: Iterable[str] = ()) -> Reservation:
+    """Builds a Reservation from a snapshot, leaving the fields it was not projected on, and the hidden ones, as None."""
+    data = doc.to_dict()
+    for field in hidden:
+        data.pop(field, None)
+    return Reservation(
+        reservation_id=doc.id,
+        user_id=data.get("user_id"),
+        space_id=data.get("space_id"),
+        start_timestamp=data.get("start_timestamp"),
+        end_timestamp=data.get("end_timestamp")
+    )
+
+
+def __filter_query(query, user_id: Optional[str], space_id: Optional[str], start_timestamp: Optional[str], end_timestamp: Optional[str], order_by: Optional[str] = None):
     """
-    db = firestore.client()
+    Applies the reservation filters to a query, through the compiled plan of the timestamp filters.
+
+    Returns:
+        Tuple[firestore.Query, QueryPlan]: The filtered query, and the plan whose predicates the results must still pass
     
-    # Get reservation reference
-    reservation_ref = db.collection('reservations').document(reservation_id)
+    Raises:
+        ClientError: If a timestamp filter is invalid
+    """
+    plan = compile_filters(start_timestamp or None, end_timestamp or None, (order_by or "").lstrip("-") or None)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Compiled timestamp filters", extra={'fields': {
+            'conditions': plan.conditions, 'predicates': plan.predicates, 'empty': plan.empty,
+        }})
+    query = plan.apply(query)
     
-    if not reservation_ref.get().exists:
-        raise ClientError("Reservation not found when deleting", 404)
+    if user_id:
+        query = query.where("user_id", "==", user_id)
+    if space_id:
+        query = query.where("space_id", "==", space_id)
+    return query, plan
+
+
+def __parse_order(order_by: Optional[str], range_field: Optional[str]) -> Tuple[str, str]:
+    """
+    Parses an order_by argument such as '-start_timestamp' into (field, direction).
+    Defaults to the field Firestore filters on a range, as it requires, or the document ID.
     
-    # Delete the reservation
-    reservation_ref.delete()
+    Raises:
+        ClientError: If the field cannot be ordered on
+    """
+    field = (order_by or "").lstrip("-") or range_field or "__name__"
+    if field not in ORDER_FIELDS:
+        raise ClientError(f"Cannot order by {field}")
+    direction = firestore.Query.DESCENDING if (order_by or "").startswith("-") else firestore.Query.ASCENDING
+    return field, direction
+
+
+def __selected_fields(fields: List[str]) -> List[str]:
+    """
+    Checks a projection and returns the stored fields it selects.
     
+    Raises:
+        ClientError: If a field is not a reservation field
+    """
+    unknown = [field for field in fields if field not in RESERVATION_FIELDS]
+    if unknown:
+        raise ClientError(f"Unknown fields: {', '.join(unknown)}")
+    # The ID is not a stored field
+    return [field for field in fields if field != "reservation_id"]
+
+
 def get_reservations(
     reservation_id: Optional[str] = None,
     user_id: Optional[str] = None,
     space_id: Optional[str] = None,
     start_timestamp: Optional[str] = None,
     end_timestamp: Optional[str] = None,
-) -> List['Reservation']:
+    limit: Optional[int] = None,
+    page_token: Optional[str] = None,
+    order_by: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    source=None,
+) -> ReservationPage:
     """
     Fetches reservations based on provided filters, with flexible operators for timestamps.
+    Passing a limit or page token returns one page of results at a time.
 
     Args:
         reservation_id (str, optional): Unique ID of the reservation.
         user_id (str, optional): The ID of the user who made the reservation.
         space_id (str, optional): The ID of the parking space for the reservation.
-        start_timestamp (datetime, optional): Start timestamp for filtering reservations.
-        end_timestamp (datetime, optional): End timestamp for filtering reservations.
         start_timestamp (str, optional): Operator-prefixed start timestamp for filtering.
         end_timestamp (str, optional): Operator-prefixed end timestamp for filtering.
+        limit (int, optional): Maximum number of reservations to return, at most MAX_PAGE_SIZE.
+            Defaults to MAX_PAGE_SIZE when a page token is given, otherwise to no limit.
+        page_token (str, optional): next_page_token of the previous page.
+        order_by (str, optional): Field to sort by, prefixed with '-' for descending order.
+            Defaults to the filtered timestamp field, or the reservation ID.
+        fields (List[str], optional): Reservation fields to fetch; the others are left as None.
+        source (firestore.CollectionReference, optional): Collection to read, e.g. an archive partition.
+            Defaults to the reservations collection.
 
     Returns:
-        List[Reservation]: List of reservations matching the filters.
+        ReservationPage: List of reservations matching the filters, with the token of the next page if there is one.
     
     Raises:
-        ClientError: If timestamp format is invalid or query execution fails.
+        ClientError: If a timestamp, limit, order, field or page token is invalid, or query execution fails.
         
     Example:
-        get_reservations(start_timestamp='>=2022-01-01T00:00:00Z')
+        get_reservations(start_timestamp='>=2022-01-01T00:00:00Z', limit=100)
     """
-    db = firestore.client()
+    db = get_db()
     
-    reservations_ref = db.collection("reservations")
+    reservations_ref = source or db.collection("reservations")
+    
+    if fields is not None:
+        selected = __selected_fields(fields)
     
     # If reservation_id is provided, fetch a single reservation by its document ID
     if reservation_id:
-        reservation_doc = reservations_ref.document(reservation_id).get()
+        with stage('firestore-read'):
+            reservation_doc = reservations_ref.document(reservation_id).get()
+        count_reads(1)
         if not reservation_doc.exists:
             raise ClientError("Reservation not found", 404)
         
         # Return a single reservation in a list
-        return [
-            Reservation(
-                reservation_id=reservation_doc.id,
-                user_id=reservation_doc.get("user_id"),
-                space_id=reservation_doc.get("space_id"),
-                start_timestamp=reservation_doc.get("start_timestamp"),
-                end_timestamp=reservation_doc.get("end_timestamp")
-            )
-        ]
+        return ReservationPage([__to_reservation(reservation_doc)])
         
-    def parse_operator_timestamp(value: str) -> Tuple[str, datetime]:
-        # Define possible operators
-        operators = ['>=', '<=', '>', '<', '==', '!=']   
-        try: 
-            for operator in operators:
-                if value.startswith(operator):
-                    timestamp_str = value[len(operator):]
-                    return operator, datetime.fromisoformat(timestamp_str)
-            # Default to exact match if no operator is found
-            return "==", datetime.fromisoformat(value)
-        except ValueError:
-            raise ClientError("Invalid timestamp format. Must use ISO 8601 and optionally prefixed by a valid operator.")        
-
-    query = reservations_ref
-    
-    if start_timestamp:
-        start_op, start_time = parse_operator_timestamp(start_timestamp)
-        print("start time must be", start_op, start_time)
-        query = query.where("start_timestamp", start_op, start_time)
-    
-    if end_timestamp:
-        end_op, end_time = parse_operator_timestamp(end_timestamp)
-        print("end time must be", end_op, end_time)
-        query = query.where("end_timestamp", end_op, end_time)
-    
-    # # Otherwise, apply filters to query all matching reservations
-    if user_id:
-        query = query.where("user_id", "==", user_id)
-    if space_id:
-        query = query.where("space_id", "==", space_id)
+    query, plan = __filter_query(reservations_ref, user_id, space_id, start_timestamp, end_timestamp, order_by)
+
+    paginated = limit is not None or page_token is not None
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ClientError(f"Limit must be between 1 and {MAX_PAGE_SIZE}")
+    
+    # Pages are cut on a total order: the sort field, then the document ID to break ties
+    order = None
+    if order_by or paginated:
+        order = field, direction = __parse_order(order_by, plan.range_field)
+        query = query.order_by(field, direction=direction)
+        if field != "__name__":
+            query = query.order_by("__name__", direction=direction)
+    
+    if plan.empty:
+        return ReservationPage([])
+    
+    if page_token:
+        value, document_id = __decode_page_token(page_token, order)
+        query = query.start_after({order[0]: value, "__name__": document_id} if order[0] != "__name__" else {"__name__": document_id})
+    
+    if paginated:
+        limit = limit or MAX_PAGE_SIZE
+        # One extra document tells whether there is a next page. With in-memory predicates,
+        # the query runs until that many documents have passed them instead
+        if not plan.predicates:
+            query = query.limit(limit + 1)
+    
+    hidden: List[str] = []
+    if fields is not None:
+        # The sort field is needed to build the next page token, and the predicate fields to check the documents
+        if paginated and order[0] not in ("__name__", *selected):
+            selected = selected + [order[0]]
+        hidden = [field for field in plan.predicate_fields if field not in selected]
+        query = query.select(selected + hidden or ["__name__"])
 
     # Execute the query and retrieve results
-    results = query.stream()
-    return [
-        Reservation(
-            reservation_id=doc.id,
-            user_id=doc.get("user_id"),
-            space_id=doc.get("space_id"),
-            start_timestamp=doc.get("start_timestamp"),
-            end_timestamp=doc.get("end_timestamp")
-        )
-        for doc in results
+    docs = __read(query, plan, limit + 1 if paginated else None)
+    next_page_token = None
+    if paginated and len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        next_page_token = __encode_page_token(order, last.id if order[0] == "__name__" else last.get(order[0]), last.id)
+    return ReservationPage([__to_reservation(doc, hidden) for doc in docs], next_page_token)
+
+
+def __read(query, plan: QueryPlan, count: Optional[int] = None) -> list:
+    """
+    Runs a query and keeps the documents that pass the plan's in-memory predicates.
+
+    Args:
+        query (firestore.Query): The query, with the plan applied
+        plan (QueryPlan): The plan of the query's timestamp filters
+        count (int, optional): Stop reading once this many documents have passed. Defaults to reading every document.
+
+    Returns:
+        list: The matching snapshots, in query order
+    """
+    read = 0
+    docs = []
+    with stage('firestore-read'):
+        stream = query.stream()
+        for doc in stream:
+            read += 1
+            if plan.matches(doc):
+                docs.append(doc)
+                if count is not None and len(docs) == count:
+                    break
+        if hasattr(stream, 'close'):
+            stream.close()
+    count_reads(read)
+    return docs
+
+
+def stream_reservations(
+    user_id: Optional[str] = None,
+    space_id: Optional[str] = None,
+    start_timestamp: Optional[str] = None,
+    end_timestamp: Optional[str] = None,
+    order_by: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+) -> Iterator[Reservation]:
+    """
+    Streams every reservation matching the filters, one document at a time, so memory use
+    does not grow with the number of results. The arguments are those of get_reservations().
+    
+    Returns:
+        Iterator[Reservation]: Reservations in query order, read lazily from query.stream()
+    
+    Raises:
+        ClientError: If a filter, order or field is invalid. Raised by this call, before anything is streamed.
+    """
+    db = get_db()
+    
+    query, plan = __filter_query(db.collection("reservations"), user_id, space_id, start_timestamp, end_timestamp, order_by)
+    if order_by:
+        field, direction = __parse_order(order_by, plan.range_field)
+        query = query.order_by(field, direction=direction)
+    hidden: List[str] = []
+    if fields is not None:
+        selected = __selected_fields(fields)
+        hidden = [field for field in plan.predicate_fields if field not in selected]
+        query = query.select(selected + hidden or ["__name__"])
+    if plan.empty:
+        return iter(())
+    
+    return (__to_reservation(doc, hidden) for doc in plan.filter(counted(query.stream())))
+
+
+def get_upcoming_reservations(user_id: str) -> List[Reservation]:
+    """
+    Fetches the active and upcoming reservations of a user with a single read of their index document,
+    instead of querying the whole collection. The index is built on first use for users who have none.
+    
+    Args:
+        user_id (str): The ID of the user
+    
+    Returns:
+        List[Reservation]: Reservations that have not ended, by start time
+    """
+    db = get_db()
+    now = datetime.now(timezone.utc)
+    
+    with stage('firestore-read'):
+        snapshot = __user_index_ref(user_id).get()
+    count_reads(1)
+    if snapshot.exists:
+        entries = snapshot.to_dict().get('reservations', {})
+    else:
+        with stage('firestore-write'):
+            entries = __rebuild_user_index(db.transaction(), user_id, now)
+        count_writes(1)
+    
+    reservations = [
+        Reservation(reservation_id, user_id, entry['space_id'], entry['start_timestamp'], entry['end_timestamp'])
+        for reservation_id, entry in entries.items()
+        if entry['end_timestamp'] > now
     ]
+    reservations.sort(key=lambda reservation: (reservation.start_timestamp, reservation.reservation_id))
+    return reservations
+
+
+def __encode_history_token(month: Optional[str], page_token: Optional[str]) -> str:
+    """Encodes the position in a user's history: the archive month being read, or None for the reservations collection, and the page token in it."""
+    payload = json.dumps([month, page_token], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def __decode_history_token(page_token: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Decodes a page token made by __encode_history_token.
+
+    Raises:
+        ClientError: If the token is malformed
+    """
+    try:
+        payload = base64.urlsafe_b64decode(page_token + '=' * (-len(page_token) % 4))
+        month, token = json.loads(payload)
+    except (ValueError, TypeError):
+        raise ClientError("Invalid page token")
+    if not all(value is None or isinstance(value, str) for value in (month, token)):
+        raise ClientError("Invalid page token")
+    return month, token
+
+
+def __archive_partition(db, month: str):
+    """Returns the collection of the reservations archived for a month, e.g. '2099-01'."""
+    return db.collection(ARCHIVE_COLLECTION).document(month).collection(ARCHIVE_SUBCOLLECTION)
+
+
+def get_reservation_history(user_id: str, limit: Optional[int] = None, page_token: Optional[str] = None) -> ReservationPage:
+    """
+    Fetches one page of the reservations of a user that have ended, most recent first.
+    Those not archived yet are read first, then each archive partition from the latest month back.
+    
+    Args:
+        user_id (str): The ID of the user
+        limit (int, optional): Page size, at most MAX_PAGE_SIZE. Defaults to HISTORY_PAGE_SIZE.
+        page_token (str, optional): next_page_token of the previous page.
+    
+    Returns:
+        ReservationPage: The page, with the token of the next one if there is one
+    
+    Raises:
+        ClientError: If the limit or page token is invalid
+    """
+    limit = HISTORY_PAGE_SIZE if limit is None else limit
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ClientError(f"Limit must be between 1 and {MAX_PAGE_SIZE}")
+    db = get_db()
+    # Reservations end on a 15-minute boundary, so the minute is precise enough and keeps the compiled filter reusable
+    now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    
+    with stage('firestore-read'):
+        months = sorted((doc.id for doc in db.collection(ARCHIVE_COLLECTION).select(["__name__"]).stream()), reverse=True)
+    count_reads(len(months))
+    sources = [None, *months]
+    month, token = __decode_history_token(page_token) if page_token else (None, None)
+    if month not in sources:
+        raise ClientError("Invalid page token")
+    
+    reservations: List[Reservation] = []
+    for position in range(sources.index(month), len(sources)):
+        month = sources[position]
+        page = get_reservations(
+            user_id=user_id,
+            end_timestamp=f"<={now.isoformat()}",
+            order_by="-end_timestamp",
+            limit=limit - len(reservations),
+            page_token=token,
+            source=__archive_partition(db, month) if month else None,
+        )
+        reservations.extend(page)
+        token = None
+        if page.next_page_token:
+            return ReservationPage(reservations, __encode_history_token(month, page.next_page_token))
+        if len(reservations) == limit:
+            following = sources[position + 1] if position + 1 < len(sources) else None
+            return ReservationPage(reservations, __encode_history_token(following, None) if following else None)
+    return ReservationPage(reservations)
+
+
+def archive_reservations(before: Optional[datetime] = None, batch_size: int = MAX_BATCH_SIZE, max_batches: Optional[int] = None) -> int:
+    """
+    Marks the reservations that ended by a time 'completed' and moves them out of the reservations collection,
+    into the archive partition of the month they ended in, so conflict checks and filters only scan live reservations.
+    Each batch copies the reservations to the archive and deletes them with their slot locks in one commit,
+    then drops them from the in-memory indexes and the query cache.
+    
+    Args:
+        before (datetime, optional): Archive the reservations that ended at or before this time, which cannot
+            be in the future. Defaults to now.
+        batch_size (int, optional): Reservations moved per commit, at most MAX_BATCH_SIZE. Defaults to MAX_BATCH_SIZE.
+        max_batches (int, optional): Stop after this many commits. Defaults to archiving every reservation that ended.
+    
+    Returns:
+        int: Number of reservations archived
+    
+    Raises:
+        ClientError: If the batch size is invalid, or `before` is in the future
+    """
+    if not 1 <= batch_size <= MAX_BATCH_SIZE:
+        raise ClientError(f"Batch size must be between 1 and {MAX_BATCH_SIZE}")
+    now = datetime.now(timezone.utc)
+    if before is not None and before > now:
+        # A later cutoff would archive live reservations and free their slots for double booking
+        raise ClientError("Cannot archive reservations that have not ended yet")
+    db = get_db()
+    before = before or now
+    
+    # Archived reservations leave the collection, so every batch reads from the start of the query
+    query = db.collection('reservations')\
+        .where('end_timestamp', '<=', before)\
+        .limit(batch_size)
+    archived = batches = 0
+    while max_batches is None or batches < max_batches:
+        with stage('firestore-read'):
+            docs = list(query.stream())
+        count_reads(len(docs))
+        if not docs:
+            break
+        
+        batch = db.batch()
+        writes = 0
+        reservations = []
+        months = set()
+        for doc in docs:
+            reservation = __to_reservation(doc)
+            month = reservation.end_timestamp.astimezone(timezone.utc).strftime('%Y-%m')
+            months.add(month)
+            batch.set(__archive_partition(db, month).document(doc.id), {
+                **doc.to_dict(),
+                'status': 'completed',
+                'archived_at': firestore.SERVER_TIMESTAMP,
+            })
+            writes += __delete_in_batch(batch, db, reservation) + 1
+            reservations.append(reservation)
+        # The partition documents list the months, since Firestore does not list empty parents
+        for month in months:
+            batch.set(db.collection(ARCHIVE_COLLECTION).document(month), {'month': month})
+        with stage('firestore-write'):
+            batch.commit()
+        count_writes(writes + len(months))
+        
+        for reservation in reservations:
+            __untrack(reservation.reservation_id)
+            __invalidate(reservation.space_id, reservation.start_timestamp)
+        archived += len(reservations)
+        batches += 1
+    
+    if archived:
+        logger.info("Archived reservations", extra={'fields': {'archived': archived, 'batches': batches, 'before': before.isoformat()}})
+    return archived
+
+
+def __cache_scope(space_id: Optional[str], start_timestamp: Optional[str], end_timestamp: Optional[str]) -> Tuple[tuple, Optional[date], Optional[date]]:
+    """
+    Normalizes query filters into a cache key, and finds the days of the reservations they can match.
+    Equivalent filters such as '2099-01-01T09:00:00Z', '==2099-01-01T09:00:00+00:00' and
+    '[2099-01-01T09:00:00Z,2099-01-01T09:00:00Z]' share a key.
+
+    Returns:
+        Tuple[tuple, Optional[date], Optional[date]]: The key, and the first and last day, None when unbounded
+
+    Raises:
+        ClientError: If a timestamp filter is invalid
+    """
+    plan = compile_filters(start_timestamp or None, end_timestamp or None)
+    key = (space_id, plan.interval("start_timestamp"), plan.interval("end_timestamp"))
+    first_day = last_day = None
+    for _, interval in plan.intervals:
+        # A reservation lies within one UTC day, so bounding either timestamp bounds its day give or take one
+        if interval.lower is not None:
+            day = interval.lower.date() - timedelta(days=1)
+            first_day = day if first_day is None else max(first_day, day)
+        if interval.upper is not None:
+            day = interval.upper.date() + timedelta(days=1)
+            last_day = day if last_day is None else min(last_day, day)
+    return key, first_day, last_day
+
+
+def get_public_reservations(
+    reservation_id: Optional[str] = None,
+    space_id: Optional[str] = None,
+    start_timestamp: Optional[str] = None,
+    end_timestamp: Optional[str] = None,
+    limit: Optional[int] = None,
+    page_token: Optional[str] = None,
+    order_by: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+) -> ReservationPage:
+    """
+    Same as get_reservations() without the user filter, answered from the app's query cache when possible.
+    Writes through schedule() and the delete functions evict the results of the affected space and day.
+
+    Returns:
+        ReservationPage: Reservations matching the filters, which must not be modified since they may be shared
+    """
+    cache = __query_cache()
+    # Single reservations are looked up by ID before being deleted, so they are always read fresh
+    if cache is None or reservation_id:
+        return get_reservations(reservation_id=reservation_id, space_id=space_id, start_timestamp=start_timestamp, end_timestamp=end_timestamp,
+                                limit=limit, page_token=page_token, order_by=order_by, fields=fields)
+    
+    key, first_day, last_day = __cache_scope(space_id, start_timestamp, end_timestamp)
+    key += (limit, page_token, order_by, tuple(fields) if fields is not None else None)
+    reservations = cache.get(key)
+    if reservations is None:
+        generation = cache.generation
+        reservations = get_reservations(space_id=space_id, start_timestamp=start_timestamp, end_timestamp=end_timestamp,
+                                        limit=limit, page_token=page_token, order_by=order_by, fields=fields)
+        cache.put(key, reservations, space_id, first_day, last_day, generation=generation)
+    return reservations
+
+
+def __validate(space_id: str, start_timestamp: str, end_timestamp: str) -> Tuple[datetime, datetime]:
+    """
+    Applies the booking rules to a requested space and time range.
+    
+    Args:
+        space_id (str): ID of the space being reserved
+        start_timestamp (str): Start time of the reservation in ISO format
+        end_timestamp (str): End time of the reservation in ISO format
+    
+    Returns:
+        Tuple[datetime, datetime]: Start and end time in UTC
+    
+    Raises:
+        ClientError: If the request breaks a booking rule
+    """
+    # The catalog is kept current by the /parking writes and its listener, so this is a dict lookup with no query
+    if not isinstance(space_id, str) or space_id not in catalog:
+        raise ClientError(f"Unknown space_id: {space_id}")
+    
+    return __validate_range(start_timestamp, end_timestamp)
+
+
+def __validate_range(start_timestamp: str, end_timestamp: str) -> Tuple[datetime, datetime]:
+    """Applies the booking rules to a requested time range, returning its start and end in UTC."""
+    try:
+        # Convert timestamps to UTC
+        start = datetime.fromisoformat(start_timestamp).astimezone(timezone.utc)
+        end = datetime.fromisoformat(end_timestamp).astimezone(timezone.utc)
+    except ValueError:
+        raise ClientError("Invalid timestamp format. Use ISO 8601 format")
+    
+    # Check if start time is in the past
+    if start < datetime.now(timezone.utc):
+        raise ClientError("Start time must be in the future")
+    
+    # Check for valid time range
+    if start >= end:
+        raise ClientError("Start time must be before end time")
+    
+    # Check if same day
+    if start.date() != end.date():
+        raise ClientError("Reservation must be on the same day")
+    
+    # Check within limit
+    if (end - start).total_seconds() > 5400:
+        raise ClientError("Reservation must be less than 1.5 hours")
+    
+    # Check it is every 15 minutes
+    if start.minute % 15 != 0 or end.minute % 15 != 0:
+        raise ClientError("Reservation must be in 15-minute increments")
+    
+    return start, end
 
 
 def schedule(
@@ -171,49 +946,394 @@ def schedule(
     Returns:
         str: Reservation ID
     """
-    db = firestore.client()
+    db = get_db()
     
     # Validate input
+    start, end = __validate(space_id, start_timestamp, end_timestamp)
+    
+    # Check for conflicting reservations in the occupancy bitmap
+    if not occupancy.is_free(space_id, start, end):
+        raise ClientError("Time conflict with existing reservation", 409)
+    
+    # If no conflicts, create the reservation atomically
     try:
-        # Convert timestamps to UTC
-        start = datetime.fromisoformat(start_timestamp).astimezone(timezone.utc)
-        end = datetime.fromisoformat(end_timestamp).astimezone(timezone.utc)
-        
-        # Check if start time is in the past
-        if start < datetime.now(timezone.utc):
-            raise ClientError("Start time must be in the future")
-        
-        # Check for valid time range
-        if start >= end:
-            raise ClientError("Start time must be before end time")
-        
-        # Check if same day
-        if start.date() != end.date():
-            raise ClientError("Reservation must be on the same day")
-        
-        # Check within limit
-        if (end - start).total_seconds() > 5400:
-            raise ClientError("Reservation must be less than 1.5 hours")
-        
-        # Check it is every 15 minutes
-        if start.minute % 15 != 0 or end.minute % 15 != 0:
-            raise ClientError("Reservation must be in 15-minute increments")
-        
-        # TODO: Check for valid space_id
-        
-        # Check for conflicting reservations
-        reservations_ref = db.collection('reservations')
+        # The transaction's own time is its begin and commit round trips; its reads are timed inside
+        with stage('firestore-write'):
+            reservation_id = __create_reservation(db.transaction(), user_id, space_id, start, end)
+    except (api_exceptions.AlreadyExists, api_exceptions.Conflict):
+        # A concurrent booking created one of the slot locks first
+        raise ClientError("Time conflict with existing reservation", 409)
+    except ValueError:
+        # Concurrent bookings kept aborting the transaction until it ran out of attempts
+        raise ClientError("Reservation could not be completed due to concurrent bookings, please try again", 409)
+    
+    # The reservation, its slot locks and the user's index
+    count_writes(len(slot_ids(space_id, start, end)) + 2)
+    __track(reservation_id, space_id, start, end)
+    return reservation_id
+
+
+def __allocation_candidates(start: datetime, end: datetime, x: Optional[float], y: Optional[float], zone: Optional[str], strategy: str) -> List[str]:
+    """Ranks the free spaces for an allocation, best first, from the in-memory catalog and occupancy map."""
+    def accept(space_id: str) -> bool:
+        return occupancy.is_free(space_id, start, end) and (zone is None or catalog.get(space_id)['zone'] == zone)
+    
+    if strategy == 'nearest':
+        return [space['space_id'] for _, space in catalog.nearest(x, y, MAX_ALLOCATION_ATTEMPTS, accept)]
+    
+    # Best fit: book the space whose free run around the range is shortest, keeping long runs whole for longer bookings
+    day, first, count = to_slots(start, end)
+    candidates = []
+    for space_id in catalog.ids():
+        if zone is not None and catalog.get(space_id)['zone'] != zone:
+            continue
+        run = occupancy.free_run(space_id, day, first, count)
+        if run:
+            space = catalog.get(space_id)
+            distance = math.hypot(space['x'] - x, space['y'] - y) if x is not None else 0
+            candidates.append((run, distance, space_id))
+    return [space_id for _, _, space_id in heapq.nsmallest(MAX_ALLOCATION_ATTEMPTS, candidates)]
+
+
+def allocate(
+    user_id: str,
+    start_timestamp: str,
+    end_timestamp: str,
+    x: Optional[float] = None,
+    y: Optional[float] = None,
+    zone: Optional[str] = None,
+    strategy: Optional[str] = None
+) -> Tuple[str, str]:
+    """
+    Picks a free space for a time range and books it, in a single call.
+    Candidates are ranked from the in-memory space catalog and occupancy map, then booked in order
+    until one transaction commits, so a space taken by a concurrent booking only costs a retry on the next one.
+    
+    Args:
+        user_id (str): ID of the user making the reservation
+        start_timestamp (str): Start time of the reservation in ISO format
+        end_timestamp (str): End time of the reservation in ISO format
+        x (float, optional): X coordinate of the preferred location
+        y (float, optional): Y coordinate of the preferred location
+        zone (str, optional): Only consider spaces in this zone
+        strategy (str, optional): 'nearest' to the preferred location, or 'best_fit' for the space whose free time
+            around the range is shortest, which keeps long free runs for longer bookings.
+            Defaults to 'nearest' with a location and 'best_fit' without.
+    
+    Returns:
+        Tuple[str, str]: Reservation ID and the ID of the booked space
+    
+    Raises:
+        ClientError: If the request is invalid, or no space could be booked (409)
+    """
+    db = get_db()
+    start, end = __validate_range(start_timestamp, end_timestamp)
+    
+    if (x is None) != (y is None):
+        raise ClientError("Location needs both x and y")
+    strategy = strategy or ('nearest' if x is not None else 'best_fit')
+    if strategy not in ALLOCATION_STRATEGIES:
+        raise ClientError(f"Unknown strategy: {strategy}. Use one of: {', '.join(ALLOCATION_STRATEGIES)}")
+    if strategy == 'nearest' and x is None:
+        raise ClientError("The nearest strategy needs a location")
+    
+    for space_id in __allocation_candidates(start, end, x, y, zone, strategy):
+        try:
+            with stage('firestore-write'):
+                reservation_id = __create_reservation(db.transaction(), user_id, space_id, start, end)
+        except ClientError as e:
+            if e.code != 409:
+                raise
+            continue
+        except (api_exceptions.AlreadyExists, api_exceptions.Conflict, ValueError):
+            # Lost the space to a concurrent booking, try the next one
+            continue
+        count_writes(len(slot_ids(space_id, start, end)) + 2)
+        __track(reservation_id, space_id, start, end)
+        return reservation_id, space_id
+    
+    raise ClientError("No free space for this time range", 409)
+
+
+@firestore.transactional
+def __create_reservations(transaction, user_id: str, bookings: List[Tuple[int, str, datetime, datetime]]) -> Dict[int, Optional[str]]:
+    """
+    Create several reservations in Firestore inside one transaction.
+    All slot locks are read with a single get_all and conflicts are confirmed with one query per space,
+    then every booking without a conflict is written in the same commit, along with the user's index.
+
+    Args:
+        transaction (firestore.Transaction): Transaction to run the confirmation and writes in
+        user_id (str): ID of the user making the reservations
+        bookings (List[Tuple[int, str, datetime, datetime]]): (index, space_id, start, end) of each validated booking
+
+    Returns:
+        Dict[int, Optional[str]]: Reservation ID by booking index, or None if the booking conflicts
+    """
+    db = get_db()
+    reservations_ref = db.collection('reservations')
+    slots_ref = db.collection('reservation_slots')
+    
+    # Read every slot lock of the batch at once
+    slot_refs = {
+        index: [slots_ref.document(slot_id) for slot_id in slot_ids(space_id, start, end)]
+        for index, space_id, start, end in bookings
+    }
+    with stage('firestore-read'):
+        snapshots = list(transaction.get_all([slot_ref for refs in slot_refs.values() for slot_ref in refs]))
+    count_reads(len(snapshots))
+    locked = {snapshot.id for snapshot in snapshots if snapshot.exists}
+    
+    # Confirm against reservations without slot locks, one query over the batch's span per space
+    spans: Dict[str, Tuple[datetime, datetime]] = {}
+    for _, space_id, start, end in bookings:
+        span_start, span_end = spans.get(space_id, (start, end))
+        spans[space_id] = (min(span_start, start), max(span_end, end))
+    booked: Dict[str, List[Tuple[datetime, datetime]]] = {}
+    for space_id, (span_start, span_end) in spans.items():
         conflicts_query = reservations_ref\
             .where('space_id', '==', space_id)\
             .where('status', '==', 'active')\
-            .where('start_timestamp', '<', end)\
-            .where('end_timestamp', '>', start)
-        conflicting_reservations = list(conflicts_query.stream())
-        if conflicting_reservations:
-            raise ClientError("Time conflict with existing reservation", 409)
+            .where('start_timestamp', '<', span_end)\
+            .where('end_timestamp', '>', span_start)
+        with stage('firestore-read'):
+            conflicts = list(conflicts_query.stream(transaction=transaction))
+        count_reads(len(conflicts))
+        for doc in conflicts:
+            __track(doc.id, space_id, doc.get('start_timestamp'), doc.get('end_timestamp'))
+            booked.setdefault(space_id, []).append((doc.get('start_timestamp'), doc.get('end_timestamp')))
+    upcoming = __read_user_index(transaction, user_id, datetime.now(timezone.utc))
+    
+    # Write every booking that has no conflict
+    created: Dict[int, Optional[str]] = {}
+    for index, space_id, start, end in bookings:
+        if any(slot_ref.id in locked for slot_ref in slot_refs[index]) or \
+                any(other_start < end and other_end > start for other_start, other_end in booked.get(space_id, ())):
+            created[index] = None
+            continue
         
-        # If no conflicts, create the reservation
-        return __create_reservation(user_id, space_id, start, end)
+        reservation_ref = reservations_ref.document()
+        for slot_ref in slot_refs[index]:
+            transaction.create(slot_ref, {'reservation_id': reservation_ref.id, 'space_id': space_id})
+        transaction.set(reservation_ref, __reservation_data(user_id, space_id, start, end))
+        upcoming[reservation_ref.id] = __index_entry(space_id, start, end)
+        created[index] = reservation_ref.id
+    
+    if any(created.values()):
+        transaction.set(__user_index_ref(user_id), {'reservations': upcoming})
+    return created
+
+
+def schedule_batch(user_id: str, reservations: List[dict]) -> List[dict]:
+    """
+    Validates several reservations with the same rules as schedule() and creates the valid ones in one commit.
+    
+    Args:
+        user_id (str): ID of the user making the reservations
+        reservations (List[dict]): Requested reservations, each with space_id, start_timestamp and end_timestamp
+    
+    Returns:
+        List[dict]: One result per requested reservation, in order. Created reservations have
+            'status' 201 and an 'id'; rejected ones have an error 'status' and a 'message'.
+    
+    Raises:
+        ClientError: If the batch is empty or too large
+    
+    Example:
+        schedule_batch(user_id, [{'space_id': 'A1', 'start_timestamp': '2099-01-01T09:00:00Z', 'end_timestamp': '2099-01-01T10:00:00Z'}])
+        # [{'status': 201, 'id': 'abc123'}]
+    """
+    if not reservations:
+        raise ClientError("No reservations provided")
+    if len(reservations) > MAX_BATCH_SIZE:
+        raise ClientError(f"A batch can contain at most {MAX_BATCH_SIZE} reservations")
+    
+    db = get_db()
+    
+    results: List[Optional[dict]] = [None] * len(reservations)
+    bookings: List[Tuple[int, str, datetime, datetime]] = []
+    # Slots claimed by earlier bookings of this batch, by (space_id, day)
+    claimed: Dict[Tuple[str, date], int] = {}
+    
+    for index, item in enumerate(reservations):
+        try:
+            if not isinstance(item, dict) or not all(field in item for field in ('space_id', 'start_timestamp', 'end_timestamp')):
+                raise ClientError("Missing required fields")
+            
+            space_id = item['space_id']
+            start, end = __validate(space_id, item['start_timestamp'], item['end_timestamp'])
+            
+            # Check against existing reservations and the rest of the batch
+            day, first, count = to_slots(start, end)
+            mask = slot_mask(first, count)
+            if claimed.get((space_id, day), 0) & mask or not occupancy.is_free(space_id, start, end):
+                raise ClientError("Time conflict with existing reservation", 409)
+            claimed[(space_id, day)] = claimed.get((space_id, day), 0) | mask
+            
+            bookings.append((index, space_id, start, end))
+        except ClientError as e:
+            results[index] = {'status': e.code, 'message': e.message}
+    
+    if bookings:
+        try:
+            with stage('firestore-write'):
+                created = __create_reservations(db.transaction(), user_id, bookings)
+        except (api_exceptions.AlreadyExists, api_exceptions.Conflict, ValueError):
+            # Concurrent bookings won the race for some slot, so nothing in the batch was written
+            created = {}
         
+        if any(created.values()):
+            count_writes(1)
+        for index, space_id, start, end in bookings:
+            reservation_id = created.get(index)
+            if reservation_id is None:
+                results[index] = {'status': 409, 'message': "Time conflict with existing reservation"}
+            else:
+                count_writes(len(slot_ids(space_id, start, end)) + 1)
+                __track(reservation_id, space_id, start, end)
+                results[index] = {'status': 201, 'id': reservation_id}
+    
+    return results
+
+
+def __parse_day_range(start_timestamp: str, end_timestamp: str) -> Tuple[datetime, datetime]:
+    """Parses a time range that must fall within one UTC day."""
+    try:
+        start = datetime.fromisoformat(start_timestamp).astimezone(timezone.utc)
+        end = datetime.fromisoformat(end_timestamp).astimezone(timezone.utc)
     except ValueError:
         raise ClientError("Invalid timestamp format. Use ISO 8601 format")
+    
+    if start >= end:
+        raise ClientError("Start time must be before end time")
+    if start.date() != end.date():
+        raise ClientError("Range must be on the same day")
+    return start, end
+
+
+def get_free_spaces(start_timestamp: str, end_timestamp: str) -> List[str]:
+    """
+    Finds every parking space with no active reservation in a time range.
+    Answered from the in-memory occupancy map without querying Firestore.
+    
+    Args:
+        start_timestamp (str): Start of the range in ISO format
+        end_timestamp (str): End of the range in ISO format, on the same day as the start
+    
+    Returns:
+        List[str]: IDs of the free spaces
+    
+    Raises:
+        ClientError: If the timestamps are invalid or not on the same day
+    """
+    start, end = __parse_day_range(start_timestamp, end_timestamp)
+    return occupancy.free_spaces(start, end)
+
+
+def get_nearest_free_spaces(x: float, y: float, count: int, start_timestamp: str, end_timestamp: str) -> List[dict]:
+    """
+    Finds the free parking spaces closest to a point for a time range.
+    Answered from the spatial index of the space catalog and the in-memory occupancy map,
+    so only the spaces around the point are looked at.
+    
+    Args:
+        x (float): X coordinate of the point
+        y (float): Y coordinate of the point
+        count (int): Most spaces to return, from 1 to MAX_NEAREST
+        start_timestamp (str): Start of the range in ISO format
+        end_timestamp (str): End of the range in ISO format, on the same day as the start
+    
+    Returns:
+        List[dict]: The spaces, closest first, each with its distance to the point
+    
+    Raises:
+        ClientError: If the count or timestamps are invalid
+    """
+    if not 1 <= count <= MAX_NEAREST:
+        raise ClientError(f"Count must be between 1 and {MAX_NEAREST}")
+    start, end = __parse_day_range(start_timestamp, end_timestamp)
+    
+    nearest = catalog.nearest(x, y, count, accept=lambda space_id: occupancy.is_free(space_id, start, end))
+    return [{**space, 'distance': distance} for distance, space in nearest]
+
+
+def has_upcoming_reservations(space_id: str) -> bool:
+    """
+    Checks whether a space has an active reservation that has not ended yet.
+    The in-memory index only sees the bookings of this process since it started, so it can
+    confirm a reservation but not rule one out; a negative answer is checked with a query.
+    
+    Args:
+        space_id (str): ID of the space
+    
+    Returns:
+        bool: True if the space is reserved now or later
+    """
+    now = datetime.now(timezone.utc)
+    if interval_index.has_reservations_after(space_id, now):
+        return True
+    
+    query = get_db().collection('reservations')\
+        .where('space_id', '==', space_id)\
+        .where('status', '==', 'active')\
+        .where('end_timestamp', '>', now)\
+        .limit(1)
+    with stage('firestore-read'):
+        docs = list(query.stream())
+    count_reads(len(docs))
+    return bool(docs)
+
+
+def get_availability(day: str, from_time: Optional[str] = None, to_time: Optional[str] = None, encoding: str = 'bits') -> dict:
+    """
+    Builds the free/busy matrix of every parking space for a window of one day.
+    Answered from the in-memory occupancy map without querying Firestore.
+    
+    Args:
+        day (str): UTC date in ISO format (YYYY-MM-DD)
+        from_time (str, optional): Start of the window as HH:MM (UTC). Defaults to the start of the day.
+        to_time (str, optional): End of the window as HH:MM (UTC). Defaults to the end of the day.
+        encoding (str, optional): 'bits' for one character per slot ('1' is busy), or
+            'ranges' for [first slot, length] pairs of busy runs. Defaults to 'bits'.
+    
+    Returns:
+        dict: The window and the encoded occupancy of each space
+    
+    Raises:
+        ClientError: If the date, times or encoding are invalid
+    
+    Example:
+        get_availability('2099-01-01', '09:00', '10:00')
+        # {'date': '2099-01-01', 'from': '09:00', 'to': '10:00', 'slot_minutes': 15, 'spaces': {'A1': '0110', ...}}
+    """
+    def parse_slot(value: str) -> int:
+        hours, minutes = value.split(':')
+        slot, remainder = divmod(int(hours) * 60 + int(minutes), SLOT_MINUTES)
+        if remainder or not 0 <= slot <= SLOTS_PER_DAY:
+            raise ValueError(value)
+        return slot
+    
+    try:
+        window_day = date.fromisoformat(day)
+        first = parse_slot(from_time) if from_time else 0
+        last = parse_slot(to_time) if to_time else SLOTS_PER_DAY
+    except ValueError:
+        raise ClientError("Invalid window. Use an ISO 8601 date and HH:MM times in 15-minute increments")
+    
+    if first >= last:
+        raise ClientError("Window start must be before window end")
+    if encoding not in ('bits', 'ranges'):
+        raise ClientError("Encoding must be 'bits' or 'ranges'")
+    
+    count = last - first
+    encode = to_bitstring if encoding == 'bits' else to_ranges
+    return {
+        'date': window_day.isoformat(),
+        'from': '%02d:%02d' % divmod(first * SLOT_MINUTES, 60),
+        'to': '%02d:%02d' % divmod(last * SLOT_MINUTES, 60),
+        'slot_minutes': SLOT_MINUTES,
+        'spaces': {
+            space_id: encode(bitmap, count)
+            for space_id, bitmap in occupancy.window(window_day, first, count).items()
+        }
+    }
@@ -0,0 +1,294 @@
+# database/spaces.py
+import math
+import re
+from threading import RLock
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from google.api_core import exceptions as api_exceptions
+from google.cloud.firestore_v1.watch import ChangeType
+from exceptions import ClientError
+from database.firestore import get_db
+from database.spatial import GridIndex
+from typedef import parking_data
+
+# Space IDs are part of the slot lock IDs, e.g. 'A1_2099-01-01_36', so they cannot contain underscores
+SPACE_ID_PATTERN = re.compile(r'^[A-Za-z0-9-]{1,32}$')
+DEFAULT_CELL_SIZE = 0.05
+# Marks that the default layout was seeded, so a catalog emptied on purpose stays empty
+SEED_MARKER = ('meta', 'spaces_seeded')
+
+
+def _natural_key(space_id: str) -> list:
+    """Sort key putting 'A2' before 'A10'."""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', space_id)]
+
+
+def _to_space(space_id: str, data: Dict) -> Dict:
+    """Builds the public representation of a space from its Firestore document."""
+    return {'space_id': space_id, 'x': data['x'], 'y': data['y'], 'zone': data.get('zone')}
+
+
+class SpaceCatalog:
+    """
+    In-memory copy of the 'spaces' collection, with a grid index over the coordinates of the spaces.
+
+    It is loaded once at startup, then kept up to date by the writes of this process and by a
+    snapshot listener that applies the changes made by other processes as they happen.
+
+    Attributes:
+        version (int): Incremented by every change, so data derived from the catalog can be cached.
+    """
+    def __init__(self, cell_size: float = DEFAULT_CELL_SIZE):
+        self._spaces: Dict[str, Dict] = {}
+        self._ids: List[str] = []
+        self._grid = GridIndex(cell_size)
+        self._listeners: List[Callable[[List[str]], None]] = []
+        self._watch = None
+        self._lock = RLock()
+        self.version = 0
+
+    def load(self, spaces: Iterable[Dict], cell_size: Optional[float] = None) -> None:
+        """
+        Replaces the contents of the catalog.
+
+        Args:
+            spaces (Iterable[Dict]): Spaces with their space_id, x, y and zone
+            cell_size (float, optional): New cell size of the grid index. Defaults to keeping the current one.
+        """
+        with self._lock:
+            self._spaces = {}
+            self._grid = GridIndex(cell_size or self._grid.cell_size)
+            for space in spaces:
+                self._put(space)
+            self._changed()
+
+    def put(self, space: Dict) -> None:
+        """Adds or replaces a space."""
+        with self._lock:
+            self._put(space)
+            self._changed()
+
+    def remove(self, space_id: str) -> None:
+        """Removes a space if it is in the catalog."""
+        with self._lock:
+            if self._spaces.pop(space_id, None) is not None:
+                self._grid.remove(space_id)
+                self._changed()
+
+    def get(self, space_id: str) -> Optional[Dict]:
+        return self._spaces.get(space_id)
+
+    def __contains__(self, space_id: str) -> bool:
+        return space_id in self._spaces
+
+    def __len__(self) -> int:
+        return len(self._spaces)
+
+    def ids(self) -> List[str]:
+        """Returns the IDs of every space, in natural order."""
+        return self._ids
+
+    def to_dict(self) -> Dict[str, Dict]:
+        """Returns every space by ID, in natural order."""
+        with self._lock:
+            return {space_id: self._spaces[space_id] for space_id in self._ids}
+
+    def nearest(self, x: float, y: float, count: int, accept: Optional[Callable[[str], bool]] = None) -> List[Tuple[float, Dict]]:
+        """
+        Finds the spaces closest to a point.
+
+        Args:
+            x (float): X coordinate of the point
+            y (float): Y coordinate of the point
+            count (int): Most spaces to return
+            accept (Callable[[str], bool], optional): Filter on space IDs. Defaults to accepting every space.
+
+        Returns:
+            List[Tuple[float, Dict]]: (distance, space) pairs, closest first
+        """
+        with self._lock:
+            return [(distance, self._spaces[space_id]) for distance, space_id in self._grid.nearest(x, y, count, accept)]
+
+    def add_listener(self, callback: Callable[[List[str]], None]) -> None:
+        """Registers a function called with the new list of space IDs after every change."""
+        self._listeners.append(callback)
+        callback(self._ids)
+
+    def watch(self, query) -> None:
+        """Applies the changes to a Firestore query of spaces as they happen, replacing any previous listener."""
+        with self._lock:
+            self.unwatch()
+            self._watch = query.on_snapshot(self._on_snapshot)
+
+    def unwatch(self) -> None:
+        """Stops the snapshot listener."""
+        with self._lock:
+            watch, self._watch = self._watch, None
+        if watch is not None:
+            watch.unsubscribe()
+
+    def _put(self, space: Dict) -> None:
+        self._spaces[space['space_id']] = space
+        self._grid.add(space['space_id'], space['x'], space['y'])
+
+    def _changed(self) -> None:
+        self._ids = sorted(self._spaces, key=_natural_key)
+        self.version += 1
+        for callback in self._listeners:
+            callback(self._ids)
+
+    def _on_snapshot(self, documents, changes, read_time) -> None:
+        """Listener callback: applies the changed documents."""
+        with self._lock:
+            for change in changes:
+                document = change.document
+                if change.type == ChangeType.REMOVED:
+                    if self._spaces.pop(document.id, None) is not None:
+                        self._grid.remove(document.id)
+                else:
+                    self._put(_to_space(document.id, document.to_dict()))
+            if changes:
+                self._changed()
+
+
+# Parking spaces of this process, used to validate, list and search spaces without a query
+catalog = SpaceCatalog()
+
+
+def load_spaces(cell_size: Optional[float] = None) -> None:
+    """
+    Loads every space into the catalog, and starts listening for changes made by other processes.
+    The collection is seeded with the default layout in typedef.parking_data once, the first time
+    it is found empty; the seed marker document keeps it from coming back after every space is deleted.
+
+    Args:
+        cell_size (float, optional): Cell size of the grid index, near the typical spacing of the spaces.
+            Defaults to keeping the current one.
+    """
+    db = get_db()
+    collection = db.collection('spaces')
+    spaces = [_to_space(doc.id, doc.to_dict()) for doc in collection.stream()]
+
+    marker = db.collection(SEED_MARKER[0]).document(SEED_MARKER[1])
+    if not marker.get().exists:
+        batch = db.batch()
+        # Collections that predate the marker already hold the operator's layout
+        if not spaces:
+            for space in parking_data.values():
+                spaces.append({'space_id': space['space_id'], 'x': space['x'], 'y': space['y'], 'zone': None})
+                batch.set(collection.document(space['space_id']), {'x': space['x'], 'y': space['y'], 'zone': None})
+        batch.set(marker, {'seeded': True})
+        batch.commit()
+
+    catalog.load(spaces, cell_size)
+    catalog.watch(collection)
+
+
+def __parse_coordinate(data: Dict, field: str) -> float:
+    value = data.get(field)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ClientError(f'"{field}" must be a number')
+    return float(value)
+
+
+def __parse_zone(data: Dict) -> Optional[str]:
+    zone = data.get('zone')
+    if zone is not None and (not isinstance(zone, str) or len(zone) > 64):
+        raise ClientError('"zone" must be a string of at most 64 characters')
+    return zone
+
+
+def get_space(space_id: str) -> Dict:
+    """
+    Gets a parking space from the catalog.
+
+    Args:
+        space_id (str): ID of the space
+
+    Returns:
+        Dict: The space
+
+    Raises:
+        ClientError: If the space does not exist
+    """
+    space = catalog.get(space_id)
+    if space is None:
+        raise ClientError(f"Space {space_id} not found", 404)
+    return space
+
+
+def create_space(data: Dict) -> Dict:
+    """
+    Adds a parking space.
+
+    Args:
+        data (Dict): space_id, x and y of the space, and optionally its zone
+
+    Returns:
+        Dict: The created space
+
+    Raises:
+        ClientError: If a field is invalid, or the space already exists
+    """
+    space_id = data.get('space_id')
+    if not isinstance(space_id, str) or not SPACE_ID_PATTERN.match(space_id):
+        raise ClientError('"space_id" must be 1 to 32 letters, digits or dashes')
+    space = {
+        'space_id': space_id,
+        'x': __parse_coordinate(data, 'x'),
+        'y': __parse_coordinate(data, 'y'),
+        'zone': __parse_zone(data),
+    }
+
+    try:
+        get_db().collection('spaces').document(space_id).create({'x': space['x'], 'y': space['y'], 'zone': space['zone']})
+    except api_exceptions.AlreadyExists:
+        raise ClientError(f"Space {space_id} already exists", 409)
+
+    catalog.put(space)
+    return space
+
+
+def update_space(space_id: str, data: Dict) -> Dict:
+    """
+    Moves a parking space or changes its zone.
+
+    Args:
+        space_id (str): ID of the space
+        data (Dict): New x, y or zone; fields that are left out keep their value
+
+    Returns:
+        Dict: The updated space
+
+    Raises:
+        ClientError: If a field is invalid, or the space does not exist
+    """
+    space = dict(get_space(space_id))
+    for field in ('x', 'y'):
+        if field in data:
+            space[field] = __parse_coordinate(data, field)
+    if 'zone' in data:
+        space['zone'] = __parse_zone(data)
+
+    try:
+        get_db().collection('spaces').document(space_id).update({'x': space['x'], 'y': space['y'], 'zone': space['zone']})
+    except api_exceptions.NotFound:
+        catalog.remove(space_id)
+        raise ClientError(f"Space {space_id} not found", 404)
+
+    catalog.put(space)
+    return space
+
+
+def delete_space(space_id: str) -> None:
+    """
+    Removes a parking space.
+
+    Args:
+        space_id (str): ID of the space
+
+    Raises:
+        ClientError: If the space does not exist
+    """
+    get_space(space_id)
+    get_db().collection('spaces').document(space_id).delete()
+    catalog.remove(space_id)
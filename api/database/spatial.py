@@ -0,0 +1,127 @@
+# database/spatial.py
+import heapq
+import math
+from threading import RLock
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+# (column, row) of a grid cell
+Cell = Tuple[int, int]
+
+
+class GridIndex:
+    """
+    Uniform grid over the x/y coordinates of the parking spaces.
+
+    Each space is filed under the square cell containing it, so a nearest-neighbour search only
+    visits the rings of cells around the query point until no unvisited cell can hold anything closer.
+    With a cell size near the typical spacing of the spaces, that is a handful of cells whatever the size of the lot.
+
+    Attributes:
+        cell_size (float): Side of a cell, in the units of the coordinates.
+    """
+    def __init__(self, cell_size: float):
+        if cell_size <= 0:
+            raise ValueError("Cell size must be positive")
+        self.cell_size = cell_size
+        self._cells: Dict[Cell, Set[str]] = {}
+        self._points: Dict[str, Tuple[float, float]] = {}
+        # Bounding box of the occupied cells, which caps how far a search spreads
+        self._bounds: Optional[Tuple[int, int, int, int]] = None
+        self._lock = RLock()
+
+    def _cell(self, x: float, y: float) -> Cell:
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def add(self, space_id: str, x: float, y: float) -> None:
+        """Adds a space, or moves it if it is already indexed."""
+        with self._lock:
+            self.remove(space_id)
+            cell = self._cell(x, y)
+            self._cells.setdefault(cell, set()).add(space_id)
+            self._points[space_id] = (x, y)
+            column, row = cell
+            if self._bounds is None:
+                self._bounds = (column, row, column, row)
+            else:
+                min_column, min_row, max_column, max_row = self._bounds
+                self._bounds = (min(min_column, column), min(min_row, row), max(max_column, column), max(max_row, row))
+
+    def remove(self, space_id: str) -> None:
+        """Removes a space if it is indexed."""
+        with self._lock:
+            point = self._points.pop(space_id, None)
+            if point is None:
+                return
+            cell = self._cell(*point)
+            members = self._cells[cell]
+            members.discard(space_id)
+            if not members:
+                del self._cells[cell]
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def nearest(self, x: float, y: float, count: int, accept: Optional[Callable[[str], bool]] = None) -> List[Tuple[float, str]]:
+        """
+        Finds the spaces closest to a point.
+
+        Args:
+            x (float): X coordinate of the point
+            y (float): Y coordinate of the point
+            count (int): Most spaces to return
+            accept (Callable[[str], bool], optional): Filter on space IDs, e.g. whether the space is free.
+                Only called for spaces closer than the current candidates. Defaults to accepting every space.
+
+        Returns:
+            List[Tuple[float, str]]: (distance, space_id) pairs, closest first
+        """
+        if count <= 0:
+            return []
+        with self._lock:
+            if self._bounds is None:
+                return []
+            column, row = self._cell(x, y)
+            bounds = self._bounds
+            min_column, min_row, max_column, max_row = bounds
+            # Rings closer than the occupied cells are empty, and rings past them hold nothing more
+            first_ring = max(min_column - column, column - max_column, min_row - row, row - max_row, 0)
+            last_ring = max(column - min_column, max_column - column, row - min_row, max_row - row, 0)
+
+            # Max-heap of the best candidates so far, as (-distance, space_id)
+            best: List[Tuple[float, str]] = []
+            for ring in range(first_ring, last_ring + 1):
+                for cell in self._ring(column, row, ring, bounds):
+                    for space_id in self._cells.get(cell, ()):
+                        space_x, space_y = self._points[space_id]
+                        distance = math.hypot(space_x - x, space_y - y)
+                        key = (-distance, space_id)
+                        if len(best) == count and key <= best[0]:
+                            continue
+                        if accept is not None and not accept(space_id):
+                            continue
+                        if len(best) < count:
+                            heapq.heappush(best, key)
+                        else:
+                            heapq.heapreplace(best, key)
+                # Every cell of the next ring is at least `ring` cells away from the point
+                if len(best) == count and -best[0][0] <= ring * self.cell_size:
+                    break
+            return sorted((-negative, space_id) for negative, space_id in best)
+
+    @staticmethod
+    def _ring(column: int, row: int, ring: int, bounds: Tuple[int, int, int, int]) -> Iterator[Cell]:
+        """Yields the cells at Chebyshev distance `ring` from a cell, within the bounds."""
+        min_column, min_row, max_column, max_row = bounds
+        if ring == 0:
+            yield column, row
+            return
+        columns = range(max(column - ring, min_column), min(column + ring, max_column) + 1)
+        for edge_row in (row - ring, row + ring):
+            if min_row <= edge_row <= max_row:
+                for edge_column in columns:
+                    yield edge_column, edge_row
+        rows = range(max(row - ring + 1, min_row), min(row + ring - 1, max_row) + 1)
+        for edge_column in (column - ring, column + ring):
+            if min_column <= edge_column <= max_column:
+                for edge_row in rows:
+                    yield edge_column, edge_row
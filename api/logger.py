@@ -0,0 +1,151 @@
+# logger.py
+"""
+Structured logging for the API.
+
+Records of the 'reserveease' loggers are written as JSON lines with the time, level, logger, message,
+the request they were logged in, and any `fields` passed through `extra`. A request only puts its
+records on a bounded queue; a background thread formats and writes them, so no request waits on the
+output stream. When the queue is full, records are dropped and counted instead of blocking.
+
+DEBUG records are sampled per request with LOG_DEBUG_SAMPLE_RATE, so a sampled request keeps all of
+its debug events. Below LOG_LEVEL, callers skip building a record at all.
+
+Usage:
+    logger = get_logger(__name__)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Filtering reservations", extra={'fields': {'operator': op}})
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+from flask import Flask, g, has_request_context, request
+
+ROOT_LOGGER = 'reserveease'
+
+# Queue handler of the process, shared by every app so there is a single writer thread
+_handler: Optional['DroppingQueueHandler'] = None
+_listener: Optional[QueueListener] = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Returns the logger of a module, under the 'reserveease' logger that init_logging() configures."""
+    return logging.getLogger(f'{ROOT_LOGGER}.{name}')
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line."""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'request', None):
+            entry['request'] = record.request
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, separators=(',', ':'))
+
+
+class StderrHandler(logging.StreamHandler):
+    """Writes to whatever sys.stderr is when a record is written, e.g. after a test runner replaces it."""
+    def __init__(self):
+        logging.Handler.__init__(self)
+
+    @property
+    def stream(self):
+        return sys.stderr
+
+
+class DebugSampler(logging.Filter):
+    """
+    Keeps a fraction of the DEBUG records. Inside a request the decision is made once and applies
+    to every debug record of the request; records of higher levels are always kept.
+
+    Attributes:
+        rate (float): Fraction of requests whose debug records are kept, from 0 to 1.
+    """
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        if not has_request_context():
+            return random.random() < self.rate
+        sampled = g.get('log_sampled')
+        if sampled is None:
+            sampled = g.log_sampled = random.random() < self.rate
+        return sampled
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Queue handler that never blocks the logging thread: records that do not fit in the queue are dropped.
+
+    Attributes:
+        sampler (DebugSampler): Sampling of the DEBUG records, applied before they are queued.
+        dropped (int): Number of records dropped because the queue was full.
+    """
+    def __init__(self, records: queue.Queue, debug_sample_rate: float = 1.0):
+        super().__init__(records)
+        self.sampler = DebugSampler(debug_sample_rate)
+        self.addFilter(self.sampler)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The message is merged here, since its arguments may change once the caller moves on;
+        # everything else is formatted on the writer thread
+        record.msg = record.getMessage()
+        record.args = None
+        if has_request_context():
+            record.request = {'method': request.method, 'path': request.path}
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def init_logging(app: Flask) -> DroppingQueueHandler:
+    """
+    Sends the records of the 'reserveease' loggers to stderr through the queue, with the level and
+    sampling of the app's config: LOG_LEVEL, LOG_DEBUG_SAMPLE_RATE and LOG_QUEUE_SIZE.
+    The queue and its writer thread are started by the first app of the process and shared by the next ones.
+
+    Args:
+        app (Flask): The app
+
+    Returns:
+        DroppingQueueHandler: The handler of the queue, also stored as app.extensions['log_handler']
+    """
+    global _handler, _listener
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.setLevel(app.config['LOG_LEVEL'])
+    logger.propagate = False
+    if _handler is None:
+        records = queue.Queue(app.config['LOG_QUEUE_SIZE'])
+        output = StderrHandler()
+        output.setFormatter(JSONFormatter())
+        _listener = QueueListener(records, output, respect_handler_level=True)
+        _listener.start()
+        # Writes whatever is still queued when the process exits
+        atexit.register(_listener.stop)
+        _handler = DroppingQueueHandler(records)
+        logger.addHandler(_handler)
+    _handler.sampler.rate = app.config['LOG_DEBUG_SAMPLE_RATE']
+    app.extensions['log_handler'] = _handler
+    return _handler
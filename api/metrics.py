@@ -0,0 +1,276 @@
+# metrics.py
+"""
+In-process request instrumentation.
+
+Code serving a request times its stages with stage() and reports the Firestore documents it reads
+and writes with count_reads() and count_writes(). Each response carries a Server-Timing header with
+the stages of its request, and the totals of the process are exposed in the Prometheus text format
+by the /metrics route. Outside an app with metrics enabled, these calls do nothing.
+"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+from flask import Flask, Response, current_app, g, has_app_context, request
+
+T = TypeVar('T')
+
+# Upper bounds of the duration histograms, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Time spent in the stages nested in the innermost running stage, so an outer stage only counts its own time
+_nested: ContextVar[Optional[List[float]]] = ContextVar('nested_stage_time', default=None)
+
+# (labels, value) samples of a metric family
+Samples = List[Tuple[Dict[str, str], float]]
+
+
+class Histogram:
+    """Cumulative histogram of durations, in the shape Prometheus expects."""
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str, labels: Dict[str, str]) -> List[Tuple[str, Dict[str, str], float]]:
+        """Returns the _bucket, _sum and _count samples of the histogram."""
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            samples.append((f'{name}_bucket', {**labels, 'le': f'{bound:g}'}, cumulative))
+        samples.append((f'{name}_bucket', {**labels, 'le': '+Inf'}, self.count))
+        samples.append((f'{name}_sum', labels, self.sum))
+        samples.append((f'{name}_count', labels, self.count))
+        return samples
+
+
+class RequestTiming:
+    """
+    Stages and Firestore document counts of one request.
+
+    Attributes:
+        started (float): perf_counter() when the request started.
+        stages (Dict[str, float]): Seconds spent in each stage, in the order the stages first ran.
+        reads (int): Firestore documents read.
+        writes (int): Firestore documents written.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.reads = 0
+        self.writes = 0
+
+    def server_timing(self, total: float) -> str:
+        """
+        Formats the request as a Server-Timing header value, with durations in milliseconds.
+
+        Args:
+            total (float): Seconds from the start of the request to the response
+        """
+        metrics = [f'{name};dur={seconds * 1000:.3f}' for name, seconds in self.stages.items()]
+        if self.reads or self.writes:
+            metrics.append(f'firestore-reads;desc="{self.reads}"')
+            metrics.append(f'firestore-writes;desc="{self.writes}"')
+        metrics.append(f'total;dur={total * 1000:.3f}')
+        return ', '.join(metrics)
+
+
+class Metrics:
+    """
+    Totals of the process: request and stage duration histograms, and Firestore document counters.
+    Shared by every request, so updates are serialized by a lock.
+    """
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self._requests: Dict[Tuple[str, str, str], Histogram] = {}
+        self._stages: Dict[str, Histogram] = {}
+        self._documents = {'read': 0, 'write': 0}
+        self._lock = Lock()
+
+    def observe_request(self, endpoint: str, method: str, status: int, seconds: float) -> None:
+        """Records the duration of a request, by route rule, method and status code."""
+        key = (endpoint, method, str(status))
+        with self._lock:
+            histogram = self._requests.get(key)
+            if histogram is None:
+                histogram = self._requests[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def observe_stage(self, name: str, seconds: float) -> None:
+        """Records the time spent in a stage."""
+        with self._lock:
+            histogram = self._stages.get(name)
+            if histogram is None:
+                histogram = self._stages[name] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def count_documents(self, operation: str, count: int) -> None:
+        """Adds to the 'read' or 'write' document counter."""
+        with self._lock:
+            self._documents[operation] += count
+
+    def render(self, extra: Iterable[Tuple[str, str, str, Samples]] = ()) -> str:
+        """
+        Formats every metric in the Prometheus text exposition format.
+
+        Args:
+            extra (Iterable[Tuple[str, str, str, Samples]]): More families to include, as
+                (name, type, help, samples), e.g. gauges read from the caches
+
+        Returns:
+            str: The exposition
+        """
+        with self._lock:
+            requests = [
+                sample
+                for (endpoint, method, status), histogram in sorted(self._requests.items())
+                for sample in histogram.samples('reserveease_request_duration_seconds', {'endpoint': endpoint, 'method': method, 'status': status})
+            ]
+            stages = [
+                sample
+                for name, histogram in sorted(self._stages.items())
+                for sample in histogram.samples('reserveease_stage_duration_seconds', {'stage': name})
+            ]
+            documents = [({'operation': operation}, count) for operation, count in self._documents.items()]
+
+        lines = []
+        _family(lines, 'reserveease_request_duration_seconds', 'histogram', 'Time to build each response, by route', requests)
+        _family(lines, 'reserveease_stage_duration_seconds', 'histogram', 'Time spent in each stage of the requests', stages)
+        _family(lines, 'reserveease_firestore_documents_total', 'counter', 'Firestore documents read and written',
+                [('reserveease_firestore_documents_total', labels, value) for labels, value in documents])
+        for name, kind, help_text, samples in extra:
+            _family(lines, name, kind, help_text, [(name, labels, value) for labels, value in samples])
+        return '\n'.join(lines) + '\n'
+
+
+def _family(lines: List[str], name: str, kind: str, help_text: str, samples: List[Tuple[str, Dict[str, str], float]]) -> None:
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {kind}')
+    for sample_name, labels, value in samples:
+        if labels:
+            label_text = ','.join(f'{key}="{_escape(str(label))}"' for key, label in labels.items())
+            lines.append(f'{sample_name}{{{label_text}}} {_number(value)}')
+        else:
+            lines.append(f'{sample_name} {_number(value)}')
+
+
+def _number(value: float) -> str:
+    # Counters keep every digit, which the shortest float formats would round away
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+def _escape(label: str) -> str:
+    return label.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _metrics() -> Optional[Metrics]:
+    return current_app.extensions.get('metrics') if has_app_context() else None
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Times a block as a stage of the current request and of the process totals.
+    Stages nested in another are subtracted from it, so each moment is only counted once.
+
+    Args:
+        name (str): Stage name, e.g. 'auth' or 'firestore-read'
+
+    Usage:
+        with stage('firestore-read'):
+            docs = list(query.stream())
+    """
+    metrics = _metrics()
+    if metrics is None:
+        yield
+        return
+    nested = [0.0]
+    token = _nested.set(nested)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        _nested.reset(token)
+        enclosing = _nested.get()
+        if enclosing is not None:
+            enclosing[0] += elapsed
+        own = elapsed - nested[0]
+        metrics.observe_stage(name, own)
+        timing: Optional[RequestTiming] = g.get('request_timing')
+        if timing is not None:
+            timing.stages[name] = timing.stages.get(name, 0.0) + own
+
+
+def count_reads(count: int) -> None:
+    """Records Firestore documents read by the current request."""
+    __count('read', count)
+
+
+def count_writes(count: int) -> None:
+    """Records Firestore documents written by the current request."""
+    __count('write', count)
+
+
+def __count(operation: str, count: int) -> None:
+    metrics = _metrics()
+    if metrics is None or not count:
+        return
+    metrics.count_documents(operation, count)
+    timing: Optional[RequestTiming] = g.get('request_timing')
+    if timing is not None:
+        if operation == 'read':
+            timing.reads += count
+        else:
+            timing.writes += count
+
+
+def counted(documents: Iterable[T]) -> Iterator[T]:
+    """Passes documents through lazily, counting each one as read."""
+    for document in documents:
+        count_reads(1)
+        yield document
+
+
+def init_metrics(app: Flask) -> Metrics:
+    """
+    Starts collecting metrics for the requests of an app.
+
+    Args:
+        app (Flask): The app. SERVER_TIMING_ENABLED controls the Server-Timing header.
+
+    Returns:
+        Metrics: The totals of the process, also stored as app.extensions['metrics']
+    """
+    metrics = app.extensions['metrics'] = Metrics()
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    return metrics
+
+
+def _start_request() -> None:
+    g.request_timing = RequestTiming()
+
+
+def _finish_request(response: Response) -> Response:
+    timing: Optional[RequestTiming] = g.pop('request_timing', None)
+    if timing is None:
+        return response
+    total = time.perf_counter() - timing.started
+    # Routes are labelled by their rule, which keeps the number of series bounded
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    current_app.extensions['metrics'].observe_request(endpoint, request.method, response.status_code, total)
+    if current_app.config['SERVER_TIMING_ENABLED']:
+        response.headers['Server-Timing'] = timing.server_timing(total)
+    return response
@@ -0,0 +1,335 @@
+# api/routes/availability.py
+import math
+import database.reservations
+from flask import Blueprint, Response, abort, current_app, request, jsonify, stream_with_context
+from encoding import dumps
+from exceptions import ClientError
+from logger import get_logger
+
+availability_bp = Blueprint('availability_bp', __name__)
+logger = get_logger(__name__)
+
+@availability_bp.route('/availability', methods=['GET'])
+def get_availability():
+    """
+    Get the free/busy matrix of every parking space for a window of one day
+    ---
+    get:
+        summary: Get lot availability in one call
+        parameters:
+            - in: query
+              name: date
+              required: true
+              schema:
+                type: string
+                format: date
+              description: UTC date of the window
+            - in: query
+              name: from
+              schema:
+                type: string
+              description: Start of the window as HH:MM (UTC), in 15-minute increments. Defaults to 00:00.
+            - in: query
+              name: to
+              schema:
+                type: string
+              description: End of the window as HH:MM (UTC), in 15-minute increments. Defaults to 24:00.
+            - in: query
+              name: encoding
+              schema:
+                type: string
+                enum: [bits, ranges]
+              description: "'bits' for one character per slot ('1' is busy) or 'ranges' for [first slot, length] pairs of busy runs. Defaults to 'bits'."
+        responses:
+            200:
+                description: Occupancy of every space in the window
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                date:
+                                    type: string
+                                from:
+                                    type: string
+                                to:
+                                    type: string
+                                slot_minutes:
+                                    type: integer
+                                spaces:
+                                    type: object
+                                    description: Encoded occupancy by space_id
+            400:
+                description: Missing or invalid window
+    """
+    try:
+        day = request.args.get('date')
+        if not day:
+            raise ClientError('Missing required parameter: "date"', 400)
+        
+        availability = database.reservations.get_availability(
+            day=day,
+            from_time=request.args.get('from'),
+            to_time=request.args.get('to'),
+            encoding=request.args.get('encoding', 'bits')
+        )
+        return jsonify(availability), 200
+
+    except ClientError as e:
+        return jsonify({
+            'message': e.message
+        }), e.code
+
+    except Exception as e:
+        logger.exception("Unhandled error")
+        abort(500, description=str(e))
+
+
+@availability_bp.route('/availability/free', methods=['GET'])
+def get_free_spaces():
+    """
+    Get every parking space that is free for a time range
+    ---
+    get:
+        summary: Get free parking spaces
+        parameters:
+            - in: query
+              name: start_timestamp
+              required: true
+              schema:
+                type: string
+                format: date-time
+              description: ISO-formatted start of the range
+            - in: query
+              name: end_timestamp
+              required: true
+              schema:
+                type: string
+                format: date-time
+              description: ISO-formatted end of the range, on the same day as the start
+        responses:
+            200:
+                description: IDs of the free spaces
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                spaces:
+                                    type: array
+                                    items:
+                                        type: string
+            400:
+                description: Missing or invalid timestamps
+    """
+    try:
+        start_timestamp = request.args.get('start_timestamp')
+        end_timestamp = request.args.get('end_timestamp')
+        if not start_timestamp or not end_timestamp:
+            raise ClientError('Missing required parameters: "start_timestamp" and "end_timestamp"', 400)
+        
+        spaces = database.reservations.get_free_spaces(start_timestamp, end_timestamp)
+        return jsonify({'spaces': spaces}), 200
+
+    except ClientError as e:
+        return jsonify({
+            'message': e.message
+        }), e.code
+
+    except Exception as e:
+        logger.exception("Unhandled error")
+        abort(500, description=str(e))
+
+
+@availability_bp.route('/availability/nearest', methods=['GET'])
+def get_nearest_free_spaces():
+    """
+    Get the free parking spaces closest to a point for a time range
+    ---
+    get:
+        summary: Get the nearest free parking spaces
+        parameters:
+            - in: query
+              name: x
+              required: true
+              schema:
+                type: number
+              description: X coordinate of the point, in the coordinates of /parking
+            - in: query
+              name: y
+              required: true
+              schema:
+                type: number
+              description: Y coordinate of the point
+            - in: query
+              name: count
+              schema:
+                type: integer
+              description: Most spaces to return, from 1 to 100. Defaults to 5.
+            - in: query
+              name: start_timestamp
+              required: true
+              schema:
+                type: string
+                format: date-time
+              description: ISO-formatted start of the range
+            - in: query
+              name: end_timestamp
+              required: true
+              schema:
+                type: string
+                format: date-time
+              description: ISO-formatted end of the range, on the same day as the start
+        responses:
+            200:
+                description: The free spaces, closest first
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                spaces:
+                                    type: array
+                                    items:
+                                        type: object
+                                        properties:
+                                            space_id:
+                                                type: string
+                                            x:
+                                                type: number
+                                            y:
+                                                type: number
+                                            zone:
+                                                type: string
+                                                nullable: true
+                                            distance:
+                                                type: number
+            400:
+                description: Missing or invalid parameters
+    """
+    try:
+        start_timestamp = request.args.get('start_timestamp')
+        end_timestamp = request.args.get('end_timestamp')
+        if request.args.get('x') is None or request.args.get('y') is None or not start_timestamp or not end_timestamp:
+            raise ClientError('Missing required parameters: "x", "y", "start_timestamp" and "end_timestamp"', 400)
+        try:
+            x = float(request.args['x'])
+            y = float(request.args['y'])
+            count = int(request.args.get('count', 5))
+            if not math.isfinite(x) or not math.isfinite(y):
+                raise ValueError
+        except ValueError:
+            raise ClientError('"x" and "y" must be numbers and "count" an integer', 400)
+
+        spaces = database.reservations.get_nearest_free_spaces(x, y, count, start_timestamp, end_timestamp)
+        return jsonify({'spaces': spaces}), 200
+
+    except ClientError as e:
+        return jsonify({
+            'message': e.message
+        }), e.code
+
+    except Exception as e:
+        logger.exception("Unhandled error")
+        abort(500, description=str(e))
+
+
+@availability_bp.route('/availability/stream', methods=['GET'])
+def stream_availability():
+    """
+    Stream availability changes as server-sent events
+    ---
+    get:
+        summary: Subscribe to availability deltas
+        description: >
+            Every client shares one database listener. Each booking or cancellation is sent as an
+            'availability' event whose data is a delta for one space, with the event ID as a sequence number.
+            Subscribe first, then fetch /availability and apply the deltas to it.
+            A comment is sent every SSE_KEEPALIVE seconds (15 by default) to keep the connection open.
+            A client that falls too far behind gets a 'resync' event and the stream ends; it should
+            refetch /availability and reconnect.
+        parameters:
+            - in: query
+              name: spaces
+              schema:
+                type: string
+              description: Comma-separated IDs of the spaces to follow. Defaults to every space.
+        responses:
+            200:
+                description: Event stream
+                content:
+                    text/event-stream:
+                        schema:
+                            type: object
+                            description: Data of each 'availability' event
+                            properties:
+                                status:
+                                    type: string
+                                    enum: [reserved, released]
+                                space_id:
+                                    type: string
+                                date:
+                                    type: string
+                                    format: date
+                                slots:
+                                    type: array
+                                    description: "[first slot, slot count] of the change, in the slots of /availability"
+                                    items:
+                                        type: integer
+                                start_timestamp:
+                                    type: string
+                                    format: date-time
+                                end_timestamp:
+                                    type: string
+                                    format: date-time
+    """
+    try:
+        spaces = request.args.get('spaces')
+        space_ids = [space_id.strip() for space_id in spaces.split(',') if space_id.strip()] if spaces else None
+
+        feed = current_app.extensions['availability_feed']
+        keepalive = current_app.config['SSE_KEEPALIVE']
+        # Served by the ASGI entry point, the stream waits on its event loop instead of holding a thread
+        loop = request.environ.get('reserveease.event_loop')
+        subscription = feed.subscribe(space_ids, loop=loop)
+
+        def message(event) -> str:
+            if event is None:
+                return ': keep-alive\n\n'
+            sequence, delta = event
+            return f'id: {sequence}\nevent: availability\ndata: {dumps(delta)}\n\n'
+
+        def events():
+            try:
+                # Reconnect quickly if the connection drops
+                yield 'retry: 1000\n\n'
+                while not subscription.overflowed:
+                    yield message(subscription.get(timeout=keepalive))
+                yield 'event: resync\ndata: {}\n\n'
+            finally:
+                feed.unsubscribe(subscription)
+
+        async def async_events():
+            try:
+                yield 'retry: 1000\n\n'
+                while not subscription.overflowed:
+                    yield message(await subscription.get(timeout=keepalive))
+                yield 'event: resync\ndata: {}\n\n'
+            finally:
+                feed.unsubscribe(subscription)
+
+        headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        if loop is not None:
+            # The ASGI entry point sends this body itself once the response headers are out
+            request.environ['reserveease.async_body'] = async_events()
+            return Response(iter(()), mimetype='text/event-stream', headers=headers)
+        return Response(stream_with_context(events()), mimetype='text/event-stream', headers=headers)
+
+    except ClientError as e:
+        return jsonify({
+            'message': e.message
+        }), e.code
+
+    except Exception as e:
+        logger.exception("Unhandled error")
+        abort(500, description=str(e))
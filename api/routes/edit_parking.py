@@ -1,23 +1,78 @@
-from flask import Blueprint, request, jsonify, g, abort
+from flask import Blueprint, current_app, request, jsonify, g, abort
 from wrappers import verify_token 
 from exceptions import ClientError
-import traceback
-from typedef import parking_data
+from conditional import encode_json, json_response
+import database.reservations
+import database.spaces
+from logger import get_logger
 
 # Define the Blueprint
 parking_bp = Blueprint('parking_bp', __name__)
+logger = get_logger(__name__)
+
+def parking_json():
+    """Returns the parking map serialized once per version of the space catalog, and its ETag."""
+    version = database.spaces.catalog.version
+    cached = current_app.extensions.get('parking_json')
+    if cached is None or cached[0] != version:
+        cached = current_app.extensions['parking_json'] = (version, *encode_json(database.spaces.catalog.to_dict()))
+    return cached[1:]
 
 @parking_bp.route('/parking', methods=['GET'])
 def get_parking_spots():
     """
     Fetch all parking spots.
     Authentication is required to access this route.
+    Responses carry an ETag; requests sending it back in If-None-Match get a 304 with no body.
+    """
+    try:
+        body, etag = parking_json()
+        return json_response(body, etag)
+    except Exception as e:
+        logger.exception("Unhandled error")
+        abort(500, description=str(e))
+
+@parking_bp.route('/parking/<space_id>', methods=['GET'])
+def get_parking_spot(space_id):
+    """
+    Fetch one parking spot by ID.
+    ---
+    get:
+        summary: Get a parking space
+        parameters:
+            - in: path
+              name: space_id
+              required: true
+              schema:
+                type: string
+        responses:
+            200:
+                description: The space
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                space_id:
+                                    type: string
+                                x:
+                                    type: number
+                                y:
+                                    type: number
+                                zone:
+                                    type: string
+                                    nullable: true
+            404:
+                description: Space not found
     """
     try:
-        spots = parking_data
-        return jsonify(spots), 200
+        return jsonify(database.spaces.get_space(space_id)), 200
+    except ClientError as e:
+        return jsonify({
+            'message': e.message
+        }), e.code
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Unhandled error")
         abort(500, description=str(e))
 
 @parking_bp.route('/parking', methods=['POST'])
@@ -26,32 +81,151 @@ def create_parking_spot():
     """
     Create a new parking spot.
     Authentication is required to access this route.
+    ---
+    post:
+        summary: Add a parking space to the catalog
+        security:
+            - BearerAuth: []
+        requestBody:
+            required: true
+            content:
+                application/json:
+                    schema:
+                        type: object
+                        required:
+                            - space_id
+                            - x
+                            - y
+                        properties:
+                            space_id:
+                                type: string
+                                description: 1 to 32 letters, digits or dashes
+                            x:
+                                type: number
+                            y:
+                                type: number
+                            zone:
+                                type: string
+                                description: Zone of the lot the space is in
+        responses:
+            201:
+                description: The created space
+            400:
+                description: Missing or invalid field
+            401:
+                description: Unauthorized
+            409:
+                description: A space with this ID already exists
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            raise ClientError('Request body must be a JSON object', 400)
+
+        space = database.spaces.create_space(data)
+        return jsonify(space), 201
+    except ClientError as e:
+        return jsonify({
+            'message': e.message
+        }), e.code
+    except Exception as e:
+        logger.exception("Unhandled error")
+        abort(500, description=str(e))
+
+@parking_bp.route('/parking/<space_id>', methods=['PUT'])
+@verify_token
+def update_parking_spot(space_id):
+    """
+    Move a parking spot or change its zone.
+    Authentication is required to access this route.
+    ---
+    put:
+        summary: Update a parking space
+        security:
+            - BearerAuth: []
+        parameters:
+            - in: path
+              name: space_id
+              required: true
+              schema:
+                type: string
+        requestBody:
+            required: true
+            content:
+                application/json:
+                    schema:
+                        type: object
+                        description: Fields that are left out keep their value
+                        properties:
+                            x:
+                                type: number
+                            y:
+                                type: number
+                            zone:
+                                type: string
+                                nullable: true
+        responses:
+            200:
+                description: The updated space
+            400:
+                description: Invalid field
+            401:
+                description: Unauthorized
+            404:
+                description: Space not found
     """
     try:
-        data = request.json
-        if 'name' not in data or 'location' not in data:
-            raise ClientError('Missing required fields: "name" and "location"', 400)
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            raise ClientError('Request body must be a JSON object', 400)
 
-        return jsonify({'message': 'Parking spot added successfully'}), 201
+        space = database.spaces.update_space(space_id, data)
+        return jsonify(space), 200
     except ClientError as e:
-        print(str(e))
-        abort(e.code, description=e.message)
+        return jsonify({
+            'message': e.message
+        }), e.code
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Unhandled error")
         abort(500, description=str(e))
 
-@parking_bp.route('/parking/<spot_id>', methods=['DELETE'])
+@parking_bp.route('/parking/<space_id>', methods=['DELETE'])
 @verify_token
-def delete_parking_spot(spot_id):
+def delete_parking_spot(space_id):
     """
     Delete a parking spot by ID.
     Authentication is required to access this route.
+    ---
+    delete:
+        summary: Remove a parking space from the catalog
+        security:
+            - BearerAuth: []
+        parameters:
+            - in: path
+              name: space_id
+              required: true
+              schema:
+                type: string
+        responses:
+            200:
+                description: Space deleted
+            401:
+                description: Unauthorized
+            404:
+                description: Space not found
+            409:
+                description: The space has reservations that have not ended yet
     """
     try:
-        return jsonify({'message': f'Parking spot {spot_id} deleted successfully.'}), 200
+        if database.reservations.has_upcoming_reservations(space_id):
+            raise ClientError(f'Space {space_id} has upcoming reservations', 409)
+
+        database.spaces.delete_space(space_id)
+        return jsonify({'message': f'Parking spot {space_id} deleted successfully.'}), 200
     except ClientError as e:
-        print(str(e))
-        abort(e.code, description=e.message)
+        return jsonify({
+            'message': e.message
+        }), e.code
     except Exception as e:
-        traceback.print_exc()
-        abort(500, description=str(e))
\ No newline at end of file
+        logger.exception("Unhandled error")
+        abort(500, description=str(e))
@@ -0,0 +1,47 @@
+# api/routes/metrics.py
+from typing import List, Tuple
+from flask import Blueprint, Response, current_app
+from metrics import Samples
+
+metrics_bp = Blueprint('metrics_bp', __name__)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Get the request metrics of this process in the Prometheus text format
+    ---
+    get:
+        summary: Scrape request, Firestore and cache metrics
+        description: >
+            Request and stage duration histograms, Firestore documents read and written, and the
+            counters of the token and query caches, since this process started. Served at the root
+            rather than under /api, and only when METRICS_ENABLED is set.
+        responses:
+            200:
+                description: Metrics in the Prometheus text exposition format
+                content:
+                    text/plain:
+                        schema:
+                            type: string
+    """
+    body = current_app.extensions['metrics'].render(__cache_families())
+    return Response(body, mimetype='text/plain', content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def __cache_families() -> List[Tuple[str, str, str, Samples]]:
+    """Reads the counters of the caches, the availability feed and the log queue as metric families."""
+    families = []
+    for name, cache in (('token', current_app.extensions['token_cache']), ('query', current_app.extensions.get('query_cache'))):
+        if cache is None:
+            continue
+        stats = cache.stats()
+        families.append((f'reserveease_{name}_cache_hits_total', 'counter', f'Lookups answered by the {name} cache', [({}, stats['hits'])]))
+        families.append((f'reserveease_{name}_cache_misses_total', 'counter', f'Lookups the {name} cache could not answer', [({}, stats['misses'])]))
+        families.append((f'reserveease_{name}_cache_entries', 'gauge', f'Entries in the {name} cache', [({}, stats['size'])]))
+        if 'invalidations' in stats:
+            families.append((f'reserveease_{name}_cache_invalidations_total', 'counter', f'Entries evicted from the {name} cache by writes', [({}, stats['invalidations'])]))
+    families.append(('reserveease_availability_subscribers', 'gauge', 'Open availability streams',
+                     [({}, current_app.extensions['availability_feed'].subscriber_count())]))
+    families.append(('reserveease_log_records_dropped_total', 'counter', 'Log records dropped because the log queue was full',
+                     [({}, current_app.extensions['log_handler'].dropped)]))
+    return families
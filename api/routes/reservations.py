@@ -1,11 +1,11 @@
 # api/routes/reservations.py
-from datetime import datetime
-import traceback
-from app import app
+import logging
+import math
 import database.reservations
-from flask import Blueprint, abort, request, jsonify, g
-from firebase_admin import firestore
+from flask import Blueprint, Response, abort, request, jsonify, g, stream_with_context
 from exceptions import ClientError
+from conditional import encode_json, json_response
+from logger import get_logger
 import sys
 import os
 from typedef import Reservation
@@ -14,6 +14,13 @@ from wrappers import verify_token  # Using absolute import
 
 # Define the Blueprint - keeping your original name
 reservations_bp = Blueprint('reservations_bp', __name__)
+logger = get_logger(__name__)
+
+# Encoder, content type and file extension of each export format
+EXPORT_FORMATS = {
+    'ndjson': (Reservation.ndjson_lines, 'application/x-ndjson', 'ndjson'),
+    'csv': (Reservation.csv_lines, 'text/csv', 'csv'),
+}
 
 @reservations_bp.route('/reservations/add', methods=['POST'])
 @verify_token
@@ -55,7 +62,7 @@ def create_reservation():
                                 message:
                                     type: string
             400:
-                description: Missing required fields
+                description: Missing or invalid fields, or unknown space
                 content:
                     application/json:
                         schema:
@@ -102,7 +109,197 @@ def create_reservation():
         }), e.code
         
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Unhandled error")
+        abort(500, description=str(e))
+
+@reservations_bp.route('/reservations/allocate', methods=['POST'])
+@verify_token
+def allocate_reservation():
+    """
+    Book any free parking space for a time range, picked by the server
+    ---
+    post:
+        summary: Allocate and book a free space
+        requestBody:
+            required: true
+            content:
+                application/json:
+                    schema:
+                        type: object
+                        required:
+                            - start_timestamp
+                            - end_timestamp
+                        properties:
+                            start_timestamp:
+                                type: string
+                                format: date-time
+                                description: ISO-formatted start time of the reservation
+                            end_timestamp:
+                                type: string
+                                format: date-time
+                                description: ISO-formatted end time of the reservation
+                            x:
+                                type: number
+                                description: X coordinate of the preferred location, in the coordinates of /parking
+                            y:
+                                type: number
+                                description: Y coordinate of the preferred location
+                            zone:
+                                type: string
+                                description: Only allocate a space in this zone
+                            strategy:
+                                type: string
+                                enum: [nearest, best_fit]
+                                description: >
+                                    'nearest' books the free space closest to the location. 'best_fit' books the space
+                                    whose free time around the range is shortest, keeping long free runs for longer
+                                    bookings, with the location breaking ties. Defaults to 'nearest' when a location is
+                                    given and 'best_fit' otherwise.
+        responses:
+            201:
+                description: Reservation created
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                id:
+                                    type: string
+                                    description: ID of the created reservation
+                                space_id:
+                                    type: string
+                                    description: ID of the booked space
+                                message:
+                                    type: string
+            400:
+                description: Missing or invalid fields
+            401:
+                description: Unauthorized
+            409:
+                description: No free space for the time range
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            raise ClientError('Request body must be a JSON object', 400)
+        if 'start_timestamp' not in data or 'end_timestamp' not in data:
+            raise ClientError('Missing required fields', 400)
+        for field in ('x', 'y'):
+            value = data.get(field)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value)):
+                raise ClientError(f'"{field}" must be a number', 400)
+
+        reservation_id, space_id = database.reservations.allocate(
+            user_id=g.user_id,
+            start_timestamp=data['start_timestamp'],
+            end_timestamp=data['end_timestamp'],
+            x=data.get('x'),
+            y=data.get('y'),
+            zone=data.get('zone'),
+            strategy=data.get('strategy')
+        )
+
+        return jsonify({
+            'id': reservation_id,
+            'space_id': space_id,
+            'message': 'Reservation created successfully'
+        }), 201
+
+    except ClientError as e:
+        return jsonify({
+            'message': e.message
+        }), e.code
+
+    except Exception as e:
+        logger.exception("Unhandled error")
+        abort(500, description=str(e))
+
+@reservations_bp.route('/reservations/batch', methods=['POST'])
+@verify_token
+def create_reservations_batch():
+    """
+    Create several reservations at once using authenticated user's ID
+    ---
+    post:
+        summary: Create a batch of reservations
+        requestBody:
+            required: true
+            content:
+                application/json:
+                    schema:
+                        type: object
+                        properties:
+                            reservations:
+                                type: array
+                                description: At most 50 reservations, each validated like /reservations/add
+                                items:
+                                    type: object
+                                    properties:
+                                        space_id:
+                                            type: string
+                                        start_timestamp:
+                                            type: string
+                                            format: date-time
+                                        end_timestamp:
+                                            type: string
+                                            format: date-time
+        responses:
+            200:
+                description: Result of each requested reservation, in request order
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                results:
+                                    type: array
+                                    items:
+                                        type: object
+                                        properties:
+                                            status:
+                                                type: integer
+                                                description: 201 if created, otherwise the error code
+                                            id:
+                                                type: string
+                                                description: ID of the created reservation
+                                            message:
+                                                type: string
+                                                description: Why the reservation was rejected
+            400:
+                description: Missing, empty or oversized batch
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                message:
+                                    type: string
+    """
+    try:
+        # Get request data
+        data = request.get_json()
+        
+        # Validate required fields
+        if not data or not isinstance(data.get('reservations'), list):
+            raise ClientError('Missing required field: "reservations"', 400)
+        
+        # Schedule the reservations using authenticated user's ID
+        results = database.reservations.schedule_batch(
+            user_id=g.user_id,
+            reservations=data['reservations']
+        )
+        
+        return jsonify({
+            'results': results
+        }), 200
+        
+    except ClientError as e:
+        return jsonify({
+            'message': e.message
+        }), e.code
+        
+    except Exception as e:
+        logger.exception("Unhandled error")
         abort(500, description=str(e))
 
 @reservations_bp.route('/reservations/delete/<reservation_id>', methods=['DELETE'])
@@ -140,7 +337,7 @@ def delete_reservation(reservation_id):
             raise ClientError("Unauthorized action", 403)
                 
         # Delete the reservation
-        database.reservations.delete_reservation(reservation_id)
+        database.reservations.delete_reservation(reservations[0])
         
         # Return success response
         return jsonify({
@@ -153,38 +350,148 @@ def delete_reservation(reservation_id):
         }), e.code
     
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Unhandled error")
+        abort(500, description=str(e))
+        
+@reservations_bp.route('/reservations/cancel', methods=['POST'])
+@verify_token
+def cancel_reservations():
+    """
+    Delete several reservations by ID, if they belong to the authenticated user
+    ---
+    post:
+        summary: Delete a batch of reservations
+        requestBody:
+            required: true
+            content:
+                application/json:
+                    schema:
+                        type: object
+                        properties:
+                            reservation_ids:
+                                type: array
+                                description: At most 50 reservation IDs
+                                items:
+                                    type: string
+        responses:
+            200:
+                description: Result of each requested deletion, in request order
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                results:
+                                    type: array
+                                    items:
+                                        type: object
+                                        properties:
+                                            id:
+                                                type: string
+                                            status:
+                                                type: integer
+                                                description: 200 if deleted, 403 if unauthorized, 404 if not found
+                                            message:
+                                                type: string
+            400:
+                description: Missing, empty or oversized batch
+    """
+    try:
+        # Get request data
+        data = request.get_json()
+        
+        # Validate required fields
+        if not data or not isinstance(data.get('reservation_ids'), list):
+            raise ClientError('Missing required field: "reservation_ids"', 400)
+        
+        # Delete the reservations that belong to the authenticated user
+        results = database.reservations.cancel_reservations(
+            user_id=g.user_id,
+            reservation_ids=data['reservation_ids']
+        )
+        
+        return jsonify({
+            'results': results
+        }), 200
+    
+    except ClientError as e:
+        return jsonify({
+            'message': e.message
+        }), e.code
+    
+    except Exception as e:
+        logger.exception("Unhandled error")
         abort(500, description=str(e))
         
 @reservations_bp.route('/reservations/user', methods=['GET'])
 @verify_token
 def get_user_reservations():
     """
-    Get all reservations for the authenticated user
+    Get the active and upcoming reservations of the authenticated user, or a page of their past ones
     ---
     get:
         summary: Get user's reservations
+        parameters:
+            - in: query
+              name: history
+              schema:
+                type: boolean
+              description: Return a page of the reservations that have ended, most recent first, instead of the upcoming ones
+            - in: query
+              name: limit
+              schema:
+                type: integer
+              description: Page size of the history, at most 500. Defaults to 50
+            - in: query
+              name: page_token
+              schema:
+                type: string
+              description: next_page_token of the previous page of the history
     responses:
         200:
-            description: List of reservations
+            description: >
+                List of the reservations that have not ended, by start time, or with history=true a page of past
+                reservations with the token of the next page. Carries an ETag
             content:
                 application/json:
                     schema:
                         type: array
                         items: Reservation
+        304:
+            description: The If-None-Match header matches the ETag of the current list
+        400:
+            description: Invalid limit or page token
     """
     try:
         if not hasattr(g, 'user_id') or not g.user_id:
             # Assume test user if not authenticated
             g.user_id = 'test_user_id'
-            
-        print("Getting reservations for user:", g.user_id)
         
-        # Get reservations for the authenticated user
-        reservations = database.reservations.get_reservations(user_id=g.user_id)
+        history = request.args.get('history', 'false').lower() == 'true'
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Getting reservations for user", extra={'fields': {'user_id': g.user_id, 'history': history}})
         
-        # Return success response
-        return Reservation.jsonify_list(reservations=reservations), 200
+        if history:
+            limit = request.args.get('limit')
+            try:
+                limit = int(limit) if limit is not None else None
+            except ValueError:
+                raise ClientError('Limit must be an integer', 400)
+            page = database.reservations.get_reservation_history(g.user_id, limit=limit, page_token=request.args.get('page_token'))
+            response = json_response(*encode_json({
+                'reservations': Reservation.jsonify_list(reservations=page),
+                'next_page_token': page.next_page_token
+            }))
+            response.vary.add('Authorization')
+            return response
+        
+        # Get the upcoming reservations for the authenticated user
+        reservations = database.reservations.get_upcoming_reservations(g.user_id)
+        
+        # Return success response, or a 304 if the client has it already
+        response = json_response(*encode_json(Reservation.jsonify_list(reservations=reservations)))
+        response.vary.add('Authorization')
+        return response
     
     except ClientError as e:
         return jsonify({
@@ -192,7 +499,7 @@ def get_user_reservations():
         }), e.code
     
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Unhandled error")
         abort(500, description=str(e))
 
 @reservations_bp.route('/reservations/get', methods=['GET'])
@@ -218,21 +525,58 @@ def get_reservations_route():
               schema:
                 type: string
                 format: date-time
-              description: Operator-prefixed ISO formatted start timestamp for filtering reservations
+              description: >
+                ISO formatted start timestamp, optionally prefixed by ==, !=, <, <=, > or >=,
+                or a range such as [2099-01-01T09:00:00Z,2099-01-01T17:00:00Z) with inclusive [ ] and exclusive ( ) bounds
             - in: query
               name: end_timestamp
               schema:
                 type: string
                 format: date-time
-              description: Operator-prefixed ISO formatted end timestamp for filtering reservations
+              description: >
+                ISO formatted end timestamp, optionally prefixed by ==, !=, <, <=, > or >=,
+                or a range such as [2099-01-01T09:00:00Z,2099-01-01T17:00:00Z) with inclusive [ ] and exclusive ( ) bounds
+            - in: query
+              name: limit
+              schema:
+                type: integer
+              description: Page size, at most 500. Returns a page object instead of a list
+            - in: query
+              name: page_token
+              schema:
+                type: string
+              description: next_page_token of the previous page, sent with the same filters and order_by
+            - in: query
+              name: order_by
+              schema:
+                type: string
+              description: start_timestamp, end_timestamp, space_id or created_at, prefixed with '-' for descending order
+            - in: query
+              name: fields
+              schema:
+                type: string
+              description: Comma-separated reservation fields to return, e.g. "reservation_id,start_timestamp"
         responses:
             200:
-                description: List of reservations matching the filters
+                description: List of reservations matching the filters, or a page of them if limit or page_token is given. Carries an ETag
                 content:
                     application/json:
                         schema:
-                            type: array
-                            items: Reservation
+                            oneOf:
+                                - type: array
+                                  items: Reservation
+                                - type: object
+                                  properties:
+                                      reservations:
+                                          type: array
+                                          items: Reservation
+                                      next_page_token:
+                                          type: string
+                                          description: Token of the next page, or null on the last page
+            304:
+                description: The If-None-Match header matches the ETag of the current result
+            400:
+                description: Invalid filter, limit, order, field or page token
             403:
                 description: Unauthorized request for user_id filter
                 content:
@@ -250,6 +594,15 @@ def get_reservations_route():
         space_id = request.args.get('space_id')
         start_timestamp = request.args.get('start_timestamp')
         end_timestamp = request.args.get('end_timestamp')
+        page_token = request.args.get('page_token')
+        order_by = request.args.get('order_by')
+        fields = request.args.get('fields')
+        fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+        limit = request.args.get('limit')
+        try:
+            limit = int(limit) if limit is not None else None
+        except ValueError:
+            raise ClientError('Limit must be an integer', 400)
 
         # Check if user_id is provided and raise a 403 error
         if user_id:
@@ -257,17 +610,131 @@ def get_reservations_route():
                 'message': 'Please send an authenticated request to /reservations/user to access user-specific reservations.'
             }), 403
 
-        # Fetch reservations based on provided filters
-        reservations = database.reservations.get_reservations(
+        # Fetch reservations based on provided filters, from the query cache when possible
+        reservations = database.reservations.get_public_reservations(
             reservation_id=reservation_id,
             space_id=space_id,
             start_timestamp=start_timestamp,
-            end_timestamp=end_timestamp
+            end_timestamp=end_timestamp,
+            limit=limit,
+            page_token=page_token,
+            order_by=order_by,
+            fields=fields
         )
-        print(len(reservations))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Fetched public reservations", extra={'fields': {'count': len(reservations), 'cached': reservations.encoded is not None}})
+
+        # Serialize once per cached page; clients sending its ETag back get a 304
+        if reservations.encoded is None:
+            results = Reservation.jsonify_list(reservations=reservations, restrict_user_id=True, fields=fields)
+            if limit is not None or page_token:
+                results = {
+                    'reservations': results,
+                    'next_page_token': reservations.next_page_token
+                }
+            reservations.encoded = encode_json(results)
 
         # Return filtered reservations
-        return Reservation.jsonify_list(reservations=reservations, restrict_user_id=True), 200
+        return json_response(*reservations.encoded)
+
+    except ClientError as e:
+        return jsonify({
+            'message': e.message
+        }), e.code
+
+    except Exception as e:
+        logger.exception("Unhandled error")
+        abort(500, description=str(e))
+
+@reservations_bp.route('/reservations/export', methods=['GET'])
+def export_reservations_route():
+    """
+    Stream every reservation matching the filters as newline-delimited JSON or CSV
+    ---
+    get:
+        summary: Export reservations
+        description: Rows are sent as they are read from the database, so the response starts immediately and any number of reservations can be exported
+        parameters:
+            - in: query
+              name: format
+              schema:
+                type: string
+                enum: [ndjson, csv]
+              description: Output format. Defaults to ndjson
+            - in: query
+              name: space_id
+              schema:
+                type: string
+              description: The ID of the parking space for the reservation
+            - in: query
+              name: start_timestamp
+              schema:
+                type: string
+                format: date-time
+              description: >
+                ISO formatted start timestamp, optionally prefixed by ==, !=, <, <=, > or >=,
+                or a range such as [2099-01-01T09:00:00Z,2099-01-01T17:00:00Z) with inclusive [ ] and exclusive ( ) bounds
+            - in: query
+              name: end_timestamp
+              schema:
+                type: string
+                format: date-time
+              description: >
+                ISO formatted end timestamp, optionally prefixed by ==, !=, <, <=, > or >=,
+                or a range such as [2099-01-01T09:00:00Z,2099-01-01T17:00:00Z) with inclusive [ ] and exclusive ( ) bounds
+            - in: query
+              name: order_by
+              schema:
+                type: string
+              description: start_timestamp, end_timestamp, space_id or created_at, prefixed with '-' for descending order
+            - in: query
+              name: fields
+              schema:
+                type: string
+              description: Comma-separated reservation fields to export, e.g. "reservation_id,start_timestamp"
+        responses:
+            200:
+                description: One reservation per line
+                content:
+                    application/x-ndjson:
+                        schema:
+                            type: string
+                    text/csv:
+                        schema:
+                            type: string
+            400:
+                description: Invalid format, filter, order or field
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                message:
+                                    type: string
+    """
+    try:
+        # Extract query parameters
+        export_format = request.args.get('format', 'ndjson')
+        fields = request.args.get('fields')
+        fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+        if export_format not in EXPORT_FORMATS:
+            raise ClientError(f'Format must be one of: {", ".join(EXPORT_FORMATS)}', 400)
+
+        # Invalid filters are reported here, before the response starts
+        reservations = database.reservations.stream_reservations(
+            space_id=request.args.get('space_id'),
+            start_timestamp=request.args.get('start_timestamp'),
+            end_timestamp=request.args.get('end_timestamp'),
+            order_by=request.args.get('order_by'),
+            fields=fields
+        )
+
+        encode, mimetype, extension = EXPORT_FORMATS[export_format]
+        return Response(
+            stream_with_context(encode(reservations, restrict_user_id=True, fields=fields)),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename=reservations.{extension}'}
+        )
 
     except ClientError as e:
         return jsonify({
@@ -275,5 +742,5 @@ def get_reservations_route():
         }), e.code
 
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Unhandled error")
         abort(500, description=str(e))
@@ -0,0 +1,20 @@
+# tests/conftest.py
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+import database.reservations
+import database.spaces
+from database.firestore import init_db
+from database.memory import MemoryFirestore
+
+
+@pytest.fixture
+def db():
+    """Points the data-access layer at a fresh in-memory Firestore with the default spaces and empty in-memory indexes."""
+    fake = MemoryFirestore()
+    init_db(client=fake)
+    database.spaces.load_spaces()
+    database.reservations.load_index()
+    yield fake
+    database.spaces.catalog.unwatch()
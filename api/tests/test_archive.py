@@ -0,0 +1,64 @@
+import time
+from datetime import datetime, timedelta, timezone
+import pytest
+from app import create_app
+from archive import ArchiveWorker
+from database.memory import MemoryFirestore
+
+YESTERDAY = (datetime.now(timezone.utc) - timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+
+
+@pytest.fixture
+def client():
+    """In-memory Firestore holding one reservation that ended yesterday and one that ends tomorrow."""
+    client = MemoryFirestore()
+    client.load('reservations', [
+        (reservation_id, {'user_id': 'user', 'space_id': 'A1', 'start_timestamp': start, 'end_timestamp': start + timedelta(hours=1), 'status': 'active'})
+        for reservation_id, start in (('ended', YESTERDAY), ('live', YESTERDAY + timedelta(days=2)))
+    ])
+    return client
+
+
+def remaining(client) -> list:
+    return [doc.id for doc in client.collection('reservations').stream()]
+
+
+def test_cli_archives_ended_reservations(client):
+    runner = create_app(client=client).test_cli_runner()
+
+    result = runner.invoke(args=['archive', '--before', (YESTERDAY - timedelta(days=1)).isoformat()])
+    assert result.exit_code == 0 and 'Archived 0 reservations' in result.output
+
+    result = runner.invoke(args=['archive', '--batch-size', '10'])
+    assert result.exit_code == 0 and 'Archived 1 reservations' in result.output
+    assert remaining(client) == ['live']
+
+    assert runner.invoke(args=['archive', '--before', 'yesterday']).exit_code == 2
+    assert runner.invoke(args=['archive', '--before', (YESTERDAY + timedelta(days=3)).isoformat()]).exit_code == 2
+    assert remaining(client) == ['live']
+    assert runner.invoke(args=['archive', '--batch-size', '1000']).exit_code == 2
+
+
+def test_worker_archives_on_a_schedule(client):
+    worker = ArchiveWorker(create_app(client=client), interval=0.01, batch_size=10)
+    worker.start()
+    try:
+        deadline = time.monotonic() + 5
+        while remaining(client) != ['live'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        worker.stop(timeout=5)
+
+    assert remaining(client) == ['live']
+
+
+def test_archiving_is_counted_in_metrics(client):
+    app = create_app(client=client)
+    app.test_cli_runner().invoke(args=['archive'])
+
+    text = app.test_client().get('/metrics').get_data(as_text=True)
+    # The live reservation loaded at startup, the ended one, then an empty read that ends the run
+    assert 'reserveease_firestore_documents_total{operation="read"} 2' in text
+    # Its archived copy, deletion, 4 slot locks and the month partition
+    assert 'reserveease_firestore_documents_total{operation="write"} 7' in text
+    assert 'reserveease_stage_duration_seconds_count{stage="firestore-write"} 1' in text
@@ -0,0 +1,118 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import json
+from typing import Dict, List, Optional
+import pytest
+from asgi import create_asgi_app
+from database.memory import MemoryFirestore
+
+START = (datetime.now(timezone.utc) + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+END = START + timedelta(hours=1)
+AUTH = [(b'authorization', b'Bearer test-token')]
+
+
+@pytest.fixture
+def asgi_app():
+    app = create_asgi_app(client=MemoryFirestore())
+    yield app
+    app.close()
+
+
+def scope(method: str, path: str, query: bytes = b'', headers: Optional[List] = None) -> Dict:
+    return {
+        'type': 'http', 'method': method, 'path': path, 'query_string': query, 'root_path': '',
+        'headers': headers or [], 'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80),
+    }
+
+
+async def call(app, method: str, path: str, query: bytes = b'', json_body: Optional[Dict] = None, headers: Optional[List] = None):
+    body = json.dumps(json_body).encode() if json_body is not None else b''
+    headers = (headers or []) + ([(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())] if json_body is not None else [])
+    messages = [{'type': 'http.request', 'body': body[:10], 'more_body': True}, {'type': 'http.request', 'body': body[10:]}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope(method, path, query, headers), receive, send)
+    start = sent[0]
+    return start['status'], dict(start['headers']), b''.join(message.get('body', b'') for message in sent[1:])
+
+
+def booking(space_id: str) -> Dict:
+    return {'space_id': space_id, 'start_timestamp': START.isoformat(), 'end_timestamp': END.isoformat()}
+
+
+class TestAsgiApp:
+    def test_serves_the_flask_routes(self, asgi_app):
+        async def scenario():
+            status, _, body = await call(asgi_app, 'POST', '/api/reservations/add', json_body=booking('A1'), headers=AUTH)
+            assert status == 201
+
+            status, headers, body = await call(asgi_app, 'GET', '/api/reservations/get', b'space_id=A1')
+            assert status == 200 and headers[b'content-type'] == b'application/json'
+            assert [reservation['space_id'] for reservation in json.loads(body)] == ['A1']
+
+            status, _, body = await call(asgi_app, 'GET', '/api/reservations/export', b'format=csv')
+            assert status == 200 and body.count(b'\n') == 2
+
+            status, _, body = await call(asgi_app, 'GET', '/api/reservations/user')
+            assert status == 401
+
+        asyncio.run(scenario())
+
+    def test_streams_availability_on_the_event_loop(self, asgi_app):
+        asgi_app.app.config['SSE_KEEPALIVE'] = 5
+        feed = asgi_app.app.extensions['availability_feed']
+
+        async def scenario():
+            disconnect = asyncio.Event()
+            chunks: asyncio.Queue = asyncio.Queue()
+            requests = [{'type': 'http.request', 'body': b''}]
+
+            async def receive():
+                if requests:
+                    return requests.pop()
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                await chunks.put(message)
+
+            stream = asyncio.ensure_future(asgi_app(scope('GET', '/api/availability/stream', b'spaces=A1'), receive, send))
+            start = await chunks.get()
+            headers = dict(start['headers'])
+            assert start['status'] == 200 and headers[b'content-type'].startswith(b'text/event-stream')
+            assert b'content-length' not in headers
+            assert (await chunks.get())['body'] == b'retry: 1000\n\n'
+
+            for space_id in ('A2', 'A1'):
+                await call(asgi_app, 'POST', '/api/reservations/add', json_body=booking(space_id), headers=AUTH)
+            event = (await asyncio.wait_for(chunks.get(), 1))['body'].decode()
+            delta = json.loads(event.split('data: ', 1)[1])
+            assert (delta['status'], delta['space_id']) == ('reserved', 'A1')
+
+            disconnect.set()
+            await asyncio.wait_for(stream, 1)
+            assert feed.subscriber_count() == 0
+
+        asyncio.run(scenario())
+
+    def test_lifespan(self, asgi_app):
+        async def scenario():
+            messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+            sent = []
+
+            async def receive():
+                return messages.pop(0)
+
+            async def send(message):
+                sent.append(message['type'])
+
+            await asgi_app({'type': 'lifespan'}, receive, send)
+            assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+
+        asyncio.run(scenario())
@@ -0,0 +1,58 @@
+import io
+import json
+from benchmarks import bench_api, bench_async, bench_logging, bench_serialization
+
+
+def test_benchmark_runs_every_scenario():
+    results = bench_api.run([1000], requests=5, out=io.StringIO())
+
+    assert set(results['1000']) == set(bench_api.scenarios(bench_api.Dataset(1000, 5)))
+    for stats in results['1000'].values():
+        assert stats['requests'] > 0
+        assert 0 < stats['p50_ms'] <= stats['p99_ms']
+
+
+def test_compare_flags_p50_regressions():
+    baseline = {'results': {'1000': {'get': {'p50_ms': 1.0}, 'add': {'p50_ms': 1.0}}}}
+    results = {'1000': {'get': {'p50_ms': 1.5}, 'add': {'p50_ms': 1.1}, 'user': {'p50_ms': 9.0}}}
+
+    regressions = bench_api.compare(results, baseline, tolerance=0.25, out=io.StringIO())
+
+    assert len(regressions) == 2
+    assert regressions[0].startswith('1000 get:')
+    # A scenario missing from the baseline fails instead of going unchecked
+    assert regressions[1] == '1000 user: not in the baseline'
+
+
+def test_baseline_covers_every_scenario_and_size():
+    with open(bench_api.BASELINE) as f:
+        baseline = json.load(f)
+
+    assert set(baseline['results']) == {str(size) for size in bench_api.SIZES}
+    for named in baseline['results'].values():
+        assert set(named) == set(bench_api.scenarios(bench_api.Dataset(1000, 5)))
+
+
+def test_serialization_benchmark_runs_every_path():
+    results = bench_serialization.run(100, repeat=1, out=io.StringIO())
+
+    assert 'end to end: hand-written + json' in results
+    assert all(milliseconds > 0 for milliseconds in results.values())
+
+
+def test_async_benchmark_runs_both_modes():
+    results = bench_async.run(1000, requests=8, concurrency=[2, 4], threads=2, streams=[0, 2], latency=0, only=['user', 'add'], out=io.StringIO())
+
+    assert results['user clients=4 streams=2']['sync'] is None
+    for key in ('user clients=2 streams=0', 'user clients=4 streams=0', 'user clients=4 streams=2'):
+        assert results[key]['async']['rps'] > 0
+    assert results['user clients=2 streams=0']['sync']['rps'] > 0
+    assert all(results['add clients=4 streams=0'][mode]['rps'] > 0 for mode in ('sync', 'async'))
+
+
+def test_logging_benchmark_runs_every_mode():
+    results = bench_logging.run(1000, requests=20, concurrency=2, sample_rate=0, out=io.StringIO())
+
+    assert list(results) == bench_logging.MODES
+    assert results['sync']['lines'] == results['queue']['lines'] == 40
+    assert results['sampled']['lines'] == results['disabled']['lines'] == 0
@@ -0,0 +1,158 @@
+import time
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from datetime import date
+from cache import QueryCache, TokenCache
+
+PRIVATE_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+PUBLIC_KEY = PRIVATE_KEY.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+
+
+class Clock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def sign(uid: str, expires_in: float, now: float) -> str:
+    return jwt.encode({'uid': uid, 'iat': int(now), 'exp': int(now + expires_in)}, PRIVATE_KEY, algorithm='RS256')
+
+
+class Verifier:
+    """Verifies RS256 tokens against the locally generated key and counts the verifications."""
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, token: str) -> dict:
+        self.calls += 1
+        return jwt.decode(token, PUBLIC_KEY, algorithms=['RS256'], options={'verify_exp': False})
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def verifier():
+    return Verifier()
+
+
+class TestTokenCache:
+    def test_repeat_requests_skip_verification(self, clock, verifier):
+        cache = TokenCache(ttl=300, timer=clock)
+        token = sign('user', 3600, clock.now)
+
+        for _ in range(5):
+            assert cache.verify(token, verifier)['uid'] == 'user'
+
+        assert verifier.calls == 1
+        assert cache.stats() == {'hits': 4, 'misses': 1, 'size': 1}
+
+    def test_ttl_expiry(self, clock, verifier):
+        cache = TokenCache(ttl=300, timer=clock)
+        token = sign('user', 3600, clock.now)
+
+        cache.verify(token, verifier)
+        clock.now += 301
+        cache.verify(token, verifier)
+
+        assert verifier.calls == 2
+
+    def test_expiry_capped_at_token_exp(self, clock, verifier):
+        cache = TokenCache(ttl=300, timer=clock)
+        token = sign('user', 60, clock.now)
+
+        cache.verify(token, verifier)
+        clock.now += 30
+        cache.verify(token, verifier)
+        clock.now += 31
+        cache.verify(token, verifier)
+
+        assert verifier.calls == 2
+
+    def test_invalid_tokens_are_not_cached(self, clock, verifier):
+        cache = TokenCache(timer=clock)
+        forged = sign('user', 3600, clock.now)[:-4] + 'AAAA'
+
+        for _ in range(2):
+            with pytest.raises(jwt.InvalidSignatureError):
+                cache.verify(forged, verifier)
+
+        assert cache.stats()['size'] == 0
+
+    def test_bounded_size(self, clock, verifier):
+        cache = TokenCache(maxsize=2, timer=clock)
+        tokens = [sign(f'user{i}', 3600, clock.now) for i in range(3)]
+
+        for token in tokens:
+            cache.verify(token, verifier)
+
+        assert cache.stats()['size'] == 2
+        assert cache.get(tokens[0]) is None
+        assert cache.get(tokens[2])['uid'] == 'user2'
+
+    def test_clear_keeps_the_counters(self, clock, verifier):
+        cache = TokenCache(timer=clock)
+        token = sign('user', 3600, clock.now)
+        cache.verify(token, verifier)
+        cache.verify(token, verifier)
+
+        cache.clear()
+
+        assert cache.stats() == {'hits': 1, 'misses': 1, 'size': 0}
+
+
+class TestQueryCache:
+    DAY = date(2099, 1, 1)
+    NEXT_DAY = date(2099, 1, 2)
+
+    def test_hits_and_lru_eviction(self, clock):
+        cache = QueryCache(maxsize=2, ttl=30, timer=clock)
+        cache.put('a', [1])
+        cache.put('b', [2])
+        assert cache.get('a') == [1]
+        cache.put('c', [3])
+
+        assert cache.get('b') is None
+        assert cache.get('c') == [3]
+        assert cache.stats() == {'hits': 2, 'misses': 1, 'hit_rate': 2 / 3, 'invalidations': 0, 'size': 2}
+
+    def test_ttl_expiry(self, clock):
+        cache = QueryCache(ttl=30, timer=clock)
+        cache.put('a', [1])
+        clock.now += 31
+        assert cache.get('a') is None
+
+    def test_invalidates_only_matching_space_and_day(self, clock):
+        cache = QueryCache(timer=clock)
+        cache.put('space', 1, 'A1')
+        cache.put('other space', 2, 'A2')
+        cache.put('day', 3, 'A1', self.DAY, self.DAY)
+        cache.put('other day', 4, 'A1', self.NEXT_DAY, self.NEXT_DAY)
+        cache.put('from day', 5, None, self.DAY, None)
+
+        assert cache.invalidate('A1', self.DAY) == 3
+        assert [key for key in ('space', 'other space', 'day', 'other day', 'from day') if cache.get(key) is not None] == ['other space', 'other day']
+
+    def test_drops_results_older_than_an_invalidation(self, clock):
+        cache = QueryCache(timer=clock)
+        generation = cache.generation
+        cache.invalidate('A1', self.DAY)
+        cache.put('a', [1], 'A2', generation=generation)
+        assert cache.get('a') is None
+
+    def test_clear_keeps_the_counters(self, clock):
+        cache = QueryCache(timer=clock)
+        cache.put('a', [1], 'A1', self.DAY, self.DAY)
+        cache.get('a')
+        cache.invalidate('A1', self.DAY)
+        cache.get('a')
+
+        cache.clear()
+
+        assert cache.stats() == {'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'invalidations': 1, 'size': 0}
@@ -0,0 +1,49 @@
+from dataclasses import asdict
+from datetime import date, datetime, timezone
+import pytest
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+import encoding
+from encoding import FastJSONProvider
+from typedef import Reservation
+
+RESERVATION = Reservation('r1', 'user', 'A1', datetime(2099, 1, 1, 9, tzinfo=timezone.utc), datetime(2099, 1, 1, 10, tzinfo=timezone.utc))
+
+
+def reference_dict(reservation: Reservation) -> dict:
+    """The original asdict()-based encoding, which the hand-written encoder must reproduce."""
+    data = asdict(reservation)
+    data['start_timestamp'] = reservation.start_timestamp.isoformat()
+    data['end_timestamp'] = reservation.end_timestamp.isoformat()
+    return data
+
+
+class TestReservationEncoding:
+    def test_matches_asdict(self):
+        assert RESERVATION.to_dict() == reference_dict(RESERVATION)
+        assert list(RESERVATION.to_dict()) == list(reference_dict(RESERVATION))
+
+    def test_restricts_and_projects(self):
+        public = {key: value for key, value in reference_dict(RESERVATION).items() if key != 'user_id'}
+        assert Reservation.jsonify_list([RESERVATION], restrict_user_id=True) == [public]
+        assert Reservation.jsonify_list([RESERVATION], restrict_user_id=True, fields=['user_id', 'start_timestamp']) == [
+            {'start_timestamp': '2099-01-01T09:00:00+00:00'}
+        ]
+
+    def test_uses_slots(self):
+        assert not hasattr(RESERVATION, '__dict__')
+
+
+@pytest.mark.parametrize('orjson', [encoding.orjson, None])
+@pytest.mark.parametrize('debug', [False, True])
+def test_provider_matches_default(monkeypatch, orjson, debug):
+    monkeypatch.setattr(encoding, 'orjson', orjson)
+    app = Flask(__name__)
+    app.debug = debug
+    payload = {'b': [RESERVATION.to_dict(), None, 1.5, 2 ** 70], 'a': datetime(2099, 1, 1, tzinfo=timezone.utc), 'c': date(2099, 1, 2)}
+
+    with app.app_context():
+        fast = FastJSONProvider(app).response(payload).get_data(as_text=True)
+        default = DefaultJSONProvider(app).response(payload).get_data(as_text=True)
+
+    assert fast == default
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from database.feed import AvailabilityFeed
+from database.memory import MemoryFirestore
+
+START = (datetime.now(timezone.utc) + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+END = START + timedelta(hours=1)
+
+
+def reservation(space_id: str, start: datetime = START, status: str = 'active') -> dict:
+    return {'user_id': 'user', 'space_id': space_id, 'start_timestamp': start, 'end_timestamp': start + timedelta(hours=1), 'status': status}
+
+
+@pytest.fixture
+def db():
+    fake = MemoryFirestore()
+    fake.load('reservations', [('existing', reservation('A3'))])
+    return fake
+
+
+@pytest.fixture
+def feed(db):
+    feed = AvailabilityFeed(db, queue_size=4)
+    yield feed
+    feed.close()
+
+
+def drain(subscription) -> list:
+    deltas = []
+    while (event := subscription.get(timeout=0)) is not None:
+        deltas.append((event[1]['status'], event[1]['space_id']))
+    return deltas
+
+
+class TestAvailabilityFeed:
+    def test_publishes_changes_after_the_initial_snapshot(self, db, feed):
+        subscription = feed.subscribe()
+        assert drain(subscription) == []
+
+        reservations = db.collection('reservations')
+        reservations.document('new').set(reservation('A1'))
+        reservations.document('existing').delete()
+        assert drain(subscription) == [('reserved', 'A1'), ('released', 'A3')]
+
+        reservations.document('later').set(reservation('A1', START + timedelta(hours=2)))
+        _, delta = subscription.get(timeout=0)
+        assert delta['slots'] == [44, 4]
+        assert delta['date'] == START.date().isoformat()
+
+    def test_one_listener_fans_out_by_space(self, db, feed):
+        everything, a2_only = feed.subscribe(), feed.subscribe(['A2'])
+        assert len(db._watches) == 1
+
+        db.collection('reservations').document('a1').set(reservation('A1'))
+        db.collection('reservations').document('a2').set(reservation('A2'))
+        assert drain(everything) == [('reserved', 'A1'), ('reserved', 'A2')]
+        assert drain(a2_only) == [('reserved', 'A2')]
+
+    def test_status_changes_and_unrelated_updates(self, db, feed):
+        subscription = feed.subscribe()
+        reservations = db.collection('reservations')
+        reservations.document('existing').update({'note': 'unrelated'})
+        reservations.document('existing').update({'status': 'cancelled'})
+        assert drain(subscription) == [('released', 'A3')]
+
+    def test_slow_subscribers_overflow_without_blocking_others(self, db, feed):
+        slow, fast = feed.subscribe(), feed.subscribe()
+        for index in range(6):
+            db.collection('reservations').document(f'r{index}').set(reservation('A1', START + timedelta(hours=index)))
+            drain(fast)
+
+        assert slow.overflowed and not fast.overflowed
+
+    def test_unsubscribe(self, db, feed):
+        subscription = feed.subscribe()
+        feed.unsubscribe(subscription)
+        db.collection('reservations').document('new').set(reservation('A1'))
+        assert drain(subscription) == [] and feed.subscriber_count() == 0
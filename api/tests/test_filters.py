@@ -0,0 +1,69 @@
+from datetime import datetime, timezone
+import pytest
+from database.filters import Interval, compile_filters, parse_filter
+from exceptions import ClientError
+
+NINE = datetime(2099, 1, 1, 9, tzinfo=timezone.utc)
+TEN = datetime(2099, 1, 1, 10, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize('value, interval', [
+    ('2099-01-01T09:00:00Z', Interval(lower=NINE, upper=NINE)),
+    ('==2099-01-01T09:00:00', Interval(lower=NINE, upper=NINE)),
+    ('>=2099-01-01T11:00:00+02:00', Interval(lower=NINE)),
+    ('<2099-01-01T10:00:00Z', Interval(upper=TEN, upper_inclusive=False)),
+    ('!=2099-01-01T09:00:00Z', Interval(excluded=NINE)),
+    ('[2099-01-01T09:00:00Z,2099-01-01T10:00:00Z)', Interval(lower=NINE, upper=TEN, upper_inclusive=False)),
+    ('(2099-01-01T09:00:00Z,]', Interval(lower=NINE, lower_inclusive=False)),
+])
+def test_parses_operators_and_ranges_to_utc(value, interval):
+    assert parse_filter(value) == interval
+
+
+@pytest.mark.parametrize('value', ['tomorrow', '>=', '[2099-01-01T09:00:00Z]', '[a,b)', '=>2099-01-01T09:00:00Z'])
+def test_rejects_invalid_filters(value):
+    with pytest.raises(ClientError) as error:
+        parse_filter(value)
+    assert error.value.code == 400
+
+
+def test_pushes_the_best_range_and_checks_the_rest_in_memory():
+    plan = compile_filters('>=2099-01-01T08:00:00Z', '[2099-01-01T09:00:00Z,2099-01-01T10:00:00Z]')
+
+    assert plan.range_field == 'end_timestamp'
+    assert plan.conditions == (('end_timestamp', '>=', NINE), ('end_timestamp', '<=', TEN))
+    assert plan.predicate_fields == ['start_timestamp']
+
+    # The order field is preferred, so Firestore can sort on its range
+    assert compile_filters('>=2099-01-01T08:00:00Z', '[2099-01-01T09:00:00Z,2099-01-01T10:00:00Z]', 'start_timestamp').range_field == 'start_timestamp'
+
+
+def test_each_field_bounds_the_other():
+    # A reservation lasts at most a day, so the end of a day window also bounds its start
+    plan = compile_filters('>=2099-01-01T00:00:00Z', '<=2099-01-02T00:00:00Z')
+
+    assert plan.range_field == 'start_timestamp'
+    assert plan.conditions == (
+        ('start_timestamp', '>=', datetime(2099, 1, 1, tzinfo=timezone.utc)),
+        ('start_timestamp', '<', datetime(2099, 1, 2, tzinfo=timezone.utc)),
+    )
+    assert plan.predicate_fields == ['end_timestamp']
+    assert compile_filters('>=2099-01-01T10:00:00Z', '<=2099-01-01T09:00:00Z').empty
+
+
+def test_equalities_are_pushed_and_exclusions_are_not():
+    plan = compile_filters('2099-01-01T09:00:00Z', '!=2099-01-01T10:00:00Z')
+
+    assert plan.range_field is None
+    assert plan.conditions == (('start_timestamp', '==', NINE),)
+    assert plan.predicates == (('end_timestamp', Interval(excluded=TEN)),)
+
+
+def test_empty_ranges_need_no_query():
+    assert compile_filters('[2099-01-01T10:00:00Z,2099-01-01T09:00:00Z]').empty
+    assert compile_filters('(2099-01-01T09:00:00Z,2099-01-01T09:00:00Z]').empty
+    assert not compile_filters('[2099-01-01T09:00:00Z,2099-01-01T09:00:00Z]').empty
+
+
+def test_plans_are_cached_by_filter():
+    assert compile_filters('>=2099-01-01T09:00:00Z') is compile_filters('>=2099-01-01T09:00:00Z')
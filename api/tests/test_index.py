@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta, timezone
+from database.index import IntervalIndex
+
+BASE = datetime(2099, 1, 1, 9, 0, tzinfo=timezone.utc)
+
+
+def at(minutes: int) -> datetime:
+    return BASE + timedelta(minutes=minutes)
+
+
+class TestIntervalIndex:
+    def test_has_reservations_after(self):
+        index = IntervalIndex()
+        index.add('r1', 'A1', at(0), at(60))
+        index.add('r2', 'A1', at(120), at(150))
+
+        assert index.has_reservations_after('A1', at(140))
+        assert not index.has_reservations_after('A1', at(150))
+        assert not index.has_reservations_after('A2', at(0))
+
+    def test_remove(self):
+        index = IntervalIndex()
+        index.add('r1', 'A1', at(0), at(60))
+
+        assert index.remove('r1') == ('A1', at(0), at(60))
+        assert index.remove('r1') is None
+        assert not index.has_reservations_after('A1', at(0))
+        assert len(index) == 0
+
+    def test_load_replaces_contents(self):
+        index = IntervalIndex()
+        index.add('old', 'A1', at(0), at(60))
+        index.load([('r2', 'B1', at(30), at(60)), ('r1', 'B1', at(0), at(15))])
+
+        assert index.get('old') is None
+        assert not index.has_reservations_after('A1', at(0))
+        assert index.has_reservations_after('B1', at(45))
+        assert index.get('r2') == ('B1', at(30), at(60))
@@ -0,0 +1,69 @@
+import json
+import logging
+import queue
+from flask import Flask
+from logger import DroppingQueueHandler, JSONFormatter, get_logger
+
+
+def make_logger(name: str, handler: logging.Handler, level: int = logging.DEBUG) -> logging.Logger:
+    logger = logging.getLogger(f'test.{name}')
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(level)
+    return logger
+
+
+def test_records_are_queued_as_structured_json():
+    records = queue.Queue()
+    logger = make_logger('json', DroppingQueueHandler(records))
+    app = Flask(__name__)
+
+    with app.test_request_context('/api/reservations/get', method='GET'):
+        logger.info("Fetched %d reservations", 3, extra={'fields': {'space_id': 'A1'}})
+
+    entry = json.loads(JSONFormatter().format(records.get_nowait()))
+    assert entry['message'] == 'Fetched 3 reservations'
+    assert entry['level'] == 'INFO' and entry['logger'] == 'test.json'
+    assert entry['request'] == {'method': 'GET', 'path': '/api/reservations/get'}
+    assert entry['space_id'] == 'A1'
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=2))
+    logger = make_logger('full', handler)
+
+    for i in range(5):
+        logger.info("Record %d", i)
+
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+
+def test_debug_records_are_sampled_per_request():
+    records = queue.Queue()
+    handler = DroppingQueueHandler(records, debug_sample_rate=0.5)
+    logger = make_logger('sampled', handler)
+    app = Flask(__name__)
+
+    counts = []
+    for _ in range(40):
+        with app.test_request_context():
+            before = records.qsize()
+            logger.debug("first")
+            logger.debug("second")
+            logger.warning("always kept")
+            counts.append(records.qsize() - before)
+
+    # A request keeps both of its debug records or neither
+    assert set(counts) == {1, 3}
+
+
+def test_level_gating_skips_disabled_records():
+    records = queue.Queue()
+    logger = make_logger('gated', DroppingQueueHandler(records), level=logging.INFO)
+
+    logger.debug("not built")
+
+    assert not logger.isEnabledFor(logging.DEBUG)
+    assert records.empty()
+    assert get_logger('routes.reservations').name == 'reserveease.routes.reservations'
@@ -0,0 +1,141 @@
+import random
+from threading import Thread
+from datetime import datetime, timedelta, timezone
+import pytest
+from firebase_admin import firestore
+from google.api_core import exceptions
+from database.memory import OPERATORS, MemoryFirestore
+
+BASE = datetime(2099, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def client():
+    client = MemoryFirestore()
+    rng = random.Random(7)
+    batch = client.batch()
+    for i in range(500):
+        start = BASE + timedelta(minutes=15 * rng.randrange(200))
+        batch.set(client.collection('reservations').document(f'r{i:03d}'), {
+            'space_id': rng.choice(['A1', 'A2', 'B1']),
+            'user_id': rng.choice(['u1', 'u2']),
+            'start_timestamp': start,
+            'end_timestamp': start + timedelta(minutes=15 * rng.randrange(1, 7)),
+            'status': 'active',
+        })
+    batch.commit()
+    return client
+
+
+class TestMemoryFirestore:
+    @pytest.mark.parametrize('filters', [
+        [('space_id', '==', 'A1')],
+        [('space_id', '==', 'A1'), ('user_id', '==', 'u2')],
+        [('start_timestamp', '>=', BASE + timedelta(hours=10))],
+        [('start_timestamp', '<', BASE + timedelta(hours=30)), ('end_timestamp', '>', BASE + timedelta(hours=29))],
+        [('space_id', '==', 'B1'), ('end_timestamp', '<=', BASE + timedelta(hours=5))],
+        [('space_id', '!=', 'B1')],
+        [('start_timestamp', '==', BASE + timedelta(hours=3))],
+        [('space_id', '==', 'missing')],
+    ])
+    def test_indexed_queries_match_full_scan(self, client, filters):
+        query = client.collection('reservations')
+        for field, op, value in filters:
+            query = query.where(field, op, value)
+        expected = sorted(
+            doc.id for doc in client.collection('reservations').stream()
+            if all(OPERATORS[op](doc.get(field), value) for field, op, value in filters)
+        )
+
+        assert [doc.id for doc in query.stream()] == expected
+
+    def test_indexes_follow_updates_and_deletes(self, client):
+        reference = client.collection('reservations').document('r000')
+        reference.update({'space_id': 'Z9'})
+        assert [doc.id for doc in client.collection('reservations').where('space_id', '==', 'Z9').stream()] == ['r000']
+
+        reference.delete()
+        assert not reference.get().exists
+        assert list(client.collection('reservations').where('space_id', '==', 'Z9').stream()) == []
+
+    def test_bulk_load_matches_writes(self, client):
+        loaded = MemoryFirestore()
+        loaded.load('reservations', ((doc.id, doc.to_dict()) for doc in client.collection('reservations').stream()))
+        window = ('start_timestamp', '<', BASE + timedelta(hours=20)), ('end_timestamp', '>', BASE + timedelta(hours=19))
+
+        def ids(source):
+            query = source.collection('reservations')
+            for field, op, value in window:
+                query = query.where(field, op, value)
+            return [doc.id for doc in query.stream()]
+
+        assert ids(loaded) == ids(client)
+
+    def test_naive_datetimes_are_utc(self, client):
+        reference = client.collection('events').document('e1')
+        reference.set({'at': datetime(2099, 1, 1, 9), 'created_at': firestore.SERVER_TIMESTAMP})
+
+        assert reference.get().get('at') == datetime(2099, 1, 1, 9, tzinfo=timezone.utc)
+        assert reference.get().get('created_at').tzinfo is not None
+        assert len(list(client.collection('events').where('at', '==', datetime(2099, 1, 1, 9)).stream())) == 1
+
+    def test_create_requires_missing_document(self, client):
+        with pytest.raises(exceptions.AlreadyExists):
+            client.collection('reservations').document('r001').create({'space_id': 'A1'})
+
+    def test_subcollections_are_separate_collections(self, client):
+        archived = client.collection('reservations_archive').document('2099-01').collection('archived')
+        archived.document('r001').set({'space_id': 'A1'})
+
+        assert archived.id == 'archived'
+        assert [doc.id for doc in archived.stream()] == ['r001']
+        # The parent document does not exist until it is written, as in Firestore
+        assert not client.collection('reservations_archive').document('2099-01').get().exists
+        assert len(list(client.collection('reservations').stream())) == 500
+
+    def test_transaction_retries_after_contention(self, client):
+        reference = client.collection('counters').document('c1')
+        reference.set({'value': 0})
+        attempts = []
+
+        @firestore.transactional
+        def increment(transaction):
+            value = reference.get(transaction=transaction).get('value')
+            if not attempts:
+                # A concurrent writer commits between this read and the commit
+                reference.set({'value': 100})
+            attempts.append(value)
+            transaction.set(reference, {'value': value + 1})
+
+        increment(client.transaction())
+
+        assert attempts == [0, 100]
+        assert reference.get().get('value') == 101
+
+    def test_transaction_listeners_run_outside_the_lock(self, client):
+        reference = client.collection('counters').document('c1')
+        lock_free = []
+
+        def probe():
+            acquired = client._lock.acquire(timeout=1)
+            if acquired:
+                client._lock.release()
+            lock_free.append(acquired)
+
+        def on_snapshot(snapshots, changes, read_time):
+            # Another thread can take the client lock while the listener runs
+            if changes:
+                thread = Thread(target=probe)
+                thread.start()
+                thread.join()
+
+        watch = client.collection('counters').on_snapshot(on_snapshot)
+
+        @firestore.transactional
+        def create(transaction):
+            transaction.set(reference, {'value': 1})
+
+        create(client.transaction())
+        watch.unsubscribe()
+
+        assert lock_free == [True]
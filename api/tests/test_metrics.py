@@ -0,0 +1,55 @@
+import time
+from flask import Flask, g
+from metrics import Histogram, Metrics, RequestTiming, count_reads, count_writes, init_metrics, stage
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+
+    samples = {(name, labels.get('le')): value for name, labels, value in histogram.samples('t', {})}
+    assert samples[('t_bucket', '0.1')] == 2
+    assert samples[('t_bucket', '1')] == 3
+    assert samples[('t_bucket', '+Inf')] == 4
+    assert samples[('t_count', None)] == 4
+
+
+def test_render_escapes_labels_and_keeps_counter_digits():
+    metrics = Metrics()
+    metrics.observe_request('/api/"x"', 'GET', 200, 0.002)
+    metrics.count_documents('read', 12_345_678)
+
+    text = metrics.render([('extra_total', 'counter', 'More', [({}, 3)])])
+    assert 'reserveease_request_duration_seconds_count{endpoint="/api/\\"x\\"",method="GET",status="200"} 1' in text
+    assert 'reserveease_firestore_documents_total{operation="read"} 12345678' in text
+    assert '# TYPE extra_total counter\nextra_total 3' in text
+
+
+def test_nested_stages_only_count_their_own_time():
+    app = Flask(__name__)
+    init_metrics(app)
+    with app.test_request_context():
+        g.request_timing = RequestTiming()
+        started = time.perf_counter()
+        with stage('outer'):
+            time.sleep(0.01)
+            with stage('inner'):
+                time.sleep(0.01)
+        elapsed = time.perf_counter() - started
+        count_reads(3)
+        count_writes(2)
+
+        timing = g.request_timing
+        assert timing.stages['inner'] >= 0.01 and timing.stages['outer'] >= 0.01
+        assert timing.stages['outer'] + timing.stages['inner'] <= elapsed
+        assert (timing.reads, timing.writes) == (3, 2)
+        assert timing.server_timing(0.05).endswith('firestore-reads;desc="3", firestore-writes;desc="2", total;dur=50.000')
+
+
+def test_calls_without_metrics_do_nothing():
+    with stage('firestore-read'):
+        count_reads(1)
+    with Flask(__name__).app_context():
+        with stage('firestore-read'):
+            count_writes(1)
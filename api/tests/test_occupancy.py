@@ -0,0 +1,67 @@
+from datetime import date, datetime, timezone
+from database.occupancy import OccupancyMap, to_bitstring, to_ranges, to_slots
+
+DAY = date(2099, 1, 1)
+
+
+def at(hour: int, minute: int = 0) -> datetime:
+    return datetime(2099, 1, 1, hour, minute, tzinfo=timezone.utc)
+
+
+class TestOccupancyMap:
+    def test_to_slots(self):
+        assert to_slots(at(0), at(0, 15)) == (DAY, 0, 1)
+        assert to_slots(at(9), at(10, 30)) == (DAY, 36, 6)
+        assert to_slots(at(9, 5), at(9, 20)) == (DAY, 36, 2)
+
+    def test_is_free(self):
+        occupancy = OccupancyMap(['A1', 'A2'])
+        occupancy.mark('A1', at(9), at(10))
+
+        assert not occupancy.is_free('A1', at(9, 45), at(10, 15))
+        assert occupancy.is_free('A1', at(10), at(11))
+        assert occupancy.is_free('A1', at(8), at(9))
+        assert occupancy.is_free('A2', at(9), at(10))
+
+        occupancy.clear('A1', at(9), at(10))
+        assert occupancy.is_free('A1', at(9), at(10))
+        assert occupancy.bitmap('A1', DAY) == 0
+
+    def test_free_spaces(self):
+        occupancy = OccupancyMap(['A1', 'A2', 'A3'])
+        occupancy.load([('A1', at(9), at(10)), ('A3', at(10), at(11))])
+
+        assert occupancy.free_spaces(at(9), at(10)) == ['A2', 'A3']
+        assert occupancy.free_spaces(at(9, 30), at(10, 30)) == ['A2']
+
+    def test_first_free_slot(self):
+        occupancy = OccupancyMap(['A1'])
+        occupancy.load([('A1', at(0), at(9)), ('A1', at(9, 30), at(10))])
+
+        assert occupancy.first_free_slot('A1', DAY, 1) == at(9)
+        assert occupancy.first_free_slot('A1', DAY, 4) == at(10)
+        assert occupancy.first_free_slot('A1', DAY, 1, not_before=39) == at(10)
+        assert occupancy.first_free_slot('A1', DAY, 4, not_before=95) is None
+
+    def test_window(self):
+        occupancy = OccupancyMap(['A1', 'A2'])
+        occupancy.load([('A1', at(9), at(9, 30)), ('A1', at(10), at(10, 15))])
+
+        # 09:00 - 10:30
+        window = occupancy.window(DAY, 36, 6)
+        assert window == {'A1': 0b10011, 'A2': 0}
+        assert to_bitstring(window['A1'], 6) == '110010'
+        assert to_ranges(window['A1'], 6) == [(0, 2), (4, 1)]
+        assert to_ranges(window['A2'], 6) == []
+
+    def test_free_run(self):
+        occupancy = OccupancyMap(['A1'])
+        occupancy.mark('A1', at(8), at(9))
+        occupancy.mark('A1', at(10), at(11))
+
+        assert occupancy.free_run('A1', DAY, 36, 2) == 4
+        assert occupancy.free_run('A1', DAY, 36, 4) == 4
+        assert occupancy.free_run('A1', DAY, 35, 2) == 0
+        assert occupancy.free_run('A1', DAY, 44, 1) == 52
+        assert occupancy.free_run('A1', DAY, 0, 4) == 32
+        assert occupancy.free_run('A2', DAY, 10, 4) == 96
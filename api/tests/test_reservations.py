@@ -0,0 +1,352 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from threading import Barrier
+import pytest
+import database.reservations
+import database.spaces
+from exceptions import ClientError
+
+START = (datetime.now(timezone.utc) + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+END = START + timedelta(hours=1)
+
+
+def book_concurrently(count: int, space_id: str = 'A1') -> list:
+    """Fires `count` bookings of the same slot at once and returns their IDs or errors."""
+    barrier = Barrier(count)
+
+    def book(user: int):
+        barrier.wait()
+        try:
+            return database.reservations.schedule(f'user{user}', space_id, START.isoformat(), END.isoformat())
+        except ClientError as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        return list(pool.map(book, range(count)))
+
+
+class TestSchedule:
+    def test_creates_reservation_and_slot_locks(self, db):
+        reservation_id = database.reservations.schedule('user', 'A1', START.isoformat(), END.isoformat())
+
+        reservation = db.collection('reservations').document(reservation_id).get()
+        assert reservation.get('user_id') == 'user'
+        assert reservation.get('status') == 'active'
+        slots = list(db.collection('reservation_slots').where('reservation_id', '==', reservation_id).stream())
+        assert len(slots) == 4
+
+    def test_rejects_conflict(self, db):
+        database.reservations.schedule('user', 'A1', START.isoformat(), END.isoformat())
+
+        with pytest.raises(ClientError) as error:
+            database.reservations.schedule('other', 'A1', (START + timedelta(minutes=45)).isoformat(), (END + timedelta(minutes=30)).isoformat())
+        assert error.value.code == 409
+
+    @pytest.mark.parametrize('space_id', ['Z99', '', None, ['A1']])
+    def test_rejects_unknown_space_without_writing(self, db, space_id):
+        with pytest.raises(ClientError) as error:
+            database.reservations.schedule('user', space_id, START.isoformat(), END.isoformat())
+        assert error.value.code == 400
+        assert list(db.collection('reservations').stream()) == []
+
+    def test_follows_catalog_changes(self, db):
+        database.spaces.create_space({'space_id': 'F1', 'x': 0.5, 'y': 0.5})
+        assert database.reservations.schedule('user', 'F1', START.isoformat(), END.isoformat())
+
+        database.spaces.delete_space('A2')
+        with pytest.raises(ClientError) as error:
+            database.reservations.schedule('user', 'A2', START.isoformat(), END.isoformat())
+        assert error.value.code == 400
+
+    def test_delete_releases_slots(self, db):
+        reservation_id = database.reservations.schedule('user', 'A1', START.isoformat(), END.isoformat())
+        database.reservations.delete_reservation(database.reservations.get_reservations(reservation_id=reservation_id)[0])
+
+        assert list(db.collection('reservation_slots').stream()) == []
+        assert database.reservations.schedule('other', 'A1', START.isoformat(), END.isoformat())
+
+    @pytest.mark.parametrize('count', [2, 16, 64])
+    def test_parallel_bookings_of_same_slot(self, db, count):
+        results = book_concurrently(count)
+
+        booked = [result for result in results if isinstance(result, str)]
+        rejected = [result for result in results if isinstance(result, ClientError)]
+        assert len(booked) == 1
+        assert len(rejected) == count - 1
+        assert all(error.code == 409 for error in rejected)
+        assert len(list(db.collection('reservations').stream())) == 1
+
+    def test_parallel_bookings_with_stale_index(self, db, monkeypatch):
+        # Simulates bookings arriving at separate workers whose in-memory indexes have not seen each other
+        monkeypatch.setattr(database.reservations.occupancy, 'is_free', lambda *args: True)
+
+        results = book_concurrently(32)
+
+        assert sum(isinstance(result, str) for result in results) == 1
+        assert len(list(db.collection('reservations').stream())) == 1
+
+
+class TestScheduleBatch:
+    def booking(self, space_id: str, days: int = 0, hour: int = 9) -> dict:
+        start = START + timedelta(days=days, hours=hour - 9)
+        return {'space_id': space_id, 'start_timestamp': start.isoformat(), 'end_timestamp': (start + timedelta(hours=1)).isoformat()}
+
+    def test_creates_every_valid_booking(self, db):
+        results = database.reservations.schedule_batch('user', [self.booking('A1', days) for days in range(5)])
+
+        assert [result['status'] for result in results] == [201] * 5
+        assert len(list(db.collection('reservations').stream())) == 5
+        assert len(list(db.collection('reservation_slots').stream())) == 20
+
+    def test_reports_each_rejection(self, db):
+        existing = database.reservations.schedule('other', 'B1', START.isoformat(), END.isoformat())
+        invalid = {'space_id': 'A2', 'start_timestamp': 'tomorrow', 'end_timestamp': END.isoformat()}
+
+        results = database.reservations.schedule_batch('user', [
+            self.booking('A1'),
+            self.booking('A1'),
+            self.booking('B1'),
+            invalid,
+            {'space_id': 'A3'},
+            self.booking('Z99'),
+            self.booking('A1', hour=11),
+        ])
+
+        assert [result['status'] for result in results] == [201, 409, 409, 400, 400, 400, 201]
+        assert len(list(db.collection('reservations').stream())) == 3
+        assert existing not in [result.get('id') for result in results]
+
+    def test_rejects_oversized_batch(self, db):
+        with pytest.raises(ClientError):
+            database.reservations.schedule_batch('user', [self.booking('A1', days) for days in range(database.reservations.MAX_BATCH_SIZE + 1)])
+
+
+class TestCancelReservations:
+    def test_deletes_only_owned_reservations(self, db):
+        mine = database.reservations.schedule('user', 'A1', START.isoformat(), END.isoformat())
+        theirs = database.reservations.schedule('other', 'A2', START.isoformat(), END.isoformat())
+
+        results = database.reservations.cancel_reservations('user', [mine, theirs, 'missing'])
+
+        assert [result['status'] for result in results] == [200, 403, 404]
+        assert [doc.id for doc in db.collection('reservations').stream()] == [theirs]
+        assert all(doc.get('reservation_id') == theirs for doc in db.collection('reservation_slots').stream())
+        assert database.reservations.occupancy.is_free('A1', START, END)
+
+
+class TestUserReservations:
+    def load(self, db, hours: list) -> None:
+        """Stores reservations of 'user' written before the index existed, starting the given hours from the next START."""
+        db.load('reservations', [
+            (f'old{i}', {
+                'user_id': 'user',
+                'space_id': 'A3',
+                'start_timestamp': START + timedelta(hours=offset),
+                'end_timestamp': START + timedelta(hours=offset, minutes=30),
+                'status': 'active',
+            })
+            for i, offset in enumerate(hours)
+        ])
+
+    def upcoming(self) -> list:
+        return [reservation.reservation_id for reservation in database.reservations.get_upcoming_reservations('user')]
+
+    def test_index_follows_creates_and_deletes(self, db):
+        first = database.reservations.schedule('user', 'A1', START.isoformat(), END.isoformat())
+        batch = database.reservations.schedule_batch('user', [
+            {'space_id': 'A2', 'start_timestamp': (START - timedelta(hours=2)).isoformat(), 'end_timestamp': (END - timedelta(hours=2)).isoformat()},
+            {'space_id': 'A2', 'start_timestamp': (START + timedelta(hours=2)).isoformat(), 'end_timestamp': (END + timedelta(hours=2)).isoformat()},
+        ])
+        earlier, later = [result['id'] for result in batch]
+        database.reservations.schedule('other', 'A4', START.isoformat(), END.isoformat())
+
+        assert self.upcoming() == [earlier, first, later]
+        database.reservations.cancel_reservations('user', [earlier])
+        database.reservations.delete_reservation(database.reservations.get_reservations(reservation_id=later)[0])
+
+        assert self.upcoming() == [first]
+        assert list(db.collection('user_reservations').document('user').get().get('reservations')) == [first]
+
+    def test_builds_a_missing_index_from_the_reservations(self, db):
+        self.load(db, [-48, 2, 1])
+
+        # Reading it once stores it, so a booking then keeps the older reservations
+        assert self.upcoming() == ['old2', 'old1']
+        assert db.collection('user_reservations').document('user').get().exists
+        reservation_id = database.reservations.schedule('user', 'A1', START.isoformat(), END.isoformat())
+        assert self.upcoming() == [reservation_id, 'old2', 'old1']
+
+    def test_first_booking_builds_the_index(self, db):
+        self.load(db, [1])
+
+        reservation_id = database.reservations.schedule('user', 'A1', START.isoformat(), END.isoformat())
+
+        assert set(db.collection('user_reservations').document('user').get().get('reservations')) == {'old0', reservation_id}
+
+    def test_concurrent_first_reads_build_the_index_once(self, db):
+        self.load(db, [1, 2])
+        # Round trips keep the transactions open long enough to overlap
+        db.latency = 0.002
+        barrier = Barrier(16)
+
+        def read(_):
+            barrier.wait()
+            return self.upcoming()
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(read, range(16)))
+
+        assert results == [['old0', 'old1']] * 16
+
+    def test_history_continues_into_the_archive(self, db):
+        self.load(db, [-72, -48, -24, 1])
+        database.reservations.archive_reservations(before=START - timedelta(hours=36))
+
+        first = database.reservations.get_reservation_history('user', limit=2)
+        second = database.reservations.get_reservation_history('user', limit=2, page_token=first.next_page_token)
+
+        assert [reservation.reservation_id for reservation in first] == ['old2', 'old1']
+        assert [reservation.reservation_id for reservation in second] == ['old0']
+        assert second.next_page_token is None
+
+    def test_history_pages_reservations_that_ended(self, db):
+        self.load(db, [-72, -48, -24, 1])
+
+        first = database.reservations.get_reservation_history('user', limit=2)
+        second = database.reservations.get_reservation_history('user', limit=2, page_token=first.next_page_token)
+
+        assert [reservation.reservation_id for reservation in first] == ['old2', 'old1']
+        assert [reservation.reservation_id for reservation in second] == ['old0']
+        assert second.next_page_token is None
+
+
+class TestArchiveReservations:
+    def test_moves_ended_reservations_in_batches(self, db):
+        ended = [START - timedelta(days=days) for days in (1, 2, 3)]
+        db.load('reservations', [
+            (f'old{i}', {'user_id': 'user', 'space_id': 'A1', 'start_timestamp': start, 'end_timestamp': start + timedelta(hours=1), 'status': 'active'})
+            for i, start in enumerate(ended)
+        ])
+        db.load('reservation_slots', [
+            (slot_id, {'reservation_id': f'old{i}', 'space_id': 'A1'})
+            for i, start in enumerate(ended)
+            for slot_id in database.reservations.slot_ids('A1', start, start + timedelta(hours=1))
+        ])
+        live = database.reservations.schedule('user', 'A1', START.isoformat(), END.isoformat())
+
+        assert database.reservations.archive_reservations(batch_size=2) == 3
+
+        assert [doc.id for doc in db.collection('reservations').stream()] == [live]
+        assert {doc.get('reservation_id') for doc in db.collection('reservation_slots').stream()} == {live}
+        archived = [
+            doc
+            for partition in db.collection('reservations_archive').stream()
+            for doc in db.collection('reservations_archive').document(partition.id).collection('archived').stream()
+        ]
+        assert sorted(doc.id for doc in archived) == ['old0', 'old1', 'old2']
+        assert {doc.get('status') for doc in archived} == {'completed'}
+        assert database.reservations.archive_reservations() == 0
+
+    def test_rejects_a_future_cutoff(self, db):
+        live = database.reservations.schedule('user', 'A1', START.isoformat(), END.isoformat())
+
+        with pytest.raises(ClientError):
+            database.reservations.archive_reservations(before=END + timedelta(days=1))
+
+        assert [doc.id for doc in db.collection('reservations').stream()] == [live]
+        assert len(list(db.collection('reservation_slots').stream())) == 4
+        assert not database.reservations.occupancy.is_free('A1', START, END)
+
+    def test_rejects_oversized_batches(self, db):
+        with pytest.raises(ClientError):
+            database.reservations.archive_reservations(batch_size=database.reservations.MAX_BATCH_SIZE + 1)
+
+
+class TestGetReservationsPagination:
+    @pytest.fixture
+    def seeded(self, db):
+        # Two reservations share each start time, so pages must break ties on the ID
+        db.load('reservations', [
+            (f'r{i:02d}', {
+                'user_id': 'user',
+                'space_id': f'A{i % 2 + 1}',
+                'start_timestamp': START + timedelta(hours=i // 2),
+                'end_timestamp': START + timedelta(hours=i // 2, minutes=30),
+                'status': 'active',
+            })
+            for i in range(9)
+        ])
+        return db
+
+    def pages(self, **kwargs) -> list:
+        pages, token = [], None
+        while True:
+            page = database.reservations.get_reservations(page_token=token, **kwargs)
+            pages.append([reservation.reservation_id for reservation in page])
+            token = page.next_page_token
+            if token is None:
+                return pages
+
+    def test_pages_cover_every_reservation_once(self, seeded):
+        assert self.pages(limit=4) == [['r00', 'r01', 'r02', 'r03'], ['r04', 'r05', 'r06', 'r07'], ['r08']]
+        assert self.pages(limit=3, order_by='-start_timestamp') == [['r08', 'r07', 'r06'], ['r05', 'r04', 'r03'], ['r02', 'r01', 'r00']]
+
+    def test_pages_follow_filters(self, seeded):
+        pages = self.pages(limit=2, space_id='A1', start_timestamp=f'>={(START + timedelta(hours=1)).isoformat()}')
+        assert pages == [['r02', 'r04'], ['r06', 'r08']]
+
+    def test_ranges_and_in_memory_predicates_page_correctly(self, seeded):
+        window = f'[{(START + timedelta(hours=1)).isoformat()},{(START + timedelta(hours=4)).isoformat()})'
+        excluded = f'!={(START + timedelta(hours=2, minutes=30)).isoformat()}'
+
+        assert self.pages(limit=2, start_timestamp=window) == [['r02', 'r03'], ['r04', 'r05'], ['r06', 'r07']]
+        # The exclusion is checked in memory, so pages keep reading until they are full
+        assert self.pages(limit=2, start_timestamp=window, end_timestamp=excluded) == [['r02', 'r03'], ['r06', 'r07']]
+        assert self.pages(limit=3, start_timestamp=f'>={START.isoformat()}', end_timestamp=f'({(START + timedelta(hours=3)).isoformat()},]') == [['r06', 'r07', 'r08']]
+
+    def test_predicate_fields_stay_out_of_projections(self, seeded):
+        page = database.reservations.get_reservations(fields=['space_id'], end_timestamp=f'!={START.isoformat()}')
+        assert len(page) == 9
+        assert all(reservation.end_timestamp is None for reservation in page)
+
+    def test_empty_range_skips_the_query(self, seeded):
+        assert database.reservations.get_reservations(start_timestamp=f'({START.isoformat()},{START.isoformat()})') == []
+
+    def test_projection_leaves_other_fields_empty(self, seeded):
+        page = database.reservations.get_reservations(limit=1, order_by='start_timestamp', fields=['space_id'])
+        assert page[0].space_id == 'A1'
+        assert page[0].user_id is None and page[0].end_timestamp is None
+        assert self.pages(limit=5, order_by='start_timestamp', fields=['reservation_id'])[1] == ['r05', 'r06', 'r07', 'r08']
+
+    def test_unpaginated_returns_everything(self, seeded):
+        reservations = database.reservations.get_reservations()
+        assert len(reservations) == 9
+        assert reservations.next_page_token is None
+
+    @pytest.mark.parametrize('kwargs', [
+        {'limit': 0},
+        {'limit': database.reservations.MAX_PAGE_SIZE + 1},
+        {'order_by': 'user_id'},
+        {'fields': ['status']},
+        {'page_token': 'not-a-token'},
+    ])
+    def test_rejects_invalid_arguments(self, seeded, kwargs):
+        with pytest.raises(ClientError) as error:
+            database.reservations.get_reservations(**kwargs)
+        assert error.value.code == 400
+
+    def test_rejects_token_of_another_order(self, seeded):
+        token = database.reservations.get_reservations(limit=2).next_page_token
+        with pytest.raises(ClientError):
+            database.reservations.get_reservations(limit=2, page_token=token, order_by='end_timestamp')
+
+
+class TestStreamReservations:
+    def test_streams_lazily_after_validating(self, db):
+        database.reservations.schedule('user', 'A1', START.isoformat(), END.isoformat())
+
+        with pytest.raises(ClientError):
+            database.reservations.stream_reservations(order_by='status')
+        reservations = database.reservations.stream_reservations(space_id='A1', fields=['space_id'])
+        assert not isinstance(reservations, list)
+        assert [(reservation.space_id, reservation.start_timestamp) for reservation in reservations] == [('A1', None)]
@@ -0,0 +1,241 @@
+from datetime import datetime, timedelta, timezone
+import json
+import pytest
+from app import create_app
+from config import Config
+from database.memory import MemoryFirestore
+
+START = (datetime.now(timezone.utc) + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+END = START + timedelta(hours=1)
+AUTH = {'Authorization': 'Bearer test-token'}
+
+
+@pytest.fixture
+def client():
+    """Test client of an app backed by a fresh in-memory Firestore, with no network access."""
+    app = create_app(client=MemoryFirestore())
+    return app.test_client()
+
+
+class TestReservationRoutes:
+    def test_add_list_and_delete(self, client):
+        response = client.post('/api/reservations/add', headers=AUTH, json={
+            'space_id': 'A1', 'start_timestamp': START.isoformat(), 'end_timestamp': END.isoformat()
+        })
+        assert response.status_code == 201
+        reservation_id = response.json['id']
+
+        reservations = client.get('/api/reservations/user', headers=AUTH).json
+        assert [reservation['reservation_id'] for reservation in reservations] == [reservation_id]
+
+        public = client.get('/api/reservations/get', query_string={'space_id': 'A1'}).json
+        assert 'user_id' not in public[0]
+
+        assert client.delete(f'/api/reservations/delete/{reservation_id}', headers=AUTH).status_code == 200
+        assert client.get('/api/reservations/user', headers=AUTH).json == []
+
+    def test_user_history_is_opt_in(self, client):
+        client.post('/api/reservations/add', headers=AUTH, json={
+            'space_id': 'A1', 'start_timestamp': START.isoformat(), 'end_timestamp': END.isoformat()
+        })
+
+        history = client.get('/api/reservations/user', headers=AUTH, query_string={'history': 'true', 'limit': 10})
+        assert history.json == {'reservations': [], 'next_page_token': None}
+        assert client.get('/api/reservations/user', headers=AUTH, query_string={'history': 'true', 'limit': 'ten'}).status_code == 400
+        assert len(client.get('/api/reservations/user', headers=AUTH).json) == 1
+
+    def test_add_checks_space_against_parking(self, client):
+        times = {'start_timestamp': START.isoformat(), 'end_timestamp': END.isoformat()}
+        response = client.post('/api/reservations/add', headers=AUTH, json={**times, 'space_id': 'E1'})
+        assert response.status_code == 400
+
+        client.post('/api/parking', headers=AUTH, json={'space_id': 'E1', 'x': 0.1, 'y': 0.1})
+        assert client.post('/api/reservations/add', headers=AUTH, json={**times, 'space_id': 'E1'}).status_code == 201
+
+    def test_add_reports_timing_and_metrics(self, client):
+        response = client.post('/api/reservations/add', headers=AUTH, json={
+            'space_id': 'A1', 'start_timestamp': START.isoformat(), 'end_timestamp': END.isoformat()
+        })
+        stages = [metric.split(';')[0] for metric in response.headers['Server-Timing'].split(', ')]
+        assert stages == ['auth', 'firestore-read', 'firestore-write', 'encode', 'firestore-reads', 'firestore-writes', 'total']
+        assert 'firestore-writes;desc="6"' in response.headers['Server-Timing']
+
+        metrics = client.get('/metrics')
+        assert metrics.mimetype == 'text/plain'
+        text = metrics.get_data(as_text=True)
+        assert 'reserveease_request_duration_seconds_count{endpoint="/api/reservations/add",method="POST",status="201"} 1' in text
+        assert 'reserveease_firestore_documents_total{operation="write"} 6' in text
+        assert 'reserveease_token_cache_misses_total 1' in text
+
+    def test_allocate(self, client):
+        times = {'start_timestamp': START.isoformat(), 'end_timestamp': END.isoformat()}
+        first = client.post('/api/reservations/allocate', headers=AUTH, json={**times, 'x': 0.4, 'y': 0.5})
+        assert first.status_code == 201 and first.json['space_id'] == 'A1'
+        second = client.post('/api/reservations/allocate', headers=AUTH, json={**times, 'x': 0.4, 'y': 0.5})
+        assert second.json['space_id'] == 'C1'
+
+        assert client.post('/api/reservations/allocate', headers=AUTH, json={**times, 'x': 'left', 'y': 0}).status_code == 400
+        assert client.post('/api/reservations/allocate', headers=AUTH, json={**times, 'zone': 'none'}).status_code == 409
+        assert client.post('/api/reservations/allocate', json=times).status_code == 401
+
+    def test_get_pages(self, client):
+        for space_id in ('A1', 'A2', 'A3'):
+            client.post('/api/reservations/add', headers=AUTH, json={
+                'space_id': space_id, 'start_timestamp': START.isoformat(), 'end_timestamp': END.isoformat()
+            })
+
+        first = client.get('/api/reservations/get', query_string={'limit': 2, 'order_by': 'space_id', 'fields': 'space_id'}).json
+        assert first['reservations'] == [{'space_id': 'A1'}, {'space_id': 'A2'}]
+        last = client.get('/api/reservations/get', query_string={
+            'limit': 2, 'order_by': 'space_id', 'fields': 'space_id', 'page_token': first['next_page_token']
+        }).json
+        assert last == {'reservations': [{'space_id': 'A3'}], 'next_page_token': None}
+
+        assert client.get('/api/reservations/get', query_string={'limit': 'ten'}).status_code == 400
+
+    def test_get_is_cached_until_a_write(self, client):
+        query = {'space_id': 'A1', 'start_timestamp': f'>={START.isoformat()}'}
+        assert client.get('/api/reservations/get', query_string=query).json == []
+        assert client.get('/api/reservations/get', query_string=query).json == []
+        assert client.application.extensions['query_cache'].stats()['hits'] == 1
+
+        client.post('/api/reservations/add', headers=AUTH, json={
+            'space_id': 'A1', 'start_timestamp': START.isoformat(), 'end_timestamp': END.isoformat()
+        })
+        reservations = client.get('/api/reservations/get', query_string=query).json
+        assert [reservation['space_id'] for reservation in reservations] == ['A1']
+
+        client.delete(f'/api/reservations/delete/{reservations[0]["reservation_id"]}', headers=AUTH)
+        assert client.get('/api/reservations/get', query_string=query).json == []
+
+    def test_get_answers_conditional_requests(self, client):
+        query = {'space_id': 'A1'}
+        first = client.get('/api/reservations/get', query_string=query)
+        etag = first.headers['ETag']
+        not_modified = client.get('/api/reservations/get', query_string=query, headers={'If-None-Match': etag})
+        assert not_modified.status_code == 304 and not_modified.data == b''
+
+        client.post('/api/reservations/add', headers=AUTH, json={
+            'space_id': 'A1', 'start_timestamp': START.isoformat(), 'end_timestamp': END.isoformat()
+        })
+        changed = client.get('/api/reservations/get', query_string=query, headers={'If-None-Match': etag})
+        assert changed.status_code == 200 and changed.headers['ETag'] != etag
+
+        user = client.get('/api/reservations/user', headers=AUTH)
+        assert client.get('/api/reservations/user', headers={**AUTH, 'If-None-Match': user.headers['ETag']}).status_code == 304
+
+    def test_query_cache_can_be_disabled(self):
+        class NoCacheConfig(Config):
+            QUERY_CACHE_ENABLED = False
+
+        app = create_app(config=NoCacheConfig, client=MemoryFirestore())
+        assert 'query_cache' not in app.extensions
+        assert app.test_client().get('/api/reservations/get').status_code == 200
+
+    def test_export_streams_ndjson_and_csv(self, client):
+        for space_id in ('A1', 'A2'):
+            client.post('/api/reservations/add', headers=AUTH, json={
+                'space_id': space_id, 'start_timestamp': START.isoformat(), 'end_timestamp': END.isoformat()
+            })
+
+        response = client.get('/api/reservations/export', query_string={'order_by': 'space_id'})
+        assert response.is_streamed and response.mimetype == 'application/x-ndjson'
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert [line['space_id'] for line in lines] == ['A1', 'A2']
+        assert 'user_id' not in lines[0]
+
+        response = client.get('/api/reservations/export', query_string={'format': 'csv', 'fields': 'space_id,start_timestamp', 'space_id': 'A2'})
+        assert response.get_data(as_text=True).splitlines() == ['space_id,start_timestamp', f'A2,{START.isoformat()}']
+
+        assert client.get('/api/reservations/export', query_string={'format': 'xml'}).status_code == 400
+        assert client.get('/api/reservations/export', query_string={'start_timestamp': 'yesterday'}).status_code == 400
+
+    def test_requires_token(self, client):
+        assert client.get('/api/reservations/user').status_code == 401
+
+
+class TestParkingRoutes:
+    def test_parking_answers_conditional_requests(self, client):
+        response = client.get('/api/parking')
+        assert response.status_code == 200 and response.json['A1']['space_id'] == 'A1'
+        assert response.headers['ETag'] == client.get('/api/parking').headers['ETag']
+
+        not_modified = client.get('/api/parking', headers={'If-None-Match': response.headers['ETag']})
+        assert not_modified.status_code == 304 and not_modified.data == b''
+        assert client.get('/api/parking', headers={'If-None-Match': '"stale"'}).status_code == 200
+
+    def test_space_crud(self, client):
+        etag = client.get('/api/parking').headers['ETag']
+        response = client.post('/api/parking', headers=AUTH, json={'space_id': 'D1', 'x': 0.45, 'y': 0.55, 'zone': 'D'})
+        assert response.status_code == 201
+        assert client.post('/api/parking', headers=AUTH, json={'space_id': 'D1', 'x': 0, 'y': 0}).status_code == 409
+        assert client.post('/api/parking', headers=AUTH, json={'space_id': 'D2'}).status_code == 400
+
+        parking = client.get('/api/parking', headers={'If-None-Match': etag})
+        assert parking.status_code == 200 and parking.json['D1']['zone'] == 'D'
+
+        assert client.put('/api/parking/D1', headers=AUTH, json={'zone': None}).json['zone'] is None
+        assert client.get('/api/parking/D1').json == {'space_id': 'D1', 'x': 0.45, 'y': 0.55, 'zone': None}
+        assert client.delete('/api/parking/D1', headers=AUTH).status_code == 200
+        assert client.get('/api/parking/D1').status_code == 404
+
+    def test_delete_refuses_spaces_with_upcoming_reservations(self, client):
+        client.post('/api/reservations/add', headers=AUTH, json={
+            'space_id': 'A1', 'start_timestamp': START.isoformat(), 'end_timestamp': END.isoformat()
+        })
+        assert client.delete('/api/parking/A1', headers=AUTH).status_code == 409
+        assert client.delete('/api/parking/A1').status_code == 401
+
+    def test_delete_checks_reservations_made_by_other_processes(self, client):
+        # Written straight to the client, as another worker would, so this process's index never sees it
+        client.application.extensions['firestore_db'].client.load('reservations', [('elsewhere', {
+            'user_id': 'user', 'space_id': 'A2', 'start_timestamp': START, 'end_timestamp': END, 'status': 'active',
+        })])
+
+        assert client.delete('/api/parking/A2', headers=AUTH).status_code == 409
+        assert client.get('/api/parking/A2').status_code == 200
+
+
+class TestAvailabilityRoutes:
+    def test_availability_reflects_bookings(self, client):
+        client.post('/api/reservations/add', headers=AUTH, json={
+            'space_id': 'A1', 'start_timestamp': START.isoformat(), 'end_timestamp': END.isoformat()
+        })
+        query = {'date': START.date().isoformat(), 'from': '08:30', 'to': '10:30'}
+
+        availability = client.get('/api/availability', query_string=query).json
+        assert availability['spaces']['A1'] == '00111100'
+        assert availability['spaces']['A2'] == '00000000'
+
+        free = client.get('/api/availability/free', query_string={
+            'start_timestamp': START.isoformat(), 'end_timestamp': END.isoformat()
+        }).json['spaces']
+        assert 'A1' not in free and 'A2' in free
+
+        nearest = client.get('/api/availability/nearest', query_string={
+            'x': 0.4, 'y': 0.5, 'count': 2, 'start_timestamp': START.isoformat(), 'end_timestamp': END.isoformat()
+        }).json['spaces']
+        assert [space['space_id'] for space in nearest] == ['C1', 'B1']
+        assert client.get('/api/availability/nearest', query_string={
+            'x': 'nan', 'y': 0.5, 'start_timestamp': START.isoformat(), 'end_timestamp': END.isoformat()
+        }).status_code == 400
+
+    def test_stream_pushes_changes(self, client):
+        client.application.config['SSE_KEEPALIVE'] = 0.01
+        response = client.get('/api/availability/stream', query_string={'spaces': 'A1'})
+        assert response.mimetype == 'text/event-stream'
+        chunks = iter(response.response)
+        assert next(chunks) == b'retry: 1000\n\n'
+        assert next(chunks) == b': keep-alive\n\n'
+
+        for space_id in ('A2', 'A1'):
+            client.post('/api/reservations/add', headers=AUTH, json={
+                'space_id': space_id, 'start_timestamp': START.isoformat(), 'end_timestamp': END.isoformat()
+            })
+        event = next(chunks).decode()
+        assert event.startswith('id: ') and 'event: availability\n' in event
+        delta = json.loads(event.split('data: ', 1)[1])
+        assert (delta['status'], delta['space_id'], delta['slots']) == ('reserved', 'A1', [36, 4])
+
+        response.close()
+        assert client.application.extensions['availability_feed'].subscriber_count() == 0
@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+import database.reservations
+import database.spaces
+from database.firestore import init_db
+from database.memory import MemoryFirestore
+from exceptions import ClientError
+from typedef import parking_data
+
+START = (datetime.now(timezone.utc) + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+END = START + timedelta(hours=1)
+
+
+class TestSpaceCatalog:
+    def test_seeds_an_empty_collection(self, db):
+        assert database.spaces.catalog.ids()[:3] == ['A1', 'A2', 'A3']
+        assert len(database.spaces.catalog) == len(parking_data)
+        assert db.collection('spaces').document('B7').get().to_dict() == {'x': 0.6, 'y': 0.1, 'zone': None}
+
+    def test_seeds_only_once(self, db):
+        for space_id in database.spaces.catalog.ids():
+            database.spaces.delete_space(space_id)
+        database.spaces.catalog.unwatch()
+
+        database.spaces.load_spaces()
+
+        assert database.spaces.catalog.ids() == []
+        assert list(db.collection('spaces').stream()) == []
+
+    def test_loads_existing_spaces(self):
+        fake = MemoryFirestore()
+        fake.load('spaces', [('Z10', {'x': 1, 'y': 1, 'zone': 'north'}), ('Z9', {'x': 2, 'y': 2})])
+        init_db(client=fake)
+        database.spaces.load_spaces()
+        try:
+            assert database.spaces.catalog.ids() == ['Z9', 'Z10']
+            assert database.reservations.occupancy.space_ids == ['Z9', 'Z10']
+            assert database.spaces.get_space('Z10')['zone'] == 'north'
+            assert fake.collection('meta').document('spaces_seeded').get().exists
+        finally:
+            database.spaces.catalog.unwatch()
+
+    def test_create_update_delete(self, db):
+        version = database.spaces.catalog.version
+        space = database.spaces.create_space({'space_id': 'D1', 'x': 0.45, 'y': 0.5, 'zone': 'D'})
+        assert space == {'space_id': 'D1', 'x': 0.45, 'y': 0.5, 'zone': 'D'}
+        assert 'D1' in database.reservations.occupancy.space_ids
+        assert database.spaces.catalog.version > version
+
+        assert database.spaces.update_space('D1', {'y': 0.9})['y'] == 0.9
+        assert db.collection('spaces').document('D1').get().to_dict() == {'x': 0.45, 'y': 0.9, 'zone': 'D'}
+
+        database.spaces.delete_space('D1')
+        assert 'D1' not in database.spaces.catalog
+        assert not db.collection('spaces').document('D1').get().exists
+
+    @pytest.mark.parametrize('data, code', [
+        ({'space_id': 'A1', 'x': 0, 'y': 0}, 409),
+        ({'space_id': 'bad_id', 'x': 0, 'y': 0}, 400),
+        ({'space_id': 'D1', 'x': 'left', 'y': 0}, 400),
+        ({'space_id': 'D1', 'x': True, 'y': 0}, 400),
+        ({'space_id': 'D1', 'x': 0, 'y': 0, 'zone': 3}, 400),
+    ])
+    def test_create_rejects(self, db, data, code):
+        with pytest.raises(ClientError) as error:
+            database.spaces.create_space(data)
+        assert error.value.code == code
+
+    def test_missing_space(self, db):
+        for action in (lambda: database.spaces.get_space('Z1'), lambda: database.spaces.update_space('Z1', {'x': 1}), lambda: database.spaces.delete_space('Z1')):
+            with pytest.raises(ClientError) as error:
+                action()
+            assert error.value.code == 404
+
+    def test_applies_changes_of_other_processes(self, db):
+        spaces = db.collection('spaces')
+        spaces.document('E1').set({'x': 0.5, 'y': 0.5, 'zone': None})
+        spaces.document('A1').update({'zone': 'entrance'})
+        spaces.document('A2').delete()
+
+        assert database.spaces.get_space('E1')['x'] == 0.5
+        assert database.spaces.get_space('A1')['zone'] == 'entrance'
+        assert 'A2' not in database.spaces.catalog and 'A2' not in database.reservations.occupancy.space_ids
+
+
+class TestNearestFreeSpaces:
+    def test_skips_reserved_spaces(self, db):
+        nearest = database.reservations.get_nearest_free_spaces(0.4, 0.5, 3, START.isoformat(), END.isoformat())
+        assert [space['space_id'] for space in nearest] == ['A1', 'C1', 'B1']
+        assert nearest[0]['distance'] == 0
+
+        database.reservations.schedule('user', 'A1', START.isoformat(), END.isoformat())
+        nearest = database.reservations.get_nearest_free_spaces(0.4, 0.5, 2, START.isoformat(), END.isoformat())
+        assert [space['space_id'] for space in nearest] == ['C1', 'B1']
+        later = database.reservations.get_nearest_free_spaces(0.4, 0.5, 1, END.isoformat(), (END + timedelta(hours=1)).isoformat())
+        assert later[0]['space_id'] == 'A1'
+
+    def test_rejects_invalid_count(self, db):
+        with pytest.raises(ClientError):
+            database.reservations.get_nearest_free_spaces(0, 0, 0, START.isoformat(), END.isoformat())
+
+
+class TestAllocate:
+    def test_nearest_books_the_closest_free_space(self, db):
+        database.reservations.schedule('other', 'A1', START.isoformat(), END.isoformat())
+        reservation_id, space_id = database.reservations.allocate('user', START.isoformat(), END.isoformat(), x=0.4, y=0.5)
+
+        assert space_id == 'C1'
+        assert db.collection('reservations').document(reservation_id).get().get('space_id') == 'C1'
+        assert not database.reservations.occupancy.is_free('C1', START, END)
+
+    def test_best_fit_fills_gaps_first(self, db):
+        database.reservations.schedule('other', 'B2', (START - timedelta(hours=1)).isoformat(), START.isoformat())
+        database.reservations.schedule('other', 'B2', END.isoformat(), (END + timedelta(hours=1)).isoformat())
+
+        _, space_id = database.reservations.allocate('user', START.isoformat(), END.isoformat())
+        assert space_id == 'B2'
+
+    def test_zone_and_retry_on_stale_occupancy(self, db, monkeypatch):
+        database.spaces.update_space('A2', {'zone': 'north'})
+        database.spaces.update_space('A3', {'zone': 'north'})
+        # Another process booked A2 without this one knowing
+        database.reservations.schedule('other', 'A2', START.isoformat(), END.isoformat())
+        monkeypatch.setattr(database.reservations.occupancy, 'is_free', lambda *args: True)
+
+        _, space_id = database.reservations.allocate('user', START.isoformat(), END.isoformat(), x=0.6, y=0.3, zone='north')
+        assert space_id == 'A3'
+        with pytest.raises(ClientError) as error:
+            database.reservations.allocate('user', START.isoformat(), END.isoformat(), zone='north')
+        assert error.value.code == 409
+
+    @pytest.mark.parametrize('kwargs', [{'x': 0.5}, {'strategy': 'nearest'}, {'strategy': 'random'}])
+    def test_rejects_invalid_arguments(self, db, kwargs):
+        with pytest.raises(ClientError) as error:
+            database.reservations.allocate('user', START.isoformat(), END.isoformat(), **kwargs)
+        assert error.value.code == 400
@@ -0,0 +1,42 @@
+import math
+import random
+from database.spatial import GridIndex
+
+
+def brute_force(points, x, y, count, accept=lambda space_id: True):
+    return sorted((math.hypot(px - x, py - y), space_id) for space_id, (px, py) in points.items() if accept(space_id))[:count]
+
+
+class TestGridIndex:
+    def test_nearest_matches_a_full_scan(self):
+        generator = random.Random(7)
+        points = {f'S{i}': (generator.uniform(0, 10), generator.uniform(0, 10)) for i in range(2000)}
+        grid = GridIndex(cell_size=0.25)
+        for space_id, (x, y) in points.items():
+            grid.add(space_id, x, y)
+
+        odd = lambda space_id: int(space_id[1:]) % 2 == 1
+        for x, y in [(5, 5), (0, 0), (9.9, 0.1), (-30, 4), (50, 50)]:
+            assert grid.nearest(x, y, 10) == brute_force(points, x, y, 10)
+            assert grid.nearest(x, y, 10, accept=odd) == brute_force(points, x, y, 10, odd)
+
+    def test_accept_is_only_called_for_closer_spaces(self):
+        grid = GridIndex(cell_size=1)
+        for i in range(100):
+            grid.add(f'S{i}', i, 0)
+        seen = []
+        assert [space_id for _, space_id in grid.nearest(0, 0, 2, accept=lambda space_id: seen.append(space_id) or True)] == ['S0', 'S1']
+        assert len(seen) <= 4
+
+    def test_move_and_remove(self):
+        grid = GridIndex(cell_size=1)
+        grid.add('A1', 0, 0)
+        grid.add('A2', 5, 5)
+        grid.add('A1', 10, 10)
+        assert grid.nearest(9, 9, 1) == [(math.hypot(1, 1), 'A1')]
+
+        grid.remove('A1')
+        grid.remove('missing')
+        assert [space_id for _, space_id in grid.nearest(9, 9, 5)] == ['A2']
+        assert len(grid) == 1
+        assert GridIndex(cell_size=1).nearest(0, 0, 3) == []
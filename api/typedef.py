@@ -1,8 +1,17 @@
-from dataclasses import asdict, dataclass
-from typing import List, Optional
+import csv
+import io
+import itertools
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
 from datetime import datetime
+from encoding import dumps
 
-@dataclass
+# Fields of a serialized reservation, in output order
+RESERVATION_FIELDS = ("reservation_id", "user_id", "space_id", "start_timestamp", "end_timestamp")
+TIMESTAMP_FIELDS = frozenset(("start_timestamp", "end_timestamp"))
+
+
+@dataclass(slots=True)
 class Reservation:
     """
     Represents a parking reservation.
@@ -20,21 +29,79 @@ class Reservation:
     start_timestamp: datetime
     end_timestamp: datetime
     
-    def to_dict(self):
-        data = asdict(self)
-        data["start_timestamp"] = self.start_timestamp.isoformat() if self.start_timestamp else None
-        data["end_timestamp"] = self.end_timestamp.isoformat() if self.end_timestamp else None
-        return data
+    def to_dict(self, fields: Optional[Sequence[str]] = None) -> dict:
+        # Built by hand rather than with asdict(), which deep-copies every field
+        if fields is not None:
+            data = {}
+            for field in fields:
+                value = getattr(self, field)
+                data[field] = (value.isoformat() if value else None) if field in TIMESTAMP_FIELDS else value
+            return data
+        start, end = self.start_timestamp, self.end_timestamp
+        return {
+            "reservation_id": self.reservation_id,
+            "user_id": self.user_id,
+            "space_id": self.space_id,
+            "start_timestamp": start.isoformat() if start else None,
+            "end_timestamp": end.isoformat() if end else None,
+        }
+    
+    def to_public_dict(self) -> dict:
+        """Same as to_dict() without the user_id, for responses to other users."""
+        start, end = self.start_timestamp, self.end_timestamp
+        return {
+            "reservation_id": self.reservation_id,
+            "space_id": self.space_id,
+            "start_timestamp": start.isoformat() if start else None,
+            "end_timestamp": end.isoformat() if end else None,
+        }
+    
+    @staticmethod
+    def encoder(restrict_user_id: Optional[bool] = False, fields: Optional[Sequence[str]] = None):
+        """Picks the function that serializes each reservation of a response, so per-row work is a single call."""
+        if fields is not None:
+            columns = [field for field in fields if not (restrict_user_id and field == "user_id")]
+            return lambda reservation: reservation.to_dict(columns)
+        return Reservation.to_public_dict if restrict_user_id else Reservation.to_dict
     
     @staticmethod
-    def jsonify_list(reservations: List['Reservation'], restrict_user_id: Optional[bool] = False):
-        result = []
+    def jsonify_list(reservations: List['Reservation'], restrict_user_id: Optional[bool] = False, fields: Optional[List[str]] = None):
+        encode = Reservation.encoder(restrict_user_id, fields)
+        return [encode(reservation) for reservation in reservations]
+
+    @staticmethod
+    def ndjson_lines(reservations: Iterable['Reservation'], restrict_user_id: Optional[bool] = False, fields: Optional[List[str]] = None) -> Iterator[str]:
+        """Lazily encodes reservations as newline-delimited JSON, one line per reservation."""
+        encode = Reservation.encoder(restrict_user_id, fields)
         for reservation in reservations:
-            reservation_dict = reservation.to_dict()
-            if restrict_user_id:
-                reservation_dict.pop("user_id", None)  # Remove user_id if restrict_user_id is True
-            result.append(reservation_dict)
-        return result
+            yield dumps(encode(reservation)) + "\n"
+
+    @staticmethod
+    def csv_lines(reservations: Iterable['Reservation'], restrict_user_id: Optional[bool] = False, fields: Optional[List[str]] = None) -> Iterator[str]:
+        """Lazily encodes reservations as CSV, starting with a header row of the field names."""
+        columns = [field for field in (fields or RESERVATION_FIELDS) if not (restrict_user_id and field == "user_id")]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        rows = (reservation.to_dict(columns).values() for reservation in reservations)
+        for row in itertools.chain([columns], rows):
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+
+class ReservationPage(list):
+    """
+    A page of reservations, in query order.
+
+    Attributes:
+        next_page_token (str): Cursor of the following page, or None if this is the last page.
+        encoded (Tuple[bytes, str]): Response body and ETag, kept by the route so a cached page is only serialized once.
+    """
+    def __init__(self, reservations: Iterable[Reservation] = (), next_page_token: Optional[str] = None):
+        super().__init__(reservations)
+        self.next_page_token = next_page_token
+        self.encoded: Optional[Tuple[bytes, str]] = None
 
 parking_data = {
     "A1": {"x": 0.4, "y": 0.5, "space_id": "A1"},
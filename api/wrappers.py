@@ -1,10 +1,28 @@
 #decorators.py
-from flask import abort, request, g
-import traceback
-from app import app
+from flask import abort, request, g, current_app
 from typing import Callable, Dict, Tuple, Union, Any
 from functools import wraps
 from firebase_admin import auth
+from logger import get_logger
+from metrics import stage
+
+logger = get_logger(__name__)
+
+def verify_id_token(token: str) -> Dict:
+    """
+    Verifies a Firebase ID token, reusing the result for tokens verified recently.
+    When TOKEN_CHECK_REVOKED is set, every call verifies the token and checks for revocation instead.
+    
+    Args:
+        token (str): The raw ID token
+    
+    Returns:
+        Dict: The decoded token
+    """
+    with stage('auth'):
+        if current_app.config['TOKEN_CHECK_REVOKED']:
+            return auth.verify_id_token(token, check_revoked=True)
+        return current_app.extensions['token_cache'].verify(token, auth.verify_id_token)
 
 def verify_token(f: Callable) -> Callable:
     """
@@ -41,14 +59,14 @@ def verify_token(f: Callable) -> Callable:
         try:
             token = auth_header.split('Bearer ')[1]
             decoded_token:dict = None
-            if (app.config['TESTING']):
+            if (current_app.config['TESTING']):
                 try:
-                    decoded_token = auth.verify_id_token(token)
+                    decoded_token = verify_id_token(token)
                 except:
                     decoded_token = {}
                     decoded_token['uid'] = 'test_user_id'
             else:
-                decoded_token = auth.verify_id_token(token)  
+                decoded_token = verify_id_token(token)
               
             g.user = decoded_token
             g.user_id = decoded_token['uid']
@@ -63,7 +81,7 @@ def verify_token(f: Callable) -> Callable:
             abort(401, description='Invalid token')
             
         except Exception as e:
-            traceback.print_exc()
+            logger.exception("Unhandled error")
             abort(500, description=str(e))
 
     return decorated
\ No newline at end of file